@@ -0,0 +1,158 @@
+"""
+Cuántas consultas SQL y cuánto tiempo de base de datos usa cada petición.
+
+medir_consultas() instala un execute_wrapper en todas las conexiones del hilo
+(primaria y réplicas) mientras dura el bloque: no depende de DEBUG ni guarda
+el SQL de cada consulta, solo el total y las CONSULTAS_LENTAS más lentas.
+
+PresupuestoConsultasMiddleware mide cada petición. A los usuarios staff les
+devuelve la medición en la cabecera Server-Timing (se ve en la pestaña de red
+del navegador) si la petición ya cargó el usuario, como hace el admin: no
+suma la sesión y el usuario a las consultas de la API pública. Registra
+en el log las lecturas (GET y HEAD; las escrituras crecen con lo que se
+guarda) que superan el presupuesto de la primera expresión de
+CONSULTAS_PRESUPUESTOS que coincide con la ruta.
+"""
+import heapq
+import logging
+import re
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connections
+from django.utils.functional import empty
+
+logger = logging.getLogger(__name__)
+
+# Caracteres de SQL que se guardan de cada consulta lenta
+LARGO_SQL = 200
+
+
+@dataclass
+class MedicionConsultas:
+    consultas: int = 0
+    segundos: float = 0.0
+    # (segundos, alias, sql), de la más lenta a la más rápida
+    lentas: list = field(default_factory=list)
+
+    @property
+    def ms(self):
+        return self.segundos * 1000
+
+    def resumen(self):
+        return f"{self.consultas} consultas, {self.ms:.1f} ms en BD"
+
+    def detalle(self):
+        """El resumen y las consultas más lentas, una por línea"""
+        lineas = [self.resumen()]
+        lineas += [f"  {segundos * 1000:.1f} ms [{alias}] {sql}" for segundos, alias, sql in self.lentas]
+        return "\n".join(lineas)
+
+
+class _Medidor:
+    def __init__(self, medicion, alias, maximo):
+        self.medicion = medicion
+        self.alias = alias
+        self.maximo = maximo
+        # Montículo de (segundos, orden, sql) con las `maximo` más lentas
+        self.lentas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            segundos = time.perf_counter() - inicio
+            self.medicion.consultas += 1
+            self.medicion.segundos += segundos
+            if self.maximo:
+                consulta = (segundos, self.medicion.consultas, sql)
+                if len(self.lentas) < self.maximo:
+                    heapq.heappush(self.lentas, consulta)
+                elif segundos > self.lentas[0][0]:
+                    heapq.heapreplace(self.lentas, consulta)
+
+
+@contextmanager
+def medir_consultas(lentas=None):
+    """
+    Mide las consultas de todas las bases durante el bloque; la medición se
+    completa al salir.
+    """
+    maximo = settings.CONSULTAS_LENTAS if lentas is None else lentas
+    medicion = MedicionConsultas()
+    medidores = []
+    with ExitStack() as pila:
+        for conexion in connections.all():
+            medidor = _Medidor(medicion, conexion.alias, maximo)
+            pila.enter_context(conexion.execute_wrapper(medidor))
+            medidores.append(medidor)
+        try:
+            yield medicion
+        finally:
+            lentas = [
+                (segundos, medidor.alias, " ".join(str(sql).split())[:LARGO_SQL])
+                for medidor in medidores
+                for segundos, _, sql in medidor.lentas
+            ]
+            medicion.lentas = sorted(lentas, key=lambda lenta: lenta[0], reverse=True)[:maximo]
+
+
+def presupuesto_para(ruta):
+    """{"consultas": n, "ms": n} de la primera expresión de CONSULTAS_PRESUPUESTOS que coincide, o None"""
+    # re guarda compiladas las expresiones recientes
+    for patron, presupuesto in settings.CONSULTAS_PRESUPUESTOS:
+        if re.search(patron, ruta):
+            return presupuesto
+    return None
+
+
+def excesos(medicion, presupuesto):
+    """Textos de lo que `medicion` supera de `presupuesto`; vacío si cumple"""
+    textos = []
+    if presupuesto.get("consultas") is not None and medicion.consultas > presupuesto["consultas"]:
+        textos.append(f"{medicion.consultas} consultas (presupuesto {presupuesto['consultas']})")
+    if presupuesto.get("ms") is not None and medicion.ms > presupuesto["ms"]:
+        textos.append(f"{medicion.ms:.1f} ms en BD (presupuesto {presupuesto['ms']})")
+    return textos
+
+
+def _descripcion(texto):
+    # Server-Timing: desc es un quoted-string
+    return texto.replace("\\", "").replace('"', "'")
+
+
+def server_timing(medicion, total):
+    """Valor de la cabecera Server-Timing"""
+    metricas = [
+        f'db;dur={medicion.ms:.2f};desc="{medicion.consultas} consultas"',
+        f"total;dur={total * 1000:.2f}",
+    ]
+    for numero, (segundos, alias, sql) in enumerate(medicion.lentas, start=1):
+        metricas.append(f'sql{numero};dur={segundos * 1000:.2f};desc="{_descripcion(f"[{alias}] {sql}")}"')
+    return ", ".join(metricas)
+
+
+class PresupuestoConsultasMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        with medir_consultas() as medicion:
+            response = self.get_response(request)
+        total = time.perf_counter() - inicio
+        presupuesto = presupuesto_para(request.path) if request.method in ("GET", "HEAD") else None
+        if presupuesto:
+            superado = excesos(medicion, presupuesto)
+            if superado:
+                logger.warning(
+                    "%s %s supera su presupuesto: %s\n%s",
+                    request.method, request.path, "; ".join(superado), medicion.detalle(),
+                )
+        usuario = getattr(request, "user", None)
+        if getattr(usuario, "_wrapped", None) is not empty and getattr(usuario, "is_staff", False):
+            response["Server-Timing"] = server_timing(medicion, total)
+        return response
@@ -0,0 +1,6 @@
+"""
+Backend de MySQL (PyMySQL) con un pool de conexiones por proceso.
+
+ENGINE "core.mysql_pool" en DATABASES, con las opciones del pool en la clave
+"POOL" (ver core/settings.py y DB_POOL en .env.example).
+"""
@@ -0,0 +1,47 @@
+"""
+DatabaseWrapper de MySQL que pide las conexiones al pool del proceso.
+
+Django abre la conexión al primer uso de cada hilo y la cierra al terminar
+la petición (CONN_MAX_AGE=0), tanto con WSGI como con ASGI (las vistas y el
+ORM corren en hilos del mismo proceso). Aquí abrir es sacar una conexión del
+pool y cerrar es devolverla, así que el handshake TCP/TLS y la autenticación
+se pagan una vez por conexión y no una vez por petición. Una conexión que se
+cierra con una transacción a medias o después de un error no vuelve al pool.
+"""
+from functools import partial
+
+from django.db.backends.mysql import base as mysql
+from django.utils.asyncio import async_unsafe
+
+from .pool import PoolAgotado, pool_de
+
+
+def _ping(conexion):
+    conexion.ping(reconnect=False)
+
+
+class DatabaseWrapper(mysql.DatabaseWrapper):
+    # Pool del que salió la conexión actual (None si se abrió sin pool)
+    pool = None
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        opciones = self.settings_dict.get("POOL") or {}
+        if not opciones.get("ACTIVO", True):
+            self.pool = None
+            return super().get_new_connection(conn_params)
+        # Todos los hilos abren con los mismos parámetros: el pool usa los del primero
+        self.pool = pool_de(
+            self.alias, opciones, partial(super().get_new_connection, conn_params), verificar=_ping,
+        )
+        try:
+            return self.pool.obtener()
+        except PoolAgotado as error:
+            raise mysql.Database.OperationalError(str(error)) from error
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        descartar = self.in_atomic_block or not self.autocommit or self.errors_occurred
+        with self.wrap_database_errors:
+            self.pool.devolver(self.connection, descartar=descartar)
@@ -0,0 +1,192 @@
+"""
+Pool de conexiones de un proceso, independiente del driver.
+
+Las conexiones libres se guardan con la hora en que se devolvieron. Al pedir
+una se usa la última devuelta (la más caliente), se verifica con un ping si
+llevaba más de `ping` segundos libre y, si falla, se descarta y se prueba con
+otra. Las que pasan más de `inactividad` segundos libres se cierran. Con
+`maximo` conexiones abiertas, los pedidos esperan hasta `espera` segundos a
+que se devuelva una.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+METRICAS = (
+    "creadas",
+    "reutilizadas",
+    "devueltas",
+    "descartadas",
+    "fallos_ping",
+    "expiradas",
+    "esperas",
+    "agotado",
+)
+
+
+class PoolAgotado(Exception):
+    """Nadie devolvió una conexión dentro del tiempo de espera"""
+
+
+def _cerrar(conexion):
+    try:
+        conexion.close()
+    except Exception:
+        pass
+
+
+class PoolConexiones:
+    def __init__(self, conectar, verificar, maximo=10, inactividad=300, ping=0, espera=10):
+        self.conectar = conectar
+        self.verificar = verificar
+        self.maximo = maximo
+        self.inactividad = inactividad
+        self.ping = ping
+        self.espera = espera
+        # (conexión, devuelta): las más viejas a la izquierda
+        self._libres = deque()
+        self._abiertas = 0
+        self._condicion = threading.Condition()
+        self._metricas = dict.fromkeys(METRICAS, 0)
+        self._espera_total = 0.0
+
+    def obtener(self):
+        """Una conexión libre y sana, o una nueva si hay cupo"""
+        inicio = time.monotonic()
+        while True:
+            conexion, devuelta = self._reservar(inicio)
+            if conexion is None:
+                try:
+                    conexion = self.conectar()
+                except BaseException:
+                    self._liberar_cupo()
+                    raise
+                self._sumar("creadas")
+                return conexion
+            if self._sana(conexion, devuelta):
+                self._sumar("reutilizadas")
+                return conexion
+            self._sumar("fallos_ping")
+            _cerrar(conexion)
+            self._liberar_cupo()
+
+    def devolver(self, conexion, descartar=False):
+        """La deja libre para el próximo pedido, o la cierra con `descartar`"""
+        if descartar:
+            self._sumar("descartadas")
+            _cerrar(conexion)
+            self._liberar_cupo()
+            return
+        with self._condicion:
+            self._libres.append((conexion, time.monotonic()))
+            self._metricas["devueltas"] += 1
+            self._condicion.notify()
+
+    def vaciar(self):
+        """Cierra las conexiones libres"""
+        with self._condicion:
+            libres, self._libres = self._libres, deque()
+            self._abiertas -= len(libres)
+            self._condicion.notify_all()
+        for conexion, _ in libres:
+            _cerrar(conexion)
+
+    def estadisticas(self):
+        with self._condicion:
+            libres = len(self._libres)
+            return {
+                **self._metricas,
+                "abiertas": self._abiertas,
+                "libres": libres,
+                "en_uso": self._abiertas - libres,
+                "maximo": self.maximo,
+                "espera_ms": round(self._espera_total * 1000, 2),
+            }
+
+    def _reservar(self, inicio):
+        """(conexión libre, devuelta), o (None, None) si se reservó cupo para una nueva"""
+        reservada, vencidas = None, []
+        with self._condicion:
+            esperando = False
+            while True:
+                vencidas += self._expirar()
+                if self._libres:
+                    reservada = self._libres.pop()
+                    break
+                if self._abiertas < self.maximo:
+                    self._abiertas += 1
+                    reservada = (None, None)
+                    break
+                if not esperando:
+                    esperando = True
+                    self._metricas["esperas"] += 1
+                restante = self.espera - (time.monotonic() - inicio)
+                if restante <= 0:
+                    self._metricas["agotado"] += 1
+                    break
+                self._condicion.wait(restante)
+            if esperando:
+                self._espera_total += time.monotonic() - inicio
+        for conexion in vencidas:
+            _cerrar(conexion)
+        if reservada is None:
+            raise PoolAgotado(f"Las {self.maximo} conexiones del pool siguen en uso tras {self.espera} s")
+        return reservada
+
+    def _expirar(self):
+        """Saca las libres con más de `inactividad` segundos (se cierran fuera del candado)"""
+        limite = time.monotonic() - self.inactividad
+        vencidas = []
+        while self._libres and self._libres[0][1] < limite:
+            vencidas.append(self._libres.popleft()[0])
+        self._abiertas -= len(vencidas)
+        self._metricas["expiradas"] += len(vencidas)
+        return vencidas
+
+    def _sana(self, conexion, devuelta):
+        if time.monotonic() - devuelta < self.ping:
+            return True
+        try:
+            self.verificar(conexion)
+        except Exception:
+            return False
+        return True
+
+    def _liberar_cupo(self):
+        with self._condicion:
+            self._abiertas -= 1
+            self._condicion.notify()
+
+    def _sumar(self, metrica):
+        with self._condicion:
+            self._metricas[metrica] += 1
+
+
+# alias -> (pid, PoolConexiones): un proceso hijo de un fork no usa el pool del padre
+_pools = {}
+_candado = threading.Lock()
+
+
+def pool_de(alias, opciones, conectar, verificar):
+    """El pool del alias en este proceso, creado con `opciones` (la clave POOL) la primera vez"""
+    with _candado:
+        pid, pool = _pools.get(alias, (None, None))
+        if pid != os.getpid():
+            pool = PoolConexiones(
+                conectar,
+                verificar,
+                maximo=opciones.get("MAXIMO", 10),
+                inactividad=opciones.get("INACTIVIDAD", 300),
+                ping=opciones.get("PING", 0),
+                espera=opciones.get("ESPERA", 10),
+            )
+            _pools[alias] = (os.getpid(), pool)
+        return pool
+
+
+def estadisticas_pools():
+    """{alias: métricas} de los pools de este proceso"""
+    with _candado:
+        pools = [(alias, pool) for alias, (pid, pool) in _pools.items() if pid == os.getpid()]
+    return {alias: pool.estadisticas() for alias, pool in pools}
@@ -0,0 +1,14 @@
+import os
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .pool import estadisticas_pools
+
+
+@require_GET
+@staff_member_required
+def pool_estadisticas(request):
+    """Conexiones abiertas, libres y en uso, y contadores de los pools de este proceso (solo staff)"""
+    return JsonResponse({"pid": os.getpid(), "pools": estadisticas_pools()})
@@ -0,0 +1,28 @@
+from django.conf import settings
+
+from core.consultas import excesos, medir_consultas, presupuesto_para
+
+
+class PresupuestoConsultasMixin:
+    """
+    Para TestCase: assertPresupuestoConsultas(url) pide la URL con self.client
+    y falla si usa más consultas que su presupuesto, mostrando las más lentas.
+    """
+
+    def assertPresupuestoConsultas(self, url, consultas=None, ms=None, metodo="get", estado=200, **kwargs):
+        """
+        Sin `consultas` ni `ms` usa el presupuesto de CONSULTAS_PRESUPUESTOS
+        para la ruta, solo en consultas: el tiempo en las pruebas no dice mucho.
+        Devuelve (respuesta, medición).
+        """
+        if consultas is None and ms is None:
+            consultas = (presupuesto_para(url.split("?")[0]) or {}).get("consultas")
+            if consultas is None:
+                self.fail(f"{url} no tiene presupuesto en CONSULTAS_PRESUPUESTOS")
+        with medir_consultas(lentas=settings.CONSULTAS_LENTAS or 5) as medicion:
+            respuesta = getattr(self.client, metodo)(url, **kwargs)
+        self.assertEqual(respuesta.status_code, estado)
+        superado = excesos(medicion, {"consultas": consultas, "ms": ms})
+        if superado:
+            self.fail(f"{url} supera su presupuesto: {'; '.join(superado)}\n{medicion.detalle()}")
+        return respuesta, medicion
@@ -0,0 +1,179 @@
+"""
+Lecturas de la API pública en réplicas de solo lectura (DB_REPLICAS).
+
+ReplicasMiddleware marca las peticiones GET/HEAD de DB_REPLICA_RUTAS y
+RouterReplicas manda sus lecturas a una réplica al azar entre las que están
+al día. Todo lo demás (el admin, la sincronización, los comandos, cualquier
+escritura) va a la primaria.
+
+Una petición que escribe lee de la primaria desde ese momento y deja una
+cookie para que las siguientes del mismo navegador también lo hagan durante
+DB_REPLICA_PEGAJOSO_SEGUNDOS: quien edita en el admin ve su cambio en la API
+aunque la réplica aún no lo tenga.
+
+El retraso de cada réplica se mide con la columna de REPLICAS_MARCA (la
+fecha_actualizacion de inmuebles, con índice): es el tiempo desde la
+escritura más vieja de la primaria que la réplica todavía no tiene. Cada
+proceso lo revisa como mucho cada DB_REPLICA_REVISION_SEGUNDOS; las réplicas
+con más de DB_REPLICA_RETRASO_MAXIMO segundos, o que no responden, quedan
+fuera hasta la próxima revisión, y sin ninguna se lee de la primaria.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.models import Max
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+COOKIE = "db_primaria"
+
+
+@dataclass
+class EstadoPeticion:
+    replicas: bool = False
+    escribio: bool = False
+
+
+_estado = contextvars.ContextVar("estado_replicas", default=None)
+
+_disponibles = []
+_revisado = None
+# Un hilo está midiendo el retraso
+_revisando = False
+_candado = threading.Lock()
+
+
+def _marca():
+    etiqueta, campo = settings.REPLICAS_MARCA
+    return apps.get_model(etiqueta), campo
+
+
+def retraso_desde(ultima, alias=DEFAULT_DB_ALIAS):
+    """
+    Segundos desde la escritura más vieja de `alias` posterior a `ultima`
+    (la última que tiene la réplica); 0 si no hay ninguna.
+    """
+    modelo, campo = _marca()
+    pendientes = modelo._default_manager.using(alias).exclude(**{f"{campo}__isnull": True})
+    if ultima is not None:
+        pendientes = pendientes.filter(**{f"{campo}__gt": ultima})
+    faltante = pendientes.order_by(campo).values_list(campo, flat=True).first()
+    if faltante is None:
+        return 0.0
+    if timezone.is_naive(faltante):
+        faltante = timezone.make_aware(faltante)
+    return max(0.0, (timezone.now() - faltante).total_seconds())
+
+
+def retraso_replica(alias):
+    """Retraso de la réplica `alias` respecto de la primaria, en segundos (dos consultas)"""
+    modelo, campo = _marca()
+    ultima = modelo._default_manager.using(alias).aggregate(ultima=Max(campo))["ultima"]
+    return retraso_desde(ultima)
+
+
+def _medir():
+    disponibles = []
+    for alias in settings.DB_REPLICA_ALIAS:
+        try:
+            retraso = retraso_replica(alias)
+        except DatabaseError:
+            logger.warning("La réplica %s no responde; se lee de la primaria", alias, exc_info=True)
+            continue
+        if retraso <= settings.DB_REPLICA_RETRASO_MAXIMO:
+            disponibles.append(alias)
+        else:
+            logger.warning("La réplica %s lleva %.1f s de retraso; se deja fuera", alias, retraso)
+    return disponibles
+
+
+def replicas_disponibles():
+    """
+    Las réplicas al día, revisadas como mucho cada DB_REPLICA_REVISION_SEGUNDOS.
+    Un solo hilo mide, fuera del candado; los demás usan la revisión anterior
+    mientras tanto (en la primera, ninguna: leen de la primaria).
+    """
+    global _disponibles, _revisado, _revisando
+    with _candado:
+        vigente = _revisado is not None and time.monotonic() - _revisado < settings.DB_REPLICA_REVISION_SEGUNDOS
+        if vigente or _revisando:
+            return _disponibles
+        _revisando = True
+    disponibles = None
+    try:
+        disponibles = _medir()
+    finally:
+        with _candado:
+            _revisando = False
+            if disponibles is not None:
+                _disponibles, _revisado = disponibles, time.monotonic()
+    return disponibles
+
+
+def invalidar_revision():
+    """La próxima lectura vuelve a medir el retraso de las réplicas"""
+    global _revisado
+    with _candado:
+        _revisado = None
+
+
+class RouterReplicas:
+    def db_for_read(self, model, **hints):
+        estado = _estado.get()
+        if estado is None or not estado.replicas or estado.escribio:
+            return None
+        # Dentro de una transacción se lee lo que la transacción ve
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        disponibles = replicas_disponibles()
+        return random.choice(disponibles) if disponibles else None
+
+    def db_for_write(self, model, **hints):
+        estado = _estado.get()
+        if estado is not None:
+            estado.escribio = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Las réplicas tienen los mismos datos que la primaria
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicasMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        estado = EstadoPeticion(replicas=self.usa_replicas(request))
+        token = _estado.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            _estado.reset(token)
+        if estado.escribio:
+            segundos = settings.DB_REPLICA_PEGAJOSO_SEGUNDOS
+            response.set_cookie(
+                COOKIE, str(int(time.time() + segundos)), max_age=segundos, httponly=True, samesite="Lax",
+            )
+        return response
+
+    def usa_replicas(self, request):
+        if request.method not in ("GET", "HEAD"):
+            return False
+        if not request.path.startswith(tuple(settings.DB_REPLICA_RUTAS)):
+            return False
+        try:
+            return int(request.COOKIES.get(COOKIE, 0)) < time.time()
+        except ValueError:
+            return True
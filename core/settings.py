@@ -40,6 +40,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.consultas.PresupuestoConsultasMiddleware",  # Consultas por petición (Server-Timing para staff)
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",  # Middleware de localización
@@ -88,6 +89,72 @@ DATABASES = {
     }
 }
 
+# DB_POOL=True reutiliza las conexiones a MySQL entre peticiones con un pool
+# por proceso (core/mysql_pool): hasta DB_POOL_MAXIMO conexiones, cerradas tras
+# DB_POOL_INACTIVIDAD segundos libres y verificadas con un ping al sacarlas si
+# llevaban más de DB_POOL_PING segundos libres. Con el pool, CONN_MAX_AGE
+# debe quedar en 0: cerrar la conexión al final de la petición la devuelve.
+if os.getenv("DB_POOL", "False") == "True":
+    DATABASES["default"]["ENGINE"] = "core.mysql_pool"
+    DATABASES["default"]["POOL"] = {
+        "MAXIMO": int(os.getenv("DB_POOL_MAXIMO", "10")),
+        "INACTIVIDAD": float(os.getenv("DB_POOL_INACTIVIDAD", "300")),
+        "PING": float(os.getenv("DB_POOL_PING", "0")),
+        "ESPERA": float(os.getenv("DB_POOL_ESPERA", "10")),
+    }
+
+# DB_ENGINE=sqlite permite correr las pruebas sin un servidor MySQL
+if os.getenv("DB_ENGINE", "mysql") == "sqlite":
+    DATABASES["default"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / os.getenv("DB_NAME", "db.sqlite3"),
+    }
+    # SQLite no soporta db_comment en columnas
+    SILENCED_SYSTEM_CHECKS = ["fields.W163"]
+
+# DB_REPLICAS: réplicas de solo lectura para las lecturas de la API pública
+# (core/replicas.py), separadas por comas: host[:puerto] con MySQL o un
+# archivo con SQLite. Cada una copia la configuración de "default" con el
+# alias replica_1, replica_2...; en las pruebas son espejo de "default".
+DB_REPLICAS = [replica.strip() for replica in os.getenv("DB_REPLICAS", "").split(",") if replica.strip()]
+DB_REPLICA_ALIAS = []
+for numero, replica in enumerate(DB_REPLICAS, start=1):
+    configuracion = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+    if configuracion["ENGINE"] == "django.db.backends.sqlite3":
+        configuracion["NAME"] = BASE_DIR / replica
+    else:
+        configuracion["HOST"], _, puerto = replica.partition(":")
+        configuracion["PORT"] = puerto or configuracion["PORT"]
+    DATABASES[f"replica_{numero}"] = configuracion
+    DB_REPLICA_ALIAS.append(f"replica_{numero}")
+if DB_REPLICA_ALIAS:
+    DATABASE_ROUTERS = ["core.replicas.RouterReplicas"]
+    MIDDLEWARE.insert(0, "core.replicas.ReplicasMiddleware")
+# Rutas que leen de las réplicas (solo GET y HEAD)
+DB_REPLICA_RUTAS = os.getenv("DB_REPLICA_RUTAS", "/api/").split(",")
+# Las réplicas con más retraso que esto (medido cada DB_REPLICA_REVISION_SEGUNDOS)
+# quedan fuera; tras escribir, el navegador lee de la primaria DB_REPLICA_PEGAJOSO_SEGUNDOS
+DB_REPLICA_RETRASO_MAXIMO = float(os.getenv("DB_REPLICA_RETRASO_MAXIMO", "5"))
+DB_REPLICA_REVISION_SEGUNDOS = float(os.getenv("DB_REPLICA_REVISION_SEGUNDOS", "10"))
+DB_REPLICA_PEGAJOSO_SEGUNDOS = int(os.getenv("DB_REPLICA_PEGAJOSO_SEGUNDOS", "30"))
+# Modelo y columna con los que se mide el retraso de las réplicas
+REPLICAS_MARCA = ("inmobiliaria.Inmuebles", "fecha_actualizacion")
+
+# Presupuesto de consultas por petición (core/consultas.py): la primera
+# expresión que coincide con la ruta manda; las lecturas (GET) que superan
+# "consultas" o "ms" (tiempo en la base) se registran en el log con las
+# CONSULTAS_LENTAS más lentas. Las pruebas del admin usan los mismos números.
+CONSULTAS_PRESUPUESTOS = [
+    (r"^/admin/inmobiliaria/[^/]+/$", {"consultas": 15, "ms": 500}),  # Listados
+    (r"^/admin/inmobiliaria/[^/]+/[^/]+/change/$", {"consultas": 15, "ms": 500}),  # Formularios
+    (r"^/admin/", {"consultas": 20, "ms": 500}),
+    (r"^/api/", {"consultas": 10, "ms": 200}),
+]
+CONSULTAS_LENTAS = int(os.getenv("CONSULTAS_LENTAS", "3"))
+
+# Las tablas legadas son managed=False; el runner las crea en la BD de pruebas
+TEST_RUNNER = "core.test_runner.UnManagedModelTestRunner"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -131,6 +198,63 @@ STATIC_URL = "static/"
 MEDIA_URL = os.getenv("MEDIA_URL", "/media/")
 MEDIA_ROOT = os.path.join(BASE_DIR, os.getenv("MEDIA_ROOT", "media"))
 
+# Conteo aproximado en los listados grandes del admin (Inmuebles, Imágenes)
+ADMIN_CONTEO_APROXIMADO = os.getenv("ADMIN_CONTEO_APROXIMADO", "False") == "True"
+ADMIN_CONTEO_LIMITE = int(os.getenv("ADMIN_CONTEO_LIMITE", "1000"))
+ADMIN_CONTEO_TIMEOUT_MS = int(os.getenv("ADMIN_CONTEO_TIMEOUT_MS", "200"))
+
+# Segundos que se guardan los conteos de los filtros laterales del admin
+FACETAS_CACHE_SEGUNDOS = int(os.getenv("FACETAS_CACHE_SEGUNDOS", "300"))
+# Cada cuánto relee cada proceso la versión de las facetas (versiones_cache):
+# lo más que tarda en ver una escritura hecha en otro proceso
+FACETAS_VERSION_SEGUNDOS = float(os.getenv("FACETAS_VERSION_SEGUNDOS", "1"))
+
+# Segundos tras los que cada proceso reconstruye su índice de etiquetas
+# (cubre escrituras en inmuebles_etiquetas hechas por fuera de Django)
+ETIQUETAS_INDICE_SEGUNDOS = int(os.getenv("ETIQUETAS_INDICE_SEGUNDOS", "300"))
+
+# Listado de la API filtrado sobre la copia en columnas de cada proceso
+# (inmobiliaria/columnas.py): se pone al día con los cambios cada
+# COLUMNAS_REFRESCO_SEGUNDOS y se reconstruye cada COLUMNAS_RECONSTRUIR_SEGUNDOS
+LISTADO_COLUMNAR = os.getenv("LISTADO_COLUMNAR", "False") == "True"
+COLUMNAS_REFRESCO_SEGUNDOS = float(os.getenv("COLUMNAS_REFRESCO_SEGUNDOS", "2"))
+COLUMNAS_RECONSTRUIR_SEGUNDOS = int(os.getenv("COLUMNAS_RECONSTRUIR_SEGUNDOS", "900"))
+# Cada puesta al día relee también lo cambiado en los COLUMNAS_SOLAPE_SEGUNDOS
+# antes de la marca: la sincronización fecha un lote antes de confirmarlo
+COLUMNAS_SOLAPE_SEGUNDOS = int(os.getenv("COLUMNAS_SOLAPE_SEGUNDOS", "60"))
+
+# Cachés de un solo servidor: "locmem" (memoria de cada proceso) o "file"
+# (archivos en CACHE_DIR, compartidos por todos los procesos del servidor).
+# La caché "inmuebles" guarda el JSON del detalle de cada inmueble.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+CACHE_DIR = os.path.join(BASE_DIR, os.getenv("CACHE_DIR", "cache"))
+INMUEBLES_CACHE_SEGUNDOS = int(os.getenv("INMUEBLES_CACHE_SEGUNDOS", "3600"))
+INMUEBLES_CACHE_ENTRADAS = int(os.getenv("INMUEBLES_CACHE_ENTRADAS", "5000"))
+
+
+def _cache(nombre, **opciones):
+    if CACHE_BACKEND == "file":
+        return {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.path.join(CACHE_DIR, nombre),
+            "OPTIONS": opciones,
+        }
+    return {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": nombre,
+        "OPTIONS": opciones,
+    }
+
+
+CACHES = {
+    "default": _cache("default"),
+    "inmuebles": _cache("inmuebles", MAX_ENTRIES=INMUEBLES_CACHE_ENTRADAS),
+}
+
+# Motor de búsqueda de inmuebles: "auto" (FULLTEXT en MySQL, respaldo en otras
+# bases) o la ruta a una clase de inmobiliaria.search
+BUSQUEDA_MOTOR = os.getenv("BUSQUEDA_MOTOR", "auto")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,32 @@
+from django.apps import apps
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class UnManagedModelTestRunner(DiscoverRunner):
+    """
+    Runner de pruebas que crea las tablas de los modelos managed=False.
+
+    La mayoría de las tablas de inmobiliaria vienen de una base de datos
+    existente, así que las migraciones no las crean. Durante las pruebas se
+    marcan como administradas y se generan directamente desde los modelos.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        self._unmanaged_models = [
+            model for model in apps.get_models() if not model._meta.managed
+        ]
+        for model in self._unmanaged_models:
+            model._meta.managed = True
+        self._migration_modules = settings.MIGRATION_MODULES
+        settings.MIGRATION_MODULES = {
+            **self._migration_modules,
+            "inmobiliaria": None,
+        }
+        super().setup_test_environment(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        super().teardown_test_environment(**kwargs)
+        settings.MIGRATION_MODULES = self._migration_modules
+        for model in self._unmanaged_models:
+            model._meta.managed = False
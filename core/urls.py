@@ -3,9 +3,13 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.mysql_pool.views import pool_estadisticas
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('tinymce/', include('tinymce.urls')),
+    path('api/db/pool/', pool_estadisticas, name='pool_estadisticas'),
+    path('api/', include('inmobiliaria.urls')),
 ]
 
 # Servir archivos media en desarrollo
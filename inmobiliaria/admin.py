@@ -1,10 +1,23 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.admin import AdminSite
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.admin import UserAdmin, GroupAdmin
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
-from .forms import EtiquetasForm, InmueblesForm
+from django.utils import timezone
+from .forms import (
+    AutocompleteSelectPrecargado,
+    EtiquetasForm,
+    InmueblesForm,
+    RelacionesPrecargadasFormSet,
+)
+from .estados import CAMPOS_ESTADO, capturar_estados
+from .facets import invalidar_facetas
+from .filters import BarrioPorCiudadListFilter, FacetaCacheadaListFilter
+from .mapa import actualizar_celdas
+from .paginators import ConteoAproximadoPaginator
+from .search import filtros_prefijos
 from .models import (
     Assesor, 
     City, 
@@ -29,6 +42,22 @@ def formatear_moneda(campo, etiqueta):
     _metodo.__name__ = f'{campo}_formateado'
     return _metodo
 
+class RelacionesAdminMixin:
+    """Carga en lote las relaciones que declara con_relaciones() del QuerySet"""
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).con_relaciones()
+
+class ConteoAproximadoAdminMixin:
+    """Listado sin COUNT(*) exacto cuando ADMIN_CONTEO_APROXIMADO está activo"""
+    
+    paginator = ConteoAproximadoPaginator
+    
+    @property
+    def show_full_result_count(self):
+        # El total sin filtros sería un segundo COUNT(*) sobre toda la tabla
+        return not settings.ADMIN_CONTEO_APROXIMADO
+
 # Personalización del admin predeterminado
 admin.site.site_header = "AHOInmobiliaria Administración"
 admin.site.site_title = "AHOInmobiliaria Admin"
@@ -43,8 +72,9 @@ class InmobiliariaAdminSite(AdminSite):
 # admin_site = InmobiliariaAdminSite(name='inmobiliaria_admin')
 
 # Inline para InmuebleCaracteristicas
-class InmuebleCaracteristicasInline(admin.TabularInline):
+class InmuebleCaracteristicasInline(RelacionesAdminMixin, admin.TabularInline):
     model = InmuebleCaracteristicas
+    formset = RelacionesPrecargadasFormSet
     extra = 1
     autocomplete_fields = ['caracteristica']
     
@@ -53,9 +83,17 @@ class InmuebleCaracteristicasInline(admin.TabularInline):
     
     # Evitar campos que puedan causar problemas
     exclude = ['created_at', 'updated_at']
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        """La característica seleccionada sale del select_related del inline"""
+        if db_field.name == 'caracteristica':
+            kwargs['widget'] = AutocompleteSelectPrecargado(
+                db_field, self.admin_site, using=kwargs.get('using')
+            )
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 # Inline para Galería de Imágenes
-class ImagenesInline(admin.TabularInline):
+class ImagenesInline(RelacionesAdminMixin, admin.TabularInline):
     model = Imagenes
     extra = 1
     
@@ -75,7 +113,7 @@ class ImagenesInline(admin.TabularInline):
                 'cursor: pointer; transition: transform 0.2s;" '
                 'onmouseover="this.style.transform=\'scale(1.05)\'" '
                 'onmouseout="this.style.transform=\'scale(1)\'" /></a>',
-                obj.url, obj.url
+                obj.url, obj.get_miniatura_url('mediana')
             )
         return format_html(
             '<div style="width: 100px; height: 80px; background-color: #f0f0f0; '
@@ -182,7 +220,7 @@ class AsesoresAdmin(admin.ModelAdmin):
         if obj.foto:
             return format_html(
                 '<img src="{}" width="50" height="50" style="border-radius: 50%; object-fit: cover;" />',
-                obj.foto.url
+                obj.get_foto_url('lista')
             )
         return "Sin foto"
     
@@ -194,7 +232,7 @@ class AsesoresAdmin(admin.ModelAdmin):
             return format_html(
                 '<img src="{}" width="150" height="150" style="border-radius: 10px; object-fit: cover;" /><br/>'
                 '<small>Archivo: {}</small>',
-                obj.foto.url,
+                obj.get_foto_url('detalle'),
                 obj.foto.name
             )
         return "Sin foto"
@@ -434,11 +472,18 @@ class UsosInmuebleAdmin(admin.ModelAdmin):
     ) 
     
 @admin.register(Inmuebles)
-class InmueblesAdmin(admin.ModelAdmin):
+class InmueblesAdmin(RelacionesAdminMixin, ConteoAproximadoAdminMixin, admin.ModelAdmin):
     form = InmueblesForm
     list_display = ('cod_syn', 'imagen_principal', 'ref','slug', 'nombre_ciudad','tipoinmueble','precio_canon_formateado', 'precio_venta_formateado', 'mostrar_activo', 'mostrar_destacado')
     search_fields = ('titulo', 'codigo_sincronizacion', 'direccion', 'slug')
-    list_filter = ('ciudad', 'barrio', 'estado_inmueble', 'tipo_consignacion', 'activo', 'destacado')
+    list_filter = (
+        ('ciudad', FacetaCacheadaListFilter),
+        ('barrio', BarrioPorCiudadListFilter),
+        ('estado_inmueble', FacetaCacheadaListFilter),
+        ('tipo_consignacion', FacetaCacheadaListFilter),
+        'activo',
+        'destacado',
+    )
 
     autocomplete_fields = (
         'ciudad', 'barrio', 'tipo_inmueble', 'uso_inmueble',
@@ -457,6 +502,69 @@ class InmueblesAdmin(admin.ModelAdmin):
     
     ordering = ('-ref',)
     
+    def get_queryset(self, request):
+        """Evita consultas por fila: relaciones unidas e imagen principal en lote"""
+        return super().get_queryset(request).con_imagen_principal()
+    
+    actions = ['activar', 'desactivar', 'marcar_destacado', 'quitar_destacado']
+    
+    def save_model(self, request, obj, form, change):
+        """
+        Guarda en InmueblesEstados los estados editados para que sobrevivan al
+        sync. fecha_actualizacion cambia el ETag del detalle en la API.
+        """
+        obj.fecha_actualizacion = timezone.now()
+        super().save_model(request, obj, form, change)
+        if set(CAMPOS_ESTADO) & set(form.changed_data):
+            capturar_estados([obj.ref])
+    
+    def _cambiar_estado(self, request, queryset, **valores):
+        """Actualiza los seleccionados y captura sus estados, todo en lote"""
+        filas = list(queryset.values_list('ref', 'geohash'))
+        refs = [fila[0] for fila in filas]
+        actualizados = Inmuebles.objects.filter(ref__in=refs).update(
+            fecha_actualizacion=timezone.now(), **valores
+        )
+        capturar_estados(refs)
+        # update() no envía señales
+        invalidar_facetas()
+        if 'activo' in valores:
+            actualizar_celdas({fila[1] for fila in filas})
+        self.message_user(request, f"{actualizados} inmuebles actualizados.")
+    
+    @admin.action(description="Activar seleccionados")
+    def activar(self, request, queryset):
+        self._cambiar_estado(request, queryset, activo=1)
+    
+    @admin.action(description="Desactivar seleccionados")
+    def desactivar(self, request, queryset):
+        self._cambiar_estado(request, queryset, activo=0)
+    
+    @admin.action(description="Marcar como destacados")
+    def marcar_destacado(self, request, queryset):
+        self._cambiar_estado(request, queryset, destacado=1)
+    
+    @admin.action(description="Quitar destacado")
+    def quitar_destacado(self, request, queryset):
+        self._cambiar_estado(request, queryset, destacado=0)
+    
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Búsqueda con el motor FULLTEXT en lugar de LIKE sobre search_fields,
+        más los códigos y slugs que empiezan por el término (el índice no
+        los encuentra: 'SYN' no está en titulo ni en direccion).
+
+        Cada conjunto se resuelve aparte, con su índice, y se filtra con un
+        solo IN: MySQL no puede usar el índice de un IN (subconsulta) ni de
+        un LIKE que estén dentro de un OR.
+        """
+        if not search_term.strip():
+            return queryset, False
+        encontrados = set(Inmuebles.objects.buscar(search_term).values_list('pk', flat=True))
+        for prefijo in filtros_prefijos(search_term):
+            encontrados.update(Inmuebles.objects.filter(prefijo).values_list('pk', flat=True))
+        return queryset.filter(pk__in=sorted(encontrados)), False
+    
     def cod_syn(self, obj):
         return obj.codigo_sincronizacion if obj.codigo_sincronizacion else "-"
     cod_syn.short_description = "cod_sync"
@@ -500,7 +608,7 @@ class InmueblesAdmin(admin.ModelAdmin):
                 'cursor: pointer; transition: transform 0.2s;" '
                 'onmouseover="this.style.transform=\'scale(1.1)\'" '
                 'onmouseout="this.style.transform=\'scale(1)\'" /></a>',
-                imagen.url, imagen.url
+                imagen.url, imagen.get_miniatura_url('chica')
             )
         return format_html(
             '<div style="width: 80px; height: 60px; background-color: #f0f0f0; '
@@ -560,9 +668,9 @@ class InmueblesAdmin(admin.ModelAdmin):
         js = ('admin/js/currency-formatter.js',)
 
 @admin.register(Imagenes)
-class ImagenesAdmin(admin.ModelAdmin):
+class ImagenesAdmin(RelacionesAdminMixin, ConteoAproximadoAdminMixin, admin.ModelAdmin):
     list_display = ['imagen_miniatura', 'inmueble_info', 'orden', 'estado_descarga', 'created_at_formatted']
-    list_filter = ['descargada', 'orden', 'created_at', 'inmueble__ciudad']
+    list_filter = ['descargada', 'orden', 'created_at', ('inmueble__ciudad', FacetaCacheadaListFilter)]
     search_fields = ['inmueble__titulo', 'inmueble__ref', 'url', 'url_local']
     autocomplete_fields = ['inmueble']
     
@@ -597,7 +705,7 @@ class ImagenesAdmin(admin.ModelAdmin):
             return format_html(
                 '<img src="{}" width="60" height="45" '
                 'style="border-radius: 6px; object-fit: cover; border: 1px solid #ddd;" />',
-                obj.url
+                obj.get_miniatura_url('chica')
             )
         return "🚫"
     
@@ -613,7 +721,7 @@ class ImagenesAdmin(admin.ModelAdmin):
                 'border-radius: 8px; border: 2px solid #ddd; cursor: pointer;" /></a>'
                 '<br><small style="color: #666;">Click para ver en tamaño completo</small>'
                 '</div>',
-                obj.url, obj.url
+                obj.url, obj.get_miniatura_url('grande')
             )
         return "Sin URL de imagen disponible"
     
@@ -0,0 +1,138 @@
+"""
+Almacén de imágenes por contenido.
+
+Cada archivo se guarda una sola vez bajo el SHA-256 de su contenido,
+repartido en subdirectorios para no llenar uno solo:
+
+    imagenes/3f/a9/3fa9...c2.jpg
+
+Imagenes.url_local apunta a esa ruta, así que varias filas (la misma foto con
+distinta URL, o reenviada por el feed) comparten archivo. ArchivosImagen
+lleva el tamaño, el ETag y cuántas filas de imagenes lo usan.
+"""
+import os
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BigIntegerField, Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import ArchivosImagen, Imagenes
+
+DIRECTORIO = 'imagenes'
+
+# Firma de los primeros bytes -> extensión
+FIRMAS = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF8', '.gif'),
+)
+
+
+def extension(inicio):
+    """Extensión según el contenido; '.jpg' si no se reconoce"""
+    if inicio[:4] == b'RIFF' and inicio[8:12] == b'WEBP':
+        return '.webp'
+    for firma, ext in FIRMAS:
+        if inicio.startswith(firma):
+            return ext
+    return '.jpg'
+
+
+def ruta_contenido(digest, ext):
+    return f'{DIRECTORIO}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+
+def etag_fuerte(etag):
+    """Solo los ETag fuertes identifican el contenido byte a byte"""
+    if not etag or etag.startswith('W/'):
+        return None
+    return etag
+
+
+def recontar_referencias(rutas=None):
+    """
+    Recalcula ArchivosImagen.referencias con un solo UPDATE (para `rutas`,
+    o todas si es None).
+    """
+    usos = Imagenes.objects.filter(url_local=OuterRef('ruta')).values('url_local').annotate(
+        total=Count('pk')
+    ).values('total')
+    archivos = ArchivosImagen.objects.all()
+    if rutas is not None:
+        archivos = archivos.filter(ruta__in=set(rutas))
+    return archivos.update(referencias=Coalesce(Subquery(usos), Value(0)))
+
+
+@dataclass
+class ReporteAlmacen:
+    archivos: int
+    bytes_en_disco: int
+    referencias: int
+    bytes_sin_dedup: int
+    huerfanos: int
+
+    @property
+    def bytes_ahorrados(self):
+        return self.bytes_sin_dedup - self.bytes_en_disco
+
+    @property
+    def porcentaje_ahorrado(self):
+        return 100 * self.bytes_ahorrados / self.bytes_sin_dedup if self.bytes_sin_dedup else 0.0
+
+
+def reporte():
+    """Espacio usado contra el que ocuparía guardar una copia por fila"""
+    recontar_referencias()
+    totales = ArchivosImagen.objects.aggregate(
+        total_archivos=Count('pk'),
+        total_bytes=Coalesce(Sum('tamano'), 0),
+        total_referencias=Coalesce(Sum('referencias'), 0),
+        total_sin_dedup=Coalesce(
+            Sum(F('tamano') * F('referencias'), output_field=BigIntegerField()), 0
+        ),
+    )
+    return ReporteAlmacen(
+        archivos=totales['total_archivos'],
+        bytes_en_disco=totales['total_bytes'],
+        referencias=totales['total_referencias'],
+        bytes_sin_dedup=totales['total_sin_dedup'],
+        huerfanos=ArchivosImagen.objects.filter(referencias=0).count(),
+    )
+
+
+def limpiar(raiz=None):
+    """
+    Borra los archivos que ya no usa ninguna imagen; devuelve cuántos.
+
+    Los huérfanos se bloquean y se vuelven a contar dentro de la transacción:
+    el descargador bloquea los mismos registros antes de reutilizar un
+    archivo, así que uno que tomó entre medio ya no se borra. Los archivos se
+    quitan del disco solo después de confirmar.
+    """
+    raiz = raiz or settings.MEDIA_ROOT
+    recontar_referencias()
+    with transaction.atomic():
+        rutas = list(
+            ArchivosImagen.objects.select_for_update().filter(referencias=0)
+            .values_list('ruta', flat=True)
+        )
+        recontar_referencias(rutas)
+        huerfanos = dict(
+            ArchivosImagen.objects.filter(ruta__in=rutas, referencias=0).values_list('pk', 'ruta')
+        )
+        ArchivosImagen.objects.filter(pk__in=list(huerfanos)).delete()
+        transaction.on_commit(lambda: _borrar_archivos(raiz, huerfanos.values()))
+    return len(huerfanos)
+
+
+def _borrar_archivos(raiz, rutas):
+    for ruta in rutas:
+        base, _ = os.path.splitext(os.path.join(raiz, ruta))
+        # El original y sus miniaturas (miniaturas.py)
+        directorio = os.path.dirname(base)
+        prefijo = os.path.basename(base)
+        for nombre in os.listdir(directorio) if os.path.isdir(directorio) else ():
+            if nombre.startswith(f'{prefijo}.'):
+                os.remove(os.path.join(directorio, nombre))
@@ -0,0 +1,605 @@
+"""
+Consultas de la API pública de inmuebles (views.py).
+
+El listado lee solo columnas de la tabla inmuebles (los *_nombre
+desnormalizados en lugar de unir los catálogos) y pagina por cursor sobre
+ref: cada página es `ref > cursor ORDER BY ref LIMIT n`, que con el índice
+(activo, ref) cuesta lo mismo en la primera página que en la número mil.
+
+Las facetas de la búsqueda salen de una sola consulta (un UNION ALL de
+GROUP BY) y se cachean por la firma normalizada de los filtros, bajo la
+versión de facets.py que invalida cualquier cambio en inmuebles.
+
+Los filtros por características (caracteristica=piscina,
+caracteristica=area-balcon:gte:10) son una subconsulta sobre el pivote de
+caracteristicas.py, no un JOIN por condición. Los de etiquetas (etiqueta,
+etiqueta_alguna, sin_etiqueta) salen del índice de bits de etiquetas.py.
+Con LISTADO_COLUMNAR, el listado filtra sobre la copia en columnas de
+columnas.py y solo lee de la base de datos las filas de la página.
+
+La búsqueda por zona (caja=min_lat,min_lng,max_lat,max_lng y el listado
+`cerca`) usa las columnas numéricas y el geohash de geo.py; los grupos del
+mapa salen de las celdas precalculadas de mapa.py.
+
+El detalle (/api/inmuebles/<slug>/) busca por el índice único de slug y
+responde 304 con el ETag de hash_datos y fecha_actualizacion antes de armar
+el JSON. Sus similares (/api/inmuebles/<slug>/similares/) son las listas
+precalculadas de similares.py.
+"""
+import hashlib
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .caracteristicas import OPERADORES, filtro_caracteristicas
+from .columnas import indice_columnar
+from .etiquetas import MAXIMO_CANDIDATOS, candidatos_etiquetas, filtro_etiquetas
+from .facets import registrar_uso, version_facetas
+from .geo import distancia_km, filtro_caja
+from .mapa import clusters
+from .models import (
+    Caracteristica,
+    Etiquetas,
+    Imagenes,
+    InmuebleCaracteristicas,
+    Inmuebles,
+    InmueblesEtiquetas,
+    imagenes_por_prioridad,
+)
+from .similares import VECINOS
+
+LIMITE_POR_DEFECTO = 20
+LIMITE_MAXIMO = 100
+
+# Parámetro -> columna desnormalizada
+FILTROS_NOMBRE = {
+    'ciudad': 'ciudad_nombre',
+    'barrio': 'barrio_nombre',
+    'tipo_inmueble': 'tipo_inmueble_nombre',
+    'tipo_consignacion': 'tipo_consignacion_nombre',
+}
+FILTROS_ENTEROS = ('habitaciones', 'banos', 'estrato')
+# Parámetro -> (campo, límite inferior o superior) en la copia en columnas
+FILTROS_RANGO = {
+    'precio_min': ('precio', 0),
+    'precio_max': ('precio', 1),
+    'area_min': ('area', 0),
+    'area_max': ('area', 1),
+}
+
+RADIO_POR_DEFECTO_KM = 2
+RADIO_MAXIMO_KM = 50
+ZOOM_MAXIMO = 22
+
+# Campo del JSON -> columna
+CAMPOS_LISTADO = {
+    'ref': 'ref',
+    'slug': 'slug',
+    'titulo': 'titulo',
+    'descripcion_corta': 'descripcion_corta',
+    'ciudad': 'ciudad_nombre',
+    'barrio': 'barrio_nombre',
+    'tipo_inmueble': 'tipo_inmueble_nombre',
+    'tipo_consignacion': 'tipo_consignacion_nombre',
+    'precio_venta': 'precio_venta',
+    'precio_canon': 'precio_canon',
+    'area': 'area',
+    'habitaciones': 'habitaciones',
+    'banos': 'banos',
+    'garajes': 'garajes',
+    'estrato': 'estrato',
+    'destacado': 'destacado',
+    'latitud': 'latitud',
+    'longitud': 'longitud',
+}
+
+# Además de los del listado
+CAMPOS_DETALLE = {
+    **CAMPOS_LISTADO,
+    'descripcion': 'descripcion',
+    'direccion': 'direccion',
+    'uso_inmueble': 'uso_inmueble_nombre',
+    'estado_inmueble': 'estado_inmueble_nombre',
+    'asesor': 'asesor_nombre',
+    'area_construida': 'area_construida',
+    'area_privada': 'area_privada',
+    'area_terreno': 'area_terreno',
+    'precio_administracion': 'precio_administracion',
+    'precio_total': 'precio_total',
+    'fecha_actualizacion': 'fecha_actualizacion',
+}
+
+
+class ParametroInvalido(ValueError):
+    """Error de validación de los parámetros; la vista responde 400"""
+
+
+def _entero(params, nombre):
+    valor = params.get(nombre)
+    if valor in (None, ''):
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise ParametroInvalido(f'{nombre} debe ser un número entero')
+
+
+def _decimal(params, nombre):
+    valor = params.get(nombre)
+    if valor in (None, ''):
+        return None
+    try:
+        return Decimal(valor)
+    except InvalidOperation:
+        raise ParametroInvalido(f'{nombre} debe ser un número')
+
+
+def _coordenada(params, nombre, limite):
+    valor = params.get(nombre)
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        raise ParametroInvalido(f'{nombre} debe ser un número')
+    if not -limite <= numero <= limite:
+        raise ParametroInvalido(f'{nombre} debe estar entre -{limite} y {limite}')
+    return numero
+
+
+def _caja(params):
+    """caja=min_lat,min_lng,max_lat,max_lng"""
+    valor = params.get('caja')
+    if valor in (None, ''):
+        return None
+    partes = valor.split(',')
+    if len(partes) != 4:
+        raise ParametroInvalido('caja debe ser min_lat,min_lng,max_lat,max_lng')
+    nombres = ('min_lat', 'min_lng', 'max_lat', 'max_lng')
+    min_lat, min_lng, max_lat, max_lng = (
+        _coordenada({nombre: parte}, nombre, 90 if 'lat' in nombre else 180)
+        for nombre, parte in zip(nombres, partes)
+    )
+    if min_lat > max_lat or min_lng > max_lng:
+        raise ParametroInvalido('caja: los mínimos deben ser menores que los máximos')
+    return min_lat, min_lng, max_lat, max_lng
+
+
+# Parámetros de etiquetas, en el orden de filtro_etiquetas: todas, alguna, ninguna
+PARAMETROS_ETIQUETAS = ('etiqueta', 'etiqueta_alguna', 'sin_etiqueta')
+
+
+def catalogo(modelo):
+    """{slug del nombre: id} de Caracteristica o Etiquetas, cacheado con la versión de facetas"""
+    clave = f'facetas:{version_facetas()}:catalogo:{modelo._meta.db_table}'
+    valores = cache.get(clave)
+    if valores is None:
+        valores = {slugify(nombre): pk for pk, nombre in modelo.objects.values_list('pk', 'nombre')}
+        cache.set(clave, valores, settings.FACETAS_CACHE_SEGUNDOS)
+    return valores
+
+
+def _condiciones(params):
+    """
+    caracteristica=<slug> (la tiene) o caracteristica=<slug>:<gte|lte|eq>:<valor>,
+    repetible: tuplas (caracteristica_id, operador, valor) ordenadas
+    """
+    textos = [texto.strip() for texto in params.getlist('caracteristica') if texto.strip()]
+    if not textos:
+        return ()
+    caracteristicas = catalogo(Caracteristica)
+    condiciones = set()
+    for texto in textos:
+        slug, _, resto = texto.partition(':')
+        if slugify(slug) not in caracteristicas:
+            raise ParametroInvalido(f'caracteristica desconocida: {slug}')
+        caracteristica_id = caracteristicas[slugify(slug)]
+        if not resto:
+            condiciones.add((caracteristica_id, 'tiene', ''))
+            continue
+        operador, _, valor = resto.partition(':')
+        if operador not in OPERADORES or operador == 'tiene' or not valor:
+            raise ParametroInvalido('caracteristica debe ser <nombre> o <nombre>:<gte|lte|eq>:<valor>')
+        try:
+            condiciones.add((caracteristica_id, operador, Decimal(valor).normalize()))
+        except InvalidOperation:
+            if operador != 'eq':
+                raise ParametroInvalido(f'caracteristica {slug}: {operador} necesita un número')
+            condiciones.add((caracteristica_id, 'texto', valor))
+    return tuple(sorted(condiciones, key=str))
+
+
+def _etiquetas(params):
+    """
+    (todas, alguna, ninguna): ids ordenados de las etiquetas de etiqueta,
+    etiqueta_alguna y sin_etiqueta (slugs, repetibles); None si no hay
+    """
+    grupos = [
+        [texto.strip() for texto in params.getlist(parametro) if texto.strip()]
+        for parametro in PARAMETROS_ETIQUETAS
+    ]
+    if not any(grupos):
+        return None
+    etiquetas = catalogo(Etiquetas)
+    ids = []
+    for parametro, slugs in zip(PARAMETROS_ETIQUETAS, grupos):
+        desconocidas = [slug for slug in slugs if slugify(slug) not in etiquetas]
+        if desconocidas:
+            raise ParametroInvalido(f'{parametro}: etiqueta desconocida {desconocidas[0]}')
+        ids.append(tuple(sorted({etiquetas[slugify(slug)] for slug in slugs})))
+    return tuple(ids)
+
+
+def normalizar_filtros(params):
+    """Filtros presentes en `params`, con los valores ya convertidos"""
+    filtros = {}
+    for parametro in FILTROS_NOMBRE:
+        valor = (params.get(parametro) or '').strip()
+        if valor:
+            filtros[parametro] = valor
+    for parametro in FILTROS_ENTEROS:
+        valor = _entero(params, parametro)
+        if valor is not None:
+            filtros[parametro] = valor
+    for parametro in FILTROS_RANGO:
+        valor = _decimal(params, parametro)
+        if valor is not None:
+            filtros[parametro] = valor.normalize()
+    caja = _caja(params)
+    if caja is not None:
+        filtros['caja'] = caja
+    condiciones = _condiciones(params)
+    if condiciones:
+        filtros['caracteristicas'] = condiciones
+    etiquetas = _etiquetas(params)
+    if etiquetas:
+        filtros['etiquetas'] = etiquetas
+    return filtros
+
+
+def filtros_listado(params, excluir=()):
+    """
+    Q con los filtros de la búsqueda pública a partir de los parámetros GET,
+    sin los de `excluir`.
+
+    El precio se compara con precio_venta, o con precio_canon si el inmueble
+    no tiene precio de venta (arriendos).
+    """
+    filtro = Q()
+    for parametro, valor in normalizar_filtros(params).items():
+        if parametro in excluir:
+            continue
+        if parametro in FILTROS_NOMBRE:
+            filtro &= Q(**{FILTROS_NOMBRE[parametro]: valor})
+        elif parametro in FILTROS_ENTEROS:
+            filtro &= Q(**{parametro: valor})
+        elif parametro == 'caja':
+            filtro &= filtro_caja(*valor)
+        elif parametro == 'caracteristicas':
+            filtro &= filtro_caracteristicas(valor)
+        elif parametro == 'etiquetas':
+            filtro &= filtro_etiquetas(*valor)
+        elif parametro in ('area_min', 'area_max'):
+            filtro &= Q(**{f"area__{'gte' if parametro == 'area_min' else 'lte'}": valor})
+        else:
+            operador = 'gte' if parametro == 'precio_min' else 'lte'
+            filtro &= Q(**{f'precio_venta__{operador}': valor}) | Q(
+                precio_venta__isnull=True, **{f'precio_canon__{operador}': valor}
+            )
+    return filtro
+
+
+def limite_pagina(params):
+    limite = _entero(params, 'limite') or LIMITE_POR_DEFECTO
+    return max(1, min(limite, LIMITE_MAXIMO))
+
+
+def pagina_listado(params):
+    """
+    (filas, siguiente_cursor) de la página pedida. Dos consultas: los
+    inmuebles y la imagen principal de todos ellos (con filtros de
+    etiquetas, una por ventana de refs candidatas, casi siempre una).
+    """
+    cursor = _entero(params, 'cursor')
+    limite = limite_pagina(params)
+    filtros = normalizar_filtros(params)
+    columnar = _consulta_columnar(filtros) if settings.LISTADO_COLUMNAR else None
+    candidatos = None
+    if columnar is None and 'etiquetas' in filtros:
+        candidatos = candidatos_etiquetas(*filtros['etiquetas'])
+    queryset = Inmuebles.objects.activos().order_by('ref').values('pk', *CAMPOS_LISTADO.values())
+    # Uno de más para saber si hay página siguiente sin contar
+    siguiente = None
+    if columnar is not None:
+        refs = indice_columnar().consultar(*columnar, despues=cursor, limite=limite + 1)
+        # La copia puede tener refs que ya se retiraron: la página sale más
+        # corta, pero el cursor sigue a la copia y el listado no se corta
+        filas = list(queryset.filter(ref__in=refs[:limite]))
+        if len(refs) > limite:
+            siguiente = refs[limite - 1]
+    else:
+        queryset = queryset.filter(
+            filtros_listado(params, excluir=('etiquetas',) if candidatos is not None else ())
+        )
+        if cursor is not None:
+            queryset = queryset.filter(ref__gt=cursor)
+        if candidatos is None:
+            filas = list(queryset[:limite + 1])
+        else:
+            filas = _filas_candidatas(queryset, candidatos, cursor, limite + 1)
+        if len(filas) > limite:
+            filas = filas[:limite]
+            siguiente = filas[-1]['ref']
+    imagenes = imagenes_principales([fila['pk'] for fila in filas])
+    return [serializar_fila(fila, imagenes.get(fila['pk'])) for fila in filas], siguiente
+
+
+def _consulta_columnar(filtros):
+    """(iguales, rangos) de columnas.py para los filtros, o None si alguno no está en la copia"""
+    iguales, rangos = {}, {}
+    for parametro, valor in filtros.items():
+        if parametro in FILTROS_NOMBRE:
+            iguales[FILTROS_NOMBRE[parametro]] = valor
+        elif parametro in FILTROS_ENTEROS:
+            iguales[parametro] = valor
+        elif parametro in FILTROS_RANGO:
+            campo, limite = FILTROS_RANGO[parametro]
+            rangos.setdefault(campo, [None, None])[limite] = valor
+        else:
+            return None
+    return iguales, rangos
+
+
+def _filas_candidatas(queryset, candidatos, cursor, cantidad):
+    """
+    Las primeras `cantidad` filas del queryset entre las refs candidatas
+    (un Bitmap), pidiendo las refs en orden por ventanas que crecen, porque
+    los demás filtros pueden descartar candidatas.
+    """
+    refs = candidatos.desde(0 if cursor is None else cursor + 1)
+    filas, ventana = [], cantidad
+    while len(filas) < cantidad:
+        lote = list(islice(refs, ventana))
+        if not lote:
+            break
+        filas += queryset.filter(ref__in=lote)[:cantidad - len(filas)]
+        ventana = min(ventana * 4, MAXIMO_CANDIDATOS)
+    return filas
+
+
+def imagenes_principales(ids):
+    """{inmueble_id: Imagenes} con la imagen principal de cada inmueble, en una consulta"""
+    principales = {}
+    if not ids:
+        return principales
+    for imagen in imagenes_por_prioridad().filter(inmueble_id__in=ids).only(
+        'inmueble_id', 'url', 'url_local', 'descargada'
+    ):
+        principales.setdefault(imagen.inmueble_id, imagen)
+    return principales
+
+
+def cercanos(params):
+    """
+    Inmuebles a menos de radio_km de (lat, lng), del más cercano al más
+    lejano, con los mismos filtros del listado. Dos consultas.
+    """
+    lat = _coordenada(params, 'lat', 90)
+    lng = _coordenada(params, 'lng', 180)
+    radio = _decimal(params, 'radio_km')
+    radio = RADIO_POR_DEFECTO_KM if radio is None else float(radio)
+    if not 0 < radio <= RADIO_MAXIMO_KM:
+        raise ParametroInvalido(f'radio_km debe estar entre 0 y {RADIO_MAXIMO_KM}')
+    filas = list(
+        Inmuebles.objects.activos().filter(filtros_listado(params)).cerca_de(lat, lng, radio)
+        .values('pk', 'latitud_num', 'longitud_num', *CAMPOS_LISTADO.values())[:limite_pagina(params)]
+    )
+    imagenes = imagenes_principales([fila['pk'] for fila in filas])
+    resultados = []
+    for fila in filas:
+        datos = serializar_fila(fila, imagenes.get(fila['pk']))
+        datos['distancia_km'] = round(
+            distancia_km(lat, lng, fila['latitud_num'], fila['longitud_num']), 3
+        )
+        resultados.append(datos)
+    return resultados
+
+
+def grupos_mapa(params):
+    """Grupos de marcadores de la vista `caja` para el `zoom` del mapa"""
+    caja = _caja(params)
+    if caja is None:
+        raise ParametroInvalido('caja es obligatorio')
+    zoom = _entero(params, 'zoom')
+    if zoom is None or not 0 <= zoom <= ZOOM_MAXIMO:
+        raise ParametroInvalido(f'zoom debe estar entre 0 y {ZOOM_MAXIMO}')
+    nivel, grupos = clusters(*caja, zoom)
+    return {'nivel': nivel, 'grupos': grupos}
+
+
+def similares(slug, params):
+    """
+    Los inmuebles activos más parecidos al del slug, del más parecido al
+    menos, precalculados en inmuebles_similares (similares.py); None si el
+    inmueble no existe. Tres consultas.
+    """
+    encontrados = list(Inmuebles.objects.activos().filter(slug=slug).values_list('similares__refs', flat=True)[:1])
+    if not encontrados:
+        return None
+    refs = (encontrados[0] or [])[:min(limite_pagina(params), VECINOS)]
+    if not refs:
+        return []
+    filas = {
+        fila['ref']: fila
+        for fila in Inmuebles.objects.activos().filter(ref__in=refs).values('pk', *CAMPOS_LISTADO.values())
+    }
+    # Los que se retiraron desde el cálculo no salen
+    filas = [filas[ref] for ref in refs if ref in filas]
+    imagenes = imagenes_principales([fila['pk'] for fila in filas])
+    return [serializar_fila(fila, imagenes.get(fila['pk'])) for fila in filas]
+
+
+def fila_detalle(slug):
+    """Columnas del detalle del inmueble activo con ese slug, o None. Una consulta"""
+    return Inmuebles.objects.activos().filter(slug=slug).values(
+        'pk', 'hash_datos', *CAMPOS_DETALLE.values()
+    ).first()
+
+
+def version_detalle(fila):
+    """(ETag, Last-Modified como timestamp o None) de la fila"""
+    modificado = fila['fecha_actualizacion']
+    firma = hashlib.blake2b(
+        f"{fila['hash_datos']}|{modificado.isoformat() if modificado else ''}".encode(),
+        digest_size=16,
+    ).hexdigest()
+    if modificado is not None:
+        if timezone.is_naive(modificado):
+            modificado = timezone.make_aware(modificado)
+        modificado = int(modificado.timestamp())
+    return f'"{firma}"', modificado
+
+
+def serializar_detalle(fila):
+    """JSON del detalle: tres consultas más (imágenes, características y etiquetas)"""
+    pk = fila['pk']
+    datos = {campo: fila[columna] for campo, columna in CAMPOS_DETALLE.items()}
+    datos['destacado'] = bool(datos['destacado'])
+    datos['imagenes'] = [
+        {
+            'url': imagen.url,
+            'miniatura': imagen.get_miniatura_url('mediana'),
+            'grande': imagen.get_miniatura_url('grande'),
+        }
+        for imagen in Imagenes.objects.filter(inmueble_id=pk).order_by('orden', 'created_at').only(
+            'url', 'url_local', 'descargada'
+        )
+    ]
+    datos['caracteristicas'] = [
+        {
+            'nombre': c.caracteristica.nombre if c.caracteristica else None,
+            'valor': valor_caracteristica(c),
+            'unidad': c.caracteristica.unidad if c.caracteristica else None,
+        }
+        for c in InmuebleCaracteristicas.objects.con_relaciones().filter(inmueble_id=pk)
+        .order_by('caracteristica__nombre')
+    ]
+    datos['etiquetas'] = [
+        {'nombre': nombre, 'color': color}
+        for nombre, color in InmueblesEtiquetas.objects.filter(inmueble_id=pk)
+        .order_by('etiqueta__nombre').values_list('etiqueta__nombre', 'etiqueta__color')
+    ]
+    return datos
+
+
+def valor_caracteristica(caracteristica):
+    if caracteristica.valor_texto:
+        return caracteristica.valor_texto
+    if caracteristica.valor_numerico is not None:
+        return caracteristica.valor_numerico
+    if caracteristica.valor_booleano is not None:
+        return bool(caracteristica.valor_booleano)
+    return None
+
+
+def serializar_fila(fila, imagen=None):
+    datos = {campo: fila[columna] for campo, columna in CAMPOS_LISTADO.items()}
+    datos['destacado'] = bool(datos['destacado'])
+    datos['imagen'] = imagen.url if imagen else None
+    datos['miniatura'] = imagen.get_miniatura_url('mediana') if imagen else None
+    return datos
+
+
+# Rangos de precio: (desde, hasta) en pesos; hasta None = sin tope
+RANGOS_PRECIO = {
+    'precio_venta': [
+        (0, 100_000_000), (100_000_000, 200_000_000), (200_000_000, 400_000_000),
+        (400_000_000, 800_000_000), (800_000_000, None),
+    ],
+    'precio_canon': [
+        (0, 1_000_000), (1_000_000, 2_000_000), (2_000_000, 4_000_000), (4_000_000, None),
+    ],
+}
+
+# Faceta -> (expresión agrupada, filtros que se ignoran al contarla). Cada
+# faceta se cuenta sin su propio filtro, para que el sitio pueda mostrar las
+# demás opciones de ese grupo.
+FACETAS = {
+    'ciudad': (F('ciudad_nombre'), ('ciudad',)),
+    'barrio': (F('barrio_nombre'), ('barrio',)),
+    'tipo_inmueble': (F('tipo_inmueble_nombre'), ('tipo_inmueble',)),
+    'tipo_consignacion': (F('tipo_consignacion_nombre'), ('tipo_consignacion',)),
+    'estrato': (F('estrato'), ('estrato',)),
+    'habitaciones': (F('habitaciones'), ('habitaciones',)),
+    **{
+        campo: (
+            Case(*(
+                When(
+                    Q(**{f'{campo}__gte': desde}) & (Q(**{f'{campo}__lt': hasta}) if hasta else Q()),
+                    then=Value(f'{desde}-{hasta or ""}'),
+                )
+                for desde, hasta in rangos
+            )),
+            ('precio_min', 'precio_max'),
+        )
+        for campo, rangos in RANGOS_PRECIO.items()
+    },
+}
+
+
+def firma_filtros(params):
+    """Clave estable de los filtros: el orden y el formato de los parámetros no importan"""
+    normalizados = '&'.join(f'{k}={v}' for k, v in sorted(normalizar_filtros(params).items()))
+    return hashlib.sha1(normalizados.encode('utf-8')).hexdigest()
+
+
+def calcular_facetas(params):
+    """
+    {faceta: [{'valor', 'total'}], 'total': n} en una sola consulta: un
+    GROUP BY por faceta unidos con UNION ALL.
+    """
+    base = Inmuebles.objects.activos()
+    consultas = [
+        base.filter(filtros_listado(params)).annotate(
+            faceta=Value('total'), valor=Value('', output_field=CharField()),
+        ).values('faceta', 'valor').annotate(total=Count('pk')).values_list('faceta', 'valor', 'total')
+    ]
+    for nombre, (expresion, excluir) in FACETAS.items():
+        consultas.append(
+            base.filter(filtros_listado(params, excluir)).annotate(
+                faceta=Value(nombre), valor=Cast(expresion, CharField()),
+            ).values('faceta', 'valor').annotate(total=Count('pk'))
+            .values_list('faceta', 'valor', 'total')
+        )
+    primera, *resto = consultas
+    facetas = {nombre: [] for nombre in FACETAS}
+    facetas['total'] = 0
+    for faceta, valor, total in primera.union(*resto, all=True):
+        if faceta == 'total':
+            facetas['total'] = total
+        elif valor is not None:
+            facetas[faceta].append({'valor': valor, 'total': total})
+    for nombre, valores in facetas.items():
+        if nombre != 'total':
+            valores.sort(key=lambda v: (-v['total'], v['valor']))
+    return facetas
+
+
+def facetas_busqueda(params):
+    """(facetas, acierto, segundos) usando la caché por firma de filtros"""
+    clave = f'facetas:{version_facetas()}:api:{firma_filtros(params)}'
+    facetas = cache.get(clave)
+    if facetas is not None:
+        registrar_uso(True)
+        return facetas, True, 0.0
+    inicio = time.perf_counter()
+    facetas = calcular_facetas(params)
+    segundos = time.perf_counter() - inicio
+    cache.set(clave, facetas, settings.FACETAS_CACHE_SEGUNDOS)
+    registrar_uso(False, segundos)
+    return facetas, False, segundos
@@ -0,0 +1,174 @@
+"""
+Utilidades compartidas por los comandos benchmark_*.
+
+Los datos sintéticos se guardan con refs a partir de REF_SINTETICO (muy por
+encima de las refs reales del feed) y se confirman en la base de datos, porque
+el índice FULLTEXT de InnoDB no ve filas de transacciones sin confirmar. Al
+terminar se borran.
+"""
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Barrios, City, Imagenes, Inmuebles, TipoConsignacion, TiposInmueble
+
+REF_SINTETICO = 900_000_000
+
+CIUDADES = ['Montería', 'Cereté', 'Sincelejo', 'Cartagena', 'Barranquilla', 'Medellín']
+BARRIOS = ['La Castellana', 'El Recreo', 'Los Álamos', 'Centro', 'La Granja', 'Boston']
+TIPOS = ['Apartamento', 'Casa', 'Local', 'Lote', 'Oficina', 'Finca']
+CONSIGNACIONES = ['Venta', 'Arriendo']
+PALABRAS = [
+    'amplio', 'iluminado', 'piscina', 'balcón', 'terraza', 'jardín', 'vigilancia',
+    'parqueadero', 'cocina', 'integral', 'remodelado', 'vista', 'club', 'ascensor',
+    'estudio', 'patio', 'conjunto', 'cerrado', 'esquinero', 'calle', 'carrera',
+]
+
+
+def cronometrar(funcion, repeticiones=10):
+    """Ejecuta funcion() varias veces y devuelve tiempos en milisegundos"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {
+        'min': tiempos[0],
+        'mediana': statistics.median(tiempos),
+        'p95': tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))],
+        'max': tiempos[-1],
+    }
+
+
+def formatear_tiempos(nombre, tiempos):
+    return (
+        f"{nombre:<28} min {tiempos['min']:8.2f} ms  mediana {tiempos['mediana']:8.2f} ms  "
+        f"p95 {tiempos['p95']:8.2f} ms"
+    )
+
+
+def catalogos():
+    """Ciudades, barrios, tipos y consignaciones para los datos sintéticos"""
+    ahora = timezone.now()
+    ciudades = [City.objects.get_or_create(nombre=nombre)[0] for nombre in CIUDADES]
+    barrios = [
+        Barrios.objects.get_or_create(
+            nombre=nombre, ciudad=ciudad, defaults={'created_at': ahora}
+        )[0].pk
+        for ciudad in ciudades for nombre in BARRIOS
+    ]
+    barrios = list(Barrios.objects.filter(pk__in=barrios).select_related('ciudad'))
+    tipos = [TiposInmueble.objects.get_or_create(nombre=nombre)[0] for nombre in TIPOS]
+    consignaciones = [
+        TipoConsignacion.objects.get_or_create(nombre=nombre)[0] for nombre in CONSIGNACIONES
+    ]
+    return barrios, tipos, consignaciones
+
+
+def catalogos_en_memoria():
+    """Los mismos catálogos sin guardar, con ids inventados (no escribe en la base)"""
+    ciudades = [City(pk=pk, nombre=nombre) for pk, nombre in enumerate(CIUDADES, start=1)]
+    barrios = [
+        Barrios(pk=len(BARRIOS) * indice + pk, nombre=nombre, ciudad=ciudad)
+        for indice, ciudad in enumerate(ciudades) for pk, nombre in enumerate(BARRIOS, start=1)
+    ]
+    tipos = [TiposInmueble(pk=pk, nombre=nombre) for pk, nombre in enumerate(TIPOS, start=1)]
+    consignaciones = [
+        TipoConsignacion(pk=pk, nombre=nombre) for pk, nombre in enumerate(CONSIGNACIONES, start=1)
+    ]
+    return barrios, tipos, consignaciones
+
+
+def registro_sintetico(ref, rnd, barrio, tipo, consignacion):
+    """Diccionario con los campos de un inmueble sintético"""
+    descripcion = ' '.join(rnd.choices(PALABRAS, k=12))
+    area = Decimal(rnd.randint(30, 400))
+    precio = Decimal(rnd.randint(80, 2000) * 1_000_000)
+    return {
+        'ref': ref,
+        'codigo_sincronizacion': f'SYN-{ref}',
+        'titulo': f'{tipo.nombre} {rnd.choice(PALABRAS)} en {barrio.nombre}',
+        'descripcion': f'<p>{descripcion}</p>',
+        'descripcion_corta': descripcion,
+        'ciudad_id': barrio.ciudad_id,
+        'ciudad_nombre': barrio.ciudad.nombre,
+        'barrio_id': barrio.pk,
+        'barrio_nombre': barrio.nombre,
+        'tipo_inmueble_id': tipo.pk,
+        'tipo_inmueble_nombre': tipo.nombre,
+        'tipo_consignacion_id': consignacion.pk,
+        'tipo_consignacion_nombre': consignacion.nombre,
+        'area': area,
+        'area_construida': area,
+        'habitaciones': rnd.randint(1, 6),
+        'banos': rnd.randint(1, 4),
+        'garajes': rnd.randint(0, 3),
+        'estrato': rnd.randint(1, 6),
+        'precio_venta': precio if consignacion.nombre == 'Venta' else None,
+        'precio_canon': None if consignacion.nombre == 'Venta' else precio / 200,
+        'direccion': f'Calle {rnd.randint(1, 99)} # {rnd.randint(1, 99)}-{rnd.randint(1, 99)}',
+        'latitud': f'{8.70 + rnd.random() / 10:.6f}',
+        'longitud': f'{-75.90 + rnd.random() / 10:.6f}',
+        'activo': 1 if rnd.random() < 0.9 else 0,
+        'destacado': 1 if rnd.random() < 0.05 else 0,
+        'en_caliente': 0,
+        'slug': f'inmueble-sintetico-{ref}',
+    }
+
+
+def sembrar_inmuebles(cantidad, semilla=42, lote=2000, imagenes=0):
+    """Crea `cantidad` inmuebles sintéticos con bulk_create"""
+    rnd = random.Random(semilla)
+    barrios, tipos, consignaciones = catalogos()
+    ahora = timezone.now()
+    for inicio in range(0, cantidad, lote):
+        inmuebles = [
+            Inmuebles(
+                fecha_creacion=ahora,
+                fecha_actualizacion=ahora,
+                **registro_sintetico(
+                    REF_SINTETICO + i, rnd, rnd.choice(barrios),
+                    rnd.choice(tipos), rnd.choice(consignaciones),
+                ),
+            )
+            for i in range(inicio, min(inicio + lote, cantidad))
+        ]
+        with transaction.atomic():
+            creados = Inmuebles.objects.bulk_create(inmuebles)
+            if imagenes:
+                if creados and creados[0].pk is None:
+                    creados = list(Inmuebles.objects.filter(
+                        ref__in=[i.ref for i in inmuebles]
+                    ))
+                Imagenes.objects.bulk_create([
+                    Imagenes(
+                        inmueble=inmueble,
+                        url=f'https://fotos.example.com/{inmueble.ref}/{orden}.jpg',
+                        orden=orden,
+                    )
+                    for inmueble in creados for orden in range(imagenes)
+                ])
+
+
+def borrar_sinteticos():
+    """Elimina los inmuebles sintéticos y sus imágenes"""
+    sinteticos = Inmuebles.objects.filter(ref__gte=REF_SINTETICO)
+    Imagenes.objects.filter(inmueble__in=sinteticos).delete()
+    sinteticos.delete()
+
+
+@contextmanager
+def datos_sinteticos(cantidad, **kwargs):
+    """Siembra inmuebles sintéticos durante el bloque y los borra al salir"""
+    borrar_sinteticos()
+    sembrar_inmuebles(cantidad, **kwargs)
+    try:
+        yield
+    finally:
+        borrar_sinteticos()
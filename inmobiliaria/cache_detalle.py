@@ -0,0 +1,70 @@
+"""
+Caché del JSON ya armado del detalle de cada inmueble (api.serializar_detalle).
+
+La clave lleva la ref y la versión de la fila (el mismo ETag del detalle,
+hecho de hash_datos y fecha_actualizacion), así que nunca se borra nada:
+cualquier escritura cambia la versión y la entrada vieja expira sola. Todos
+los caminos de escritura mueven esa versión:
+
+- la sincronización cambia hash_datos y fecha_actualizacion;
+- InmueblesAdmin pone fecha_actualizacion al guardar (también al guardar
+  los inlines, que pasan por save_model);
+- las señales de imágenes, características y etiquetas la ponen en su
+  inmueble (tocar_inmueble), y las acciones en lote del admin y
+  aplicar_estados la ponen junto con el estado;
+- las descargas y las miniaturas (que cambian las URLs del detalle) y los
+  cambios de nombre de características y etiquetas tocan sus inmuebles
+  (InmueblesQuerySet.tocar).
+
+Usa la caché 'inmuebles' de settings.CACHES: memoria local o archivos, que
+comparten todos los procesos de un mismo servidor.
+"""
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .facets import incrementar
+
+ALIAS = 'inmuebles'
+CONTADORES = ('aciertos', 'fallos')
+
+
+def cache_detalle():
+    return caches[ALIAS]
+
+
+def clave_detalle(ref, etag):
+    firma = etag.strip('"')
+    return f'detalle:{ref}:{firma}'
+
+
+def json_detalle(fila, etag, serializar):
+    """
+    (JSON del detalle como bytes, acierto). `serializar(fila)` arma el
+    diccionario cuando no está en la caché.
+    """
+    backend = cache_detalle()
+    clave = clave_detalle(fila['ref'], etag)
+    contenido = backend.get(clave)
+    if contenido is not None:
+        incrementar('detalle:contador:aciertos', backend=backend)
+        return contenido, True
+    contenido = json.dumps(serializar(fila), cls=DjangoJSONEncoder).encode('utf-8')
+    backend.set(clave, contenido, settings.INMUEBLES_CACHE_SEGUNDOS)
+    incrementar('detalle:contador:fallos', backend=backend)
+    return contenido, False
+
+
+def estadisticas_detalle():
+    """Aciertos, fallos y proporción de aciertos de la caché del detalle"""
+    backend = cache_detalle()
+    valores = backend.get_many([f'detalle:contador:{nombre}' for nombre in CONTADORES])
+    aciertos, fallos = (valores.get(f'detalle:contador:{nombre}', 0) for nombre in CONTADORES)
+    consultas = aciertos + fallos
+    return {
+        'aciertos': aciertos,
+        'fallos': fallos,
+        'proporcion_aciertos': aciertos / consultas if consultas else 0.0,
+    }
@@ -0,0 +1,217 @@
+"""
+Filtros por características de los inmuebles sobre el pivote.
+
+inmueble_caracteristicas es EAV: una fila por inmueble y característica, y
+"tiene piscina y balcón de 10 m² o más" cuesta un JOIN por condición.
+caracteristicas_pivote guarda todas las de un inmueble en una fila JSON
+('n<id>' el número o el booleano como 1/0, 't<id>' el texto), y cada
+característica numérica tiene un índice de expresión sobre su clave, así que
+cada condición es un predicado indexado de una sola tabla.
+
+Las señales de InmuebleCaracteristicas rehacen las filas de los inmuebles
+tocados al confirmar la transacción (programar_pivote); el comando
+pivote_caracteristicas reconstruye todo y crea los índices que falten.
+"""
+import time
+from dataclasses import dataclass
+from itertools import groupby
+
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Func, Index, Q, TextField
+
+from .facets import invalidar_facetas
+from .models import InmuebleCaracteristicas, PivoteCaracteristicas
+from .transacciones import al_confirmar
+
+# Con más inmuebles tocados que esto, reconstruir todo es más barato
+MAXIMO_INCREMENTAL = 5000
+
+# Operador del parámetro -> lookup sobre el valor numérico
+OPERADORES = {'tiene': 'gt', 'gte': 'gte', 'lte': 'lte', 'eq': 'exact'}
+
+
+class ValorNumerico(Func):
+    """
+    Número de la característica en `valores`. El SQL es el mismo en la
+    consulta y en el índice (la clave va escrita, no como parámetro), para
+    que la base de datos use el índice.
+    """
+    output_field = FloatField()
+
+    def __init__(self, caracteristica_id):
+        self.clave = f'n{int(caracteristica_id)}'
+        super().__init__(F('valores'))
+
+    def as_sql(self, compiler, connection, **extra):
+        template = f"JSON_EXTRACT(%(expressions)s, '$.{self.clave}')"
+        return super().as_sql(compiler, connection, template=template, **extra)
+
+    def as_mysql(self, compiler, connection, **extra):
+        template = f"CAST(JSON_EXTRACT(%(expressions)s, '$.{self.clave}') AS DECIMAL(15,2))"
+        return super().as_sql(compiler, connection, template=template, **extra)
+
+
+class ValorTexto(Func):
+    """Texto de la característica en `valores` (sin índice)"""
+    output_field = TextField()
+
+    def __init__(self, caracteristica_id):
+        self.clave = f't{int(caracteristica_id)}'
+        super().__init__(F('valores'))
+
+    def as_sql(self, compiler, connection, **extra):
+        template = f"JSON_EXTRACT(%(expressions)s, '$.{self.clave}')"
+        return super().as_sql(compiler, connection, template=template, **extra)
+
+    def as_mysql(self, compiler, connection, **extra):
+        template = f"JSON_UNQUOTE(JSON_EXTRACT(%(expressions)s, '$.{self.clave}'))"
+        return super().as_sql(compiler, connection, template=template, **extra)
+
+
+@dataclass
+class ResultadoPivote:
+    inmuebles: int = 0
+    indices: int = 0
+    segundos: float = 0.0
+
+
+def valores_fila(filas):
+    """`valores` del pivote para las filas EAV (caracteristica_id, texto, número, booleano)"""
+    valores = {}
+    for caracteristica_id, texto, numero, booleano in filas:
+        if caracteristica_id is None:
+            continue
+        if texto:
+            valores[f't{caracteristica_id}'] = texto
+        if numero is not None:
+            valores[f'n{caracteristica_id}'] = float(numero)
+        elif booleano is not None:
+            valores[f'n{caracteristica_id}'] = 1 if booleano else 0
+    return valores
+
+
+def _filas_eav(queryset):
+    return queryset.filter(inmueble_id__isnull=False).order_by('inmueble_id').values_list(
+        'inmueble_id', 'caracteristica_id', 'valor_texto', 'valor_numerico', 'valor_booleano'
+    )
+
+
+def _pivotes(filas):
+    """PivoteCaracteristicas sin guardar, uno por inmueble de las filas EAV ordenadas"""
+    for inmueble_id, grupo in groupby(filas, key=lambda fila: fila[0]):
+        valores = valores_fila(fila[1:] for fila in grupo)
+        if valores:
+            yield PivoteCaracteristicas(inmueble_id=inmueble_id, valores=valores)
+
+
+def actualizar_pivote(inmuebles):
+    """Rehace las filas del pivote de los inmuebles (ids)"""
+    ids = {pk for pk in inmuebles if pk is not None}
+    if not ids:
+        return
+    if len(ids) > MAXIMO_INCREMENTAL:
+        reconstruir_pivote(indices=False)
+        return
+    with transaction.atomic():
+        PivoteCaracteristicas.objects.filter(inmueble_id__in=ids).delete()
+        PivoteCaracteristicas.objects.bulk_create(
+            _pivotes(_filas_eav(InmuebleCaracteristicas.objects.filter(inmueble_id__in=ids))),
+            batch_size=1000,
+        )
+    invalidar_facetas()
+
+
+def programar_pivote(inmuebles):
+    """Rehace las filas de los inmuebles al confirmar la transacción en curso"""
+    al_confirmar(actualizar_pivote, inmuebles)
+
+
+def reconstruir_pivote(lote=2000, indices=True):
+    """
+    Rehace todo el pivote leyendo inmueble_caracteristicas una vez, en orden
+    de inmueble, y crea los índices que falten.
+    """
+    resultado = ResultadoPivote()
+    inicio = time.perf_counter()
+    with transaction.atomic():
+        PivoteCaracteristicas.objects.all().delete()
+        pendientes = []
+        for pivote in _pivotes(_filas_eav(InmuebleCaracteristicas.objects.all()).iterator(chunk_size=lote)):
+            pendientes.append(pivote)
+            if len(pendientes) >= lote:
+                PivoteCaracteristicas.objects.bulk_create(pendientes)
+                resultado.inmuebles += len(pendientes)
+                pendientes = []
+        PivoteCaracteristicas.objects.bulk_create(pendientes)
+        resultado.inmuebles += len(pendientes)
+    if indices:
+        resultado.indices = crear_indices()
+    invalidar_facetas()
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def nombre_indice(caracteristica_id):
+    return f'pivote_n{caracteristica_id}'
+
+
+def crear_indices():
+    """
+    Crea el índice de expresión de cada característica numérica o booleana
+    que aún no lo tiene. Devuelve cuántos creó.
+    """
+    tabla = PivoteCaracteristicas._meta.db_table
+    with connection.cursor() as cursor:
+        existentes = set(connection.introspection.get_constraints(cursor, tabla))
+    caracteristicas = InmuebleCaracteristicas.objects.filter(
+        Q(valor_numerico__isnull=False) | Q(valor_booleano__isnull=False),
+        caracteristica_id__isnull=False,
+    ).order_by('caracteristica_id').values_list('caracteristica_id', flat=True).distinct()
+    nuevos = [pk for pk in caracteristicas if nombre_indice(pk) not in existentes]
+    # El schema_editor solo arma el SQL: en SQLite no se puede abrir dentro
+    # de una transacción (los tests, o un comando dentro de atomic())
+    editor = connection.schema_editor()
+    with connection.cursor() as cursor:
+        for pk in nuevos:
+            indice = Index(ValorNumerico(pk), name=nombre_indice(pk))
+            cursor.execute(str(indice.create_sql(PivoteCaracteristicas, editor)))
+    return len(nuevos)
+
+
+def filtro_caracteristicas(condiciones):
+    """
+    Q de los inmuebles que cumplen todas las condiciones (caracteristica_id,
+    operador, valor), con operador en OPERADORES o 'texto' (igual al texto).
+    Una subconsulta sobre el pivote, sin JOINs.
+    """
+    pivote = PivoteCaracteristicas.objects.all()
+    for numero, (caracteristica_id, operador, valor) in enumerate(condiciones):
+        alias = f'condicion_{numero}'
+        if operador == 'texto':
+            pivote = pivote.alias(**{alias: ValorTexto(caracteristica_id)}).filter(**{alias: valor})
+        else:
+            valor = 0 if operador == 'tiene' else float(valor)
+            pivote = pivote.alias(**{alias: ValorNumerico(caracteristica_id)}).filter(
+                **{f'{alias}__{OPERADORES[operador]}': valor}
+            )
+    return Q(pk__in=pivote.values('inmueble_id'))
+
+
+def filtrar_eav(queryset, condiciones):
+    """
+    Las mismas condiciones con un JOIN a inmueble_caracteristicas por cada
+    una: la consulta que reemplaza el pivote (para comparar).
+    """
+    for caracteristica_id, operador, valor in condiciones:
+        relacion = 'inmueblecaracteristicas__'
+        filtro = Q(**{f'{relacion}caracteristica_id': caracteristica_id})
+        if operador == 'texto':
+            filtro &= Q(**{f'{relacion}valor_texto': valor})
+        else:
+            lookup = OPERADORES[operador]
+            valor = 0 if operador == 'tiene' else valor
+            filtro &= Q(**{f'{relacion}valor_numerico__{lookup}': valor}) | Q(
+                **{f'{relacion}valor_numerico__isnull': True, f'{relacion}valor_booleano__{lookup}': valor}
+            )
+        queryset = queryset.filter(filtro)
+    return queryset
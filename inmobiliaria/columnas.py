@@ -0,0 +1,264 @@
+"""
+Copia en columnas de los inmuebles activos, en memoria de cada proceso.
+
+El catálogo público son, como mucho, unos cientos de miles de filas, y los
+filtros del listado son igualdades y rangos. La copia guarda una columna de
+NumPy por campo, ordenadas por ref: los números como float (NaN si faltan) y
+los nombres de ciudad, barrio y tipos codificados como enteros contra un
+diccionario. Un filtro es una máscara vectorizada y el resultado, la lista
+de refs en orden, sin tocar la base de datos.
+
+Se pone al día leyendo solo las filas con fecha_actualizacion desde la
+última marca (índice inmuebles_fecha_act_idx), como mucho cada
+COLUMNAS_REFRESCO_SEGUNDOS, y se reconstruye entera cada
+COLUMNAS_RECONSTRUIR_SEGUNDOS (los borrados no mueven la marca). La fecha se
+pone antes de confirmar: un lote de la sincronización puede confirmarse
+después de un guardado del admin con fecha mayor, así que cada puesta al día
+relee también los COLUMNAS_SOLAPE_SEGUNDOS anteriores a la marca.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import Coalesce
+
+from .models import Inmuebles
+
+# Campos numéricos; precio es el de venta o, si no hay, el canon
+NUMERICOS = ('precio', 'area', 'habitaciones', 'banos', 'estrato')
+# Nombres desnormalizados, codificados con diccionario
+CODIFICADOS = ('ciudad_nombre', 'barrio_nombre', 'tipo_inmueble_nombre', 'tipo_consignacion_nombre')
+# Orden -> (campo, descendente)
+ORDENES = {
+    'ref': ('ref', False),
+    'precio': ('precio', False),
+    '-precio': ('precio', True),
+    'area': ('area', False),
+    '-area': ('area', True),
+}
+
+
+@dataclass
+class ResultadoColumnas:
+    filas: int = 0
+    cambios: int = 0
+    segundos: float = 0.0
+
+
+class Diccionario:
+    """Texto <-> código entero; -1 es vacío"""
+
+    def __init__(self, codigos=None):
+        self.codigos = dict(codigos or {})
+
+    def codificar(self, valor):
+        if valor is None:
+            return -1
+        return self.codigos.setdefault(valor, len(self.codigos))
+
+    def codigo(self, valor):
+        return self.codigos.get(valor)
+
+
+@dataclass(frozen=True)
+class CopiaColumnar:
+    """
+    Refs, columnas y diccionarios de una misma versión de la copia. No se
+    modifica: construir() y refrescar() publican otra con una asignación,
+    así que una consulta sin el candado nunca mezcla versiones.
+    """
+    refs: np.ndarray
+    columnas: dict
+    diccionarios: dict
+
+    def __len__(self):
+        return len(self.refs)
+
+    def mascara(self, iguales=None, rangos=None):
+        """
+        Máscara de las filas con campo == valor para cada par de `iguales` y
+        minimo <= campo <= maximo para cada campo: (minimo, maximo) de
+        `rangos` (None = sin límite). Los faltantes no cumplen nada.
+        """
+        mascara = np.ones(len(self.refs), dtype=bool)
+        for campo, valor in (iguales or {}).items():
+            if campo in self.diccionarios:
+                codigo = self.diccionarios[campo].codigo(valor)
+                if codigo is None:
+                    return np.zeros(len(self.refs), dtype=bool)
+                mascara &= self.columnas[campo] == codigo
+            else:
+                mascara &= self.columnas[campo] == float(valor)
+        for campo, (minimo, maximo) in (rangos or {}).items():
+            if minimo is not None:
+                mascara &= self.columnas[campo] >= float(minimo)
+            if maximo is not None:
+                mascara &= self.columnas[campo] <= float(maximo)
+        return mascara
+
+    def consultar(self, iguales=None, rangos=None, orden='ref', despues=None, limite=None):
+        """
+        Refs que cumplen los filtros, en el `orden` de ORDENES (empates por
+        ref). Con orden 'ref', `despues` es el cursor del listado.
+        """
+        mascara = self.mascara(iguales, rangos)
+        inicio = 0
+        if despues is not None and orden == 'ref':
+            inicio = int(np.searchsorted(self.refs, despues, side='right'))
+        posiciones = np.flatnonzero(mascara[inicio:]) + inicio
+        campo, descendente = ORDENES[orden]
+        if campo != 'ref':
+            valores = self.columnas[campo][posiciones]
+            # Los faltantes (NaN) al final en los dos sentidos
+            claves = np.where(np.isnan(valores), np.inf, -valores if descendente else valores)
+            posiciones = posiciones[np.argsort(claves, kind='stable')]
+        if limite is not None:
+            posiciones = posiciones[:limite]
+        return self.refs[posiciones].tolist()
+
+    def contar(self, iguales=None, rangos=None):
+        return int(np.count_nonzero(self.mascara(iguales, rangos)))
+
+
+def copia_vacia():
+    return CopiaColumnar(
+        refs=np.empty(0, dtype=np.int64),
+        columnas={},
+        diccionarios={campo: Diccionario() for campo in CODIFICADOS},
+    )
+
+
+class IndiceColumnar:
+    """
+    La copia publicada en self.copia, más la marca y los tiempos de la
+    última puesta al día. Las consultas toman self.copia una vez.
+    """
+
+    def __init__(self):
+        self.copia = copia_vacia()
+        self.marca = None
+        self.construido = 0.0
+        self.refrescado = 0.0
+
+    def __len__(self):
+        return len(self.copia)
+
+    def _leer(self, queryset, diccionarios):
+        """(refs, activos, {campo: array}) de las filas del queryset, en una consulta"""
+        filas = list(queryset.annotate(
+            precio=Coalesce('precio_venta', 'precio_canon'),
+        ).values_list('ref', 'activo', 'fecha_actualizacion', *NUMERICOS, *CODIFICADOS))
+        refs = np.array([fila[0] for fila in filas], dtype=np.int64)
+        activos = np.array([fila[1] == 1 for fila in filas], dtype=bool)
+        marcas = [fila[2] for fila in filas if fila[2] is not None]
+        if marcas:
+            self.marca = max([self.marca, *marcas]) if self.marca else max(marcas)
+        columnas = {}
+        for posicion, campo in enumerate(NUMERICOS, start=3):
+            columnas[campo] = np.array(
+                [np.nan if fila[posicion] is None else float(fila[posicion]) for fila in filas],
+                dtype=np.float64,
+            )
+        for posicion, campo in enumerate(CODIFICADOS, start=3 + len(NUMERICOS)):
+            diccionario = diccionarios[campo]
+            columnas[campo] = np.array(
+                [diccionario.codificar(fila[posicion]) for fila in filas], dtype=np.int32,
+            )
+        return refs, activos, columnas
+
+    def construir(self):
+        """Lee todos los inmuebles activos: una consulta"""
+        diccionarios = {campo: Diccionario() for campo in CODIFICADOS}
+        self.marca = None
+        refs, _, columnas = self._leer(Inmuebles.objects.activos(), diccionarios)
+        orden = np.argsort(refs, kind='stable')
+        self.copia = CopiaColumnar(
+            refs=refs[orden],
+            columnas={campo: valores[orden] for campo, valores in columnas.items()},
+            diccionarios=diccionarios,
+        )
+        self.construido = self.refrescado = time.monotonic()
+
+    def refrescar(self):
+        """
+        Aplica los inmuebles cambiados desde la marca (activos o no): una
+        consulta. Devuelve cuántos leyó.
+        """
+        self.refrescado = time.monotonic()
+        if self.marca is None:
+            return 0
+        copia = self.copia
+        desde = self.marca - timedelta(seconds=settings.COLUMNAS_SOLAPE_SEGUNDOS)
+        # Los diccionarios publicados tampoco se tocan: se codifica sobre copias
+        diccionarios = {
+            campo: Diccionario(diccionario.codigos) for campo, diccionario in copia.diccionarios.items()
+        }
+        refs, activos, columnas = self._leer(
+            Inmuebles.objects.filter(fecha_actualizacion__gte=desde), diccionarios,
+        )
+        if not len(refs):
+            return 0
+        # Fuera las versiones viejas de las filas leídas; adentro las activas
+        quedan = ~np.isin(copia.refs, refs)
+        todas = np.concatenate([copia.refs[quedan], refs[activos]])
+        orden = np.argsort(todas, kind='stable')
+        self.copia = CopiaColumnar(
+            refs=todas[orden],
+            columnas={
+                campo: np.concatenate([copia.columnas[campo][quedan], valores[activos]])[orden]
+                for campo, valores in columnas.items()
+            },
+            diccionarios=diccionarios,
+        )
+        return len(refs)
+
+    def mascara(self, iguales=None, rangos=None):
+        return self.copia.mascara(iguales, rangos)
+
+    def consultar(self, iguales=None, rangos=None, orden='ref', despues=None, limite=None):
+        return self.copia.consultar(iguales, rangos, orden, despues, limite)
+
+    def contar(self, iguales=None, rangos=None):
+        return self.copia.contar(iguales, rangos)
+
+
+_indice = IndiceColumnar()
+_candado = threading.Lock()
+
+
+def indice_columnar():
+    """La copia del proceso, al día según COLUMNAS_REFRESCO_SEGUNDOS y COLUMNAS_RECONSTRUIR_SEGUNDOS"""
+    with _candado:
+        ahora = time.monotonic()
+        if not _indice.construido or ahora - _indice.construido > settings.COLUMNAS_RECONSTRUIR_SEGUNDOS:
+            _indice.construir()
+        elif ahora - _indice.refrescado > settings.COLUMNAS_REFRESCO_SEGUNDOS:
+            _indice.refrescar()
+        return _indice
+
+
+def reconstruir_columnas():
+    """Reconstruye la copia del proceso ya (benchmarks y pruebas)"""
+    resultado = ResultadoColumnas()
+    inicio = time.perf_counter()
+    with _candado:
+        _indice.construir()
+    resultado.filas = len(_indice)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def refrescar_columnas():
+    """Aplica ya los cambios desde la marca (benchmarks y pruebas)"""
+    resultado = ResultadoColumnas()
+    inicio = time.perf_counter()
+    with _candado:
+        if not _indice.construido:
+            _indice.construir()
+        resultado.cambios = _indice.refrescar()
+    resultado.filas = len(_indice)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
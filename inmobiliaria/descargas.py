@@ -0,0 +1,320 @@
+"""
+Descarga a MEDIA_ROOT de las imágenes del feed (Imagenes.descargada = 0).
+
+Las descargas corren en asyncio con un solo cliente httpx (conexiones
+reutilizadas), un límite de concurrencia global y otro por host, y
+reintentos con espera exponencial. Los archivos van al almacén por contenido
+(almacen.py). Antes de descargar, por lote:
+
+1. las URLs que ya tiene otra fila descargada reutilizan su archivo;
+2. un HEAD obtiene el ETag, y si un archivo del almacén descargado del mismo
+   servidor tiene el mismo ETag y tamaño se reutiliza sin GET (un ETag solo
+   identifica contenido dentro de un servidor: el mtime-size de nginx, por
+   ejemplo, puede repetirse en otro).
+
+La base de datos se lee y se escribe fuera del event loop: cada lote se
+marca con un bulk_update de url_local y descargada, y sus inmuebles se tocan
+en un UPDATE (el detalle de la API muestra las URLs locales).
+"""
+import asyncio
+import hashlib
+import os
+import random
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .almacen import DIRECTORIO, etag_fuerte, extension, recontar_referencias, ruta_contenido
+from .models import ArchivosImagen, Imagenes, Inmuebles
+
+# Respuestas y errores que vale la pena reintentar
+ESTADOS_REINTENTABLES = {408, 425, 429, 500, 502, 503, 504}
+ERRORES_REINTENTABLES = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError, OSError)
+
+TAMANO_BLOQUE = 64 * 1024
+
+
+@dataclass
+class ResultadoDescargas:
+    descargadas: int = 0
+    reutilizadas: int = 0
+    deduplicadas: int = 0
+    fallidas: int = 0
+    bytes: int = 0
+    segundos: float = 0.0
+    errores: list = field(default_factory=list)
+
+    @property
+    def imagenes_por_segundo(self):
+        return (self.descargadas + self.reutilizadas) / self.segundos if self.segundos else 0.0
+
+
+@dataclass
+class Archivo:
+    digest: str
+    ruta: str
+    tamano: int
+    etag: str = None
+    host: str = None
+    # False si el contenido ya estaba en el almacén
+    nuevo: bool = True
+
+
+class ErrorDescarga(Exception):
+    pass
+
+
+def pendientes(queryset=None):
+    """Imágenes sin descargar, de la más antigua a la más nueva"""
+    queryset = Imagenes.objects.all() if queryset is None else queryset
+    return queryset.filter(Q(descargada=0) | Q(descargada__isnull=True)).order_by('pk')
+
+
+class Descargador:
+    """
+    Descarga URLs al almacén con un cliente httpx compartido.
+
+    `transport` permite inyectar un transporte httpx (pruebas o proxies).
+    """
+
+    def __init__(self, concurrencia=32, por_host=6, reintentos=3, espera=0.5,
+                 timeout=30.0, transport=None):
+        self.concurrencia = concurrencia
+        self.por_host = por_host
+        self.reintentos = reintentos
+        self.espera = espera
+        self.timeout = timeout
+        self.transport = transport
+        self.cliente = None
+        self.semaforo = None
+        self.semaforos_host = None
+
+    def _abrir(self):
+        if self.cliente is None:
+            limites = httpx.Limits(
+                max_connections=self.concurrencia,
+                max_keepalive_connections=self.concurrencia,
+            )
+            self.cliente = httpx.AsyncClient(
+                limits=limites, timeout=self.timeout, follow_redirects=True,
+                transport=self.transport,
+            )
+            self.semaforo = asyncio.Semaphore(self.concurrencia)
+            self.semaforos_host = defaultdict(lambda: asyncio.Semaphore(self.por_host))
+
+    async def cerrar(self):
+        if self.cliente is not None:
+            await self.cliente.aclose()
+            self.cliente = None
+
+    async def consultar_etags(self, urls):
+        """{url: (etag, tamaño)} de las URLs que responden el HEAD con ETag fuerte"""
+        self._abrir()
+        respuestas = await asyncio.gather(*(self._limitado(url, self._head) for url in urls))
+        return {url: respuesta for url, respuesta in zip(urls, respuestas) if respuesta}
+
+    async def descargar_lote(self, urls, raiz):
+        """{url: Archivo | mensaje de error}"""
+        self._abrir()
+        resultados = await asyncio.gather(*(
+            self._limitado(url, self._guardar, raiz) for url in urls
+        ))
+        return dict(zip(urls, resultados))
+
+    async def _limitado(self, url, funcion, *args):
+        try:
+            host = urlsplit(url).hostname or ''
+        except ValueError:
+            host = ''
+        # Primero el del host: así una imagen en espera no ocupa un cupo global
+        async with self.semaforos_host[host], self.semaforo:
+            try:
+                return await self._con_reintentos(funcion, url, *args)
+            except ErrorDescarga as error:
+                return str(error)
+
+    async def _con_reintentos(self, funcion, url, *args):
+        for intento in range(self.reintentos + 1):
+            try:
+                return await funcion(url, *args)
+            except httpx.HTTPStatusError as error:
+                codigo = error.response.status_code
+                if codigo not in ESTADOS_REINTENTABLES or intento == self.reintentos:
+                    raise ErrorDescarga(f'HTTP {codigo}')
+            except ERRORES_REINTENTABLES as error:
+                if intento == self.reintentos:
+                    raise ErrorDescarga(f'{type(error).__name__}: {error}')
+            except Exception as error:
+                # Redirecciones sin fin, URLs inválidas, contenido corrupto...:
+                # falla esta imagen y no el lote
+                raise ErrorDescarga(f'{type(error).__name__}: {error}')
+            await asyncio.sleep(self.espera * 2 ** intento * (1 + random.random() / 2))
+
+    async def _head(self, url):
+        respuesta = await self.cliente.head(url)
+        respuesta.raise_for_status()
+        etag = etag_fuerte(respuesta.headers.get('etag'))
+        tamano = respuesta.headers.get('content-length', '')
+        if etag and tamano.isdigit():
+            return etag, int(tamano)
+        return None
+
+    async def _guardar(self, url, raiz):
+        """
+        Escribe la respuesta por bloques en un temporal mientras calcula el
+        SHA-256 y lo mueve a su ruta en el almacén (o lo descarta si ya estaba).
+        """
+        temporales = os.path.join(raiz, DIRECTORIO, 'tmp')
+        os.makedirs(temporales, exist_ok=True)
+        temporal = os.path.join(temporales, f'{uuid.uuid4().hex}.part')
+        sha = hashlib.sha256()
+        inicio = b''
+        total = 0
+        try:
+            async with self.cliente.stream('GET', url) as respuesta:
+                respuesta.raise_for_status()
+                etag = etag_fuerte(respuesta.headers.get('etag'))
+                with open(temporal, 'wb') as archivo:
+                    async for bloque in respuesta.aiter_bytes(TAMANO_BLOQUE):
+                        if len(inicio) < 12:
+                            inicio += bloque[:12]
+                        sha.update(bloque)
+                        archivo.write(bloque)
+                        total += len(bloque)
+            digest = sha.hexdigest()
+            ruta = ruta_contenido(digest, extension(inicio))
+            destino = os.path.join(raiz, ruta)
+            nuevo = not os.path.exists(destino)
+            if nuevo:
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                os.replace(temporal, destino)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        return Archivo(digest, ruta, total, etag, _host(url), nuevo)
+
+
+def _host(url):
+    return urlsplit(url).netloc.lower()
+
+
+def descargar_imagenes(queryset=None, lote=500, limite=None, raiz=None,
+                       verificar_etag=True, **opciones):
+    """
+    Descarga las imágenes pendientes de `queryset` y marca las descargadas.
+
+    Los lotes se leen por pk creciente, así las que fallan no se vuelven a
+    intentar en la misma corrida. `opciones` se pasan a Descargador.
+    """
+    raiz = raiz or settings.MEDIA_ROOT
+    resultado = ResultadoDescargas()
+    descargador = Descargador(**opciones)
+    loop = asyncio.new_event_loop()
+    inicio = time.perf_counter()
+    ultimo = procesadas = 0
+    try:
+        while limite is None or procesadas < limite:
+            tamano = lote if limite is None else min(lote, limite - procesadas)
+            filas = list(
+                pendientes(queryset).filter(pk__gt=ultimo).values_list('pk', 'url', 'inmueble_id')[:tamano]
+            )
+            if not filas:
+                break
+            ultimo = filas[-1][0]
+            procesadas += len(filas)
+            _procesar_lote(filas, descargador, loop, raiz, verificar_etag, resultado)
+    finally:
+        loop.run_until_complete(descargador.cerrar())
+        loop.close()
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def _procesar_lote(filas, descargador, loop, raiz, verificar_etag, resultado):
+    urls = {url for _, url, _ in filas}
+    # 1. URLs que ya descargó otra fila
+    rutas = dict(
+        Imagenes.objects.filter(url__in=urls, descargada=1, url_local__isnull=False)
+        .values_list('url', 'url_local')
+    )
+    faltantes = sorted(urls - rutas.keys())
+
+    # 2. Mismo servidor, ETag y tamaño que un archivo del almacén
+    if faltantes and verificar_etag:
+        etags = {
+            url: respuesta
+            for url, respuesta in loop.run_until_complete(
+                descargador.consultar_etags(faltantes)
+            ).items()
+            if isinstance(respuesta, tuple)
+        }
+        conocidos = {
+            (host, etag, tamano): ruta
+            for host, etag, tamano, ruta in ArchivosImagen.objects.filter(
+                etag__in={etag for etag, _ in etags.values()},
+                host__in={_host(url) for url in etags},
+            ).values_list('host', 'etag', 'tamano', 'ruta')
+        }
+        for url, (etag, tamano) in etags.items():
+            clave = (_host(url), etag, tamano)
+            if clave in conocidos:
+                rutas[url] = conocidos[clave]
+        faltantes = [url for url in faltantes if url not in rutas]
+    reutilizadas = set(rutas)
+
+    # 3. Descarga del resto
+    errores, nuevos = {}, {}
+    if faltantes:
+        for url, archivo in loop.run_until_complete(
+            descargador.descargar_lote(faltantes, raiz)
+        ).items():
+            if isinstance(archivo, str):
+                errores[url] = archivo
+                continue
+            rutas[url] = archivo.ruta
+            resultado.bytes += archivo.tamano
+            if archivo.nuevo:
+                nuevos[archivo.digest] = archivo
+            else:
+                resultado.deduplicadas += 1
+
+    with transaction.atomic():
+        ArchivosImagen.objects.bulk_create([
+            ArchivosImagen(digest=a.digest, ruta=a.ruta, tamano=a.tamano, etag=a.etag, host=a.host)
+            for a in nuevos.values()
+        ], ignore_conflicts=True)
+        # Bloquea los archivos del almacén que se van a usar, como
+        # almacen.limpiar antes de borrar: un huérfano que ya se borró no se
+        # reutiliza, y uno bloqueado aquí ya no se borra
+        del_almacen = {ruta for ruta in rutas.values() if ruta.startswith(f'{DIRECTORIO}/')}
+        vigentes = set(
+            ArchivosImagen.objects.select_for_update().filter(ruta__in=del_almacen)
+            .values_list('ruta', flat=True)
+        )
+        for url in [url for url, ruta in rutas.items() if ruta in del_almacen - vigentes]:
+            del rutas[url]
+            errores[url] = 'El archivo se borró del almacén; se reintenta en otra pasada'
+
+        marcadas, inmuebles = [], set()
+        for pk, url, inmueble_id in filas:
+            if url not in rutas:
+                resultado.fallidas += 1
+                resultado.errores.append((pk, errores.get(url)))
+                continue
+            marcadas.append(Imagenes(pk=pk, url_local=rutas[url], descargada=1))
+            inmuebles.add(inmueble_id)
+            if url in reutilizadas:
+                resultado.reutilizadas += 1
+            else:
+                resultado.descargadas += 1
+
+        Imagenes.objects.bulk_update(marcadas, ['url_local', 'descargada'])
+        Inmuebles.objects.filter(pk__in=inmuebles - {None}).tocar()
+        recontar_referencias({imagen.url_local for imagen in marcadas})
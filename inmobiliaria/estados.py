@@ -0,0 +1,186 @@
+"""
+Reconciliación de InmueblesEstados con la tabla inmuebles.
+
+inmuebles_estados guarda activo, destacado y en_caliente definidos en el admin
+para que sobrevivan a la sincronización. Ambos sentidos se hacen con SQL por
+conjuntos (UPDATE ... JOIN / INSERT ... SELECT) en lotes, nunca fila por fila.
+"""
+import time
+from dataclasses import dataclass, field
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .facets import invalidar_facetas
+from .mapa import actualizar_celdas
+from .models import Inmuebles, InmueblesEstados
+
+CAMPOS_ESTADO = ('activo', 'destacado', 'en_caliente')
+
+INMUEBLES = Inmuebles._meta.db_table
+ESTADOS = InmueblesEstados._meta.db_table
+
+JOIN = 'i.ref = e.inmueble_ref AND i.codigo_sincronizacion = e.codigo_sincronizacion'
+
+
+@dataclass
+class ResultadoEstados:
+    filas: int = 0
+    segundos: float = 0.0
+    # Solo en dry-run: campo -> filas que cambiarían, y una muestra
+    diferencias: dict = field(default_factory=dict)
+    muestra: list = field(default_factory=list)
+
+
+def distinto(connection, a, b):
+    """Comparación que trata NULL como valor (a IS DISTINCT FROM b)"""
+    if connection.vendor == 'mysql':
+        return f'NOT ({a} <=> {b})'
+    return f'{a} IS NOT {b}'
+
+
+def condicion_diferencia(connection):
+    """Algún estado guardado difiere del valor actual del inmueble"""
+    return ' OR '.join(
+        f'(e.{campo} IS NOT NULL AND {distinto(connection, f"i.{campo}", f"e.{campo}")})'
+        for campo in CAMPOS_ESTADO
+    )
+
+
+def _rangos_ids(connection, lote):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(id), MAX(id) FROM {ESTADOS}')
+        minimo, maximo = cursor.fetchone()
+    if minimo is None:
+        return
+    for inicio in range(minimo, maximo + 1, lote):
+        yield inicio, inicio + lote - 1
+
+
+def _sql_aplicar(connection):
+    diferencia = condicion_diferencia(connection)
+    if connection.vendor == 'mysql':
+        asignaciones = ', '.join(
+            f'i.{campo} = COALESCE(e.{campo}, i.{campo})' for campo in CAMPOS_ESTADO
+        )
+        # fecha_actualizacion cambia la versión del detalle en la API
+        return (
+            f'UPDATE {INMUEBLES} i JOIN {ESTADOS} e ON {JOIN} '
+            f'SET {asignaciones}, i.fecha_actualizacion = %s '
+            f'WHERE e.id BETWEEN %s AND %s AND ({diferencia})'
+        )
+    # SQLite 3.33+ / PostgreSQL: UPDATE ... FROM
+    asignaciones = ', '.join(
+        f'{campo} = COALESCE(e.{campo}, i.{campo})' for campo in CAMPOS_ESTADO
+    )
+    return (
+        f'UPDATE {INMUEBLES} AS i SET {asignaciones}, fecha_actualizacion = %s FROM {ESTADOS} AS e '
+        f'WHERE {JOIN} AND e.id BETWEEN %s AND %s AND ({diferencia})'
+    )
+
+
+def aplicar_estados(dry_run=False, lote=5000, using='default'):
+    """
+    Copia los estados guardados sobre inmuebles, un UPDATE ... JOIN por lote.
+
+    Los lotes son rangos de id de inmuebles_estados. Con dry_run solo cuenta
+    las diferencias por campo y devuelve una muestra.
+    """
+    connection = connections[using]
+    resultado = ResultadoEstados()
+    inicio = time.perf_counter()
+    if dry_run:
+        _diferencias(connection, resultado)
+    else:
+        sql = _sql_aplicar(connection)
+        # Celdas de las filas que van a cambiar, antes de cambiarlas
+        sql_celdas = (
+            f'SELECT DISTINCT i.geohash FROM {INMUEBLES} i JOIN {ESTADOS} e ON {JOIN} '
+            f'WHERE e.id BETWEEN %s AND %s AND i.geohash IS NOT NULL '
+            f'AND ({condicion_diferencia(connection)})'
+        )
+        ahora = connection.ops.adapt_datetimefield_value(timezone.now())
+        geohashes = set()
+        for desde, hasta in _rangos_ids(connection, lote):
+            with transaction.atomic(using=using), connection.cursor() as cursor:
+                cursor.execute(sql_celdas, [desde, hasta])
+                geohashes.update(geohash for geohash, in cursor.fetchall())
+                cursor.execute(sql, [ahora, desde, hasta])
+                resultado.filas += cursor.rowcount
+        if resultado.filas:
+            invalidar_facetas()
+            # Solo las celdas tocadas; con demasiadas, actualizar_celdas reconstruye
+            actualizar_celdas(geohashes)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def _diferencias(connection, resultado, muestra=20):
+    base = f'FROM {INMUEBLES} i JOIN {ESTADOS} e ON {JOIN}'
+    conteos = ', '.join(
+        f'SUM(CASE WHEN e.{campo} IS NOT NULL AND '
+        f'{distinto(connection, f"i.{campo}", f"e.{campo}")} THEN 1 ELSE 0 END)'
+        for campo in CAMPOS_ESTADO
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*), {conteos} {base} WHERE {condicion_diferencia(connection)}')
+        total, *por_campo = cursor.fetchone()
+        resultado.filas = total
+        resultado.diferencias = dict(zip(CAMPOS_ESTADO, (n or 0 for n in por_campo)))
+        columnas = ', '.join(f'i.{campo}, e.{campo}' for campo in CAMPOS_ESTADO)
+        cursor.execute(
+            f'SELECT i.ref, {columnas} {base} WHERE {condicion_diferencia(connection)} '
+            f'ORDER BY i.ref LIMIT {int(muestra)}'
+        )
+        resultado.muestra = cursor.fetchall()
+
+
+def capturar_estados(refs, lote=1000, using='default'):
+    """
+    Guarda en inmuebles_estados el estado actual de los inmuebles `refs`.
+
+    Por lote: un UPDATE ... JOIN para los que ya tienen estado y un
+    INSERT ... SELECT para los que no.
+    """
+    connection = connections[using]
+    resultado = ResultadoEstados()
+    inicio = time.perf_counter()
+    ahora = connection.ops.adapt_datetimefield_value(timezone.now())
+    refs = list(refs)
+    for desde in range(0, len(refs), lote):
+        grupo = refs[desde:desde + lote]
+        marcadores = ', '.join(['%s'] * len(grupo))
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(_sql_capturar_actualizar(connection, marcadores), [ahora, ahora, *grupo])
+            resultado.filas += cursor.rowcount
+            cursor.execute(
+                f'INSERT INTO {ESTADOS} (inmueble_ref, codigo_sincronizacion, '
+                f'{", ".join(CAMPOS_ESTADO)}, fecha_modificacion, created_at, updated_at) '
+                f'SELECT i.ref, i.codigo_sincronizacion, '
+                f'{", ".join(f"i.{campo}" for campo in CAMPOS_ESTADO)}, %s, %s, %s '
+                f'FROM {INMUEBLES} i LEFT JOIN {ESTADOS} e ON {JOIN} '
+                f'WHERE i.ref IN ({marcadores}) AND e.id IS NULL '
+                f'AND i.codigo_sincronizacion IS NOT NULL',
+                [ahora, ahora, ahora, *grupo],
+            )
+            resultado.filas += cursor.rowcount
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def _sql_capturar_actualizar(connection, marcadores):
+    diferencia = ' OR '.join(
+        distinto(connection, f'e.{campo}', f'i.{campo}') for campo in CAMPOS_ESTADO
+    )
+    if connection.vendor == 'mysql':
+        asignaciones = ', '.join(f'e.{campo} = i.{campo}' for campo in CAMPOS_ESTADO)
+        return (
+            f'UPDATE {ESTADOS} e JOIN {INMUEBLES} i ON {JOIN} '
+            f'SET {asignaciones}, e.fecha_modificacion = %s, e.updated_at = %s '
+            f'WHERE i.ref IN ({marcadores}) AND ({diferencia})'
+        )
+    asignaciones = ', '.join(f'{campo} = i.{campo}' for campo in CAMPOS_ESTADO)
+    return (
+        f'UPDATE {ESTADOS} AS e SET {asignaciones}, fecha_modificacion = %s, updated_at = %s '
+        f'FROM {INMUEBLES} AS i WHERE {JOIN} AND i.ref IN ({marcadores}) AND ({diferencia})'
+    )
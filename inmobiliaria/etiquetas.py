@@ -0,0 +1,265 @@
+"""
+Índice de bits en memoria de las etiquetas de los inmuebles.
+
+Filtrar por varias etiquetas ("mascotas" y "vista" y no "remate") con
+inmuebles_etiquetas cuesta un JOIN (o un NOT EXISTS) por etiqueta. El índice
+guarda, por etiqueta, el conjunto de refs de sus inmuebles como un Bitmap: un
+entero de Python por bloque de 2**16 refs, sin los bloques vacíos. AND, OR y
+NOT son operaciones de enteros, y la API pasa a la base de datos solo las
+refs candidatas: el listado, en orden, las siguientes al cursor, y los
+conteos todas (o, si son demasiadas, las subconsultas de siempre).
+
+Cada proceso tiene su índice. Las señales de InmueblesEtiquetas lo
+actualizan al confirmar la transacción y cambian la versión en la caché;
+los demás procesos ven la versión nueva (con CACHE_BACKEND=file) y lo
+reconstruyen, igual que cuando pasan ETIQUETAS_INDICE_SEGUNDOS, por si se
+escribió en la tabla por fuera de Django.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .facets import invalidar_facetas
+from .models import Inmuebles, InmueblesEtiquetas
+from .transacciones import al_confirmar
+
+BITS_BLOQUE = 16
+MASCARA_BLOQUE = (1 << BITS_BLOQUE) - 1
+VERSION_KEY = 'etiquetas:indice:version'
+
+# Con más candidatos que esto, un IN con las refs ya no conviene
+MAXIMO_CANDIDATOS = 10_000
+
+
+class Bitmap:
+    """Conjunto de enteros no negativos como bits, por bloques de 2**16"""
+
+    __slots__ = ('bloques',)
+
+    def __init__(self, ids=(), bloques=None):
+        self.bloques = dict(bloques or {})
+        for pk in ids:
+            self.agregar(pk)
+
+    def agregar(self, pk):
+        bloque = pk >> BITS_BLOQUE
+        self.bloques[bloque] = self.bloques.get(bloque, 0) | (1 << (pk & MASCARA_BLOQUE))
+
+    def quitar(self, pk):
+        bloque = pk >> BITS_BLOQUE
+        bits = self.bloques.get(bloque, 0) & ~(1 << (pk & MASCARA_BLOQUE))
+        if bits:
+            self.bloques[bloque] = bits
+        else:
+            self.bloques.pop(bloque, None)
+
+    def __contains__(self, pk):
+        return bool(self.bloques.get(pk >> BITS_BLOQUE, 0) >> (pk & MASCARA_BLOQUE) & 1)
+
+    def __len__(self):
+        return sum(bits.bit_count() for bits in self.bloques.values())
+
+    def __and__(self, otro):
+        bloques = {}
+        for bloque, bits in self.bloques.items():
+            comunes = bits & otro.bloques.get(bloque, 0)
+            if comunes:
+                bloques[bloque] = comunes
+        return Bitmap(bloques=bloques)
+
+    def __or__(self, otro):
+        bloques = dict(self.bloques)
+        for bloque, bits in otro.bloques.items():
+            bloques[bloque] = bloques.get(bloque, 0) | bits
+        return Bitmap(bloques=bloques)
+
+    def __sub__(self, otro):
+        bloques = {}
+        for bloque, bits in self.bloques.items():
+            restantes = bits & ~otro.bloques.get(bloque, 0)
+            if restantes:
+                bloques[bloque] = restantes
+        return Bitmap(bloques=bloques)
+
+    def __iter__(self):
+        return self.desde(0)
+
+    def desde(self, inicio):
+        """Los valores mayores o iguales a `inicio`, en orden ascendente"""
+        primero = inicio >> BITS_BLOQUE
+        for bloque in sorted(b for b in self.bloques if b >= primero):
+            bits, base = self.bloques[bloque], bloque << BITS_BLOQUE
+            if bloque == primero:
+                bits &= ~((1 << (inicio & MASCARA_BLOQUE)) - 1)
+            while bits:
+                menor = bits & -bits
+                yield base + menor.bit_length() - 1
+                bits ^= menor
+
+
+class IndiceEtiquetas:
+    """{etiqueta_id: Bitmap de refs} de todas las etiquetas"""
+
+    def __init__(self):
+        self.bitmaps = {}
+        self.version = None
+        self.construido = 0.0
+
+    def construir(self):
+        """Lee inmuebles_etiquetas completa: una consulta"""
+        bitmaps = {}
+        for etiqueta_id, ref in InmueblesEtiquetas.objects.values_list('etiqueta_id', 'inmueble__ref'):
+            bitmaps.setdefault(etiqueta_id, Bitmap()).agregar(ref)
+        self.bitmaps = bitmaps
+        self.construido = time.monotonic()
+
+    def actualizar(self, inmuebles):
+        """
+        Vuelve a leer las etiquetas de esos inmuebles (ids): dos consultas.
+
+        Los Bitmaps publicados no se modifican: las etiquetas tocadas se
+        copian y self.bitmaps se reemplaza de una vez, porque las consultas
+        los recorren sin el candado.
+        """
+        quitados = Bitmap(Inmuebles.objects.filter(pk__in=inmuebles).values_list('ref', flat=True))
+        nuevos = {}
+        for etiqueta_id, ref in InmueblesEtiquetas.objects.filter(
+            inmueble_id__in=inmuebles
+        ).values_list('etiqueta_id', 'inmueble__ref'):
+            nuevos.setdefault(etiqueta_id, []).append(ref)
+        bitmaps = dict(self.bitmaps)
+        tocadas = {etiqueta_id for etiqueta_id, bitmap in bitmaps.items() if bitmap & quitados}
+        for etiqueta_id in tocadas | nuevos.keys():
+            restantes = self.bitmap(etiqueta_id) - quitados
+            bitmaps[etiqueta_id] = Bitmap(nuevos.get(etiqueta_id, ()), bloques=restantes.bloques)
+        self.bitmaps = bitmaps
+
+    def bitmap(self, etiqueta_id, bitmaps=None):
+        bitmaps = self.bitmaps if bitmaps is None else bitmaps
+        return bitmaps.get(etiqueta_id) or Bitmap()
+
+    def consultar(self, todas=(), alguna=(), ninguna=()):
+        """
+        (candidatos, excluidos): los inmuebles con todas las etiquetas de
+        `todas` y al menos una de `alguna` (None si no se pidió ninguna de
+        las dos), y los que tienen alguna de `ninguna`.
+        """
+        # Una sola lectura: actualizar() puede reemplazar el diccionario
+        bitmaps = self.bitmaps
+        candidatos = None
+        for etiqueta_id in todas:
+            bitmap = self.bitmap(etiqueta_id, bitmaps)
+            candidatos = bitmap if candidatos is None else candidatos & bitmap
+        if alguna:
+            algunos = Bitmap()
+            for etiqueta_id in alguna:
+                algunos = algunos | self.bitmap(etiqueta_id, bitmaps)
+            candidatos = algunos if candidatos is None else candidatos & algunos
+        excluidos = Bitmap()
+        for etiqueta_id in ninguna:
+            excluidos = excluidos | self.bitmap(etiqueta_id, bitmaps)
+        return candidatos, excluidos
+
+
+_indice = IndiceEtiquetas()
+_candado = threading.Lock()
+
+
+def _version_compartida():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(VERSION_KEY, version, None)
+        version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def indice_etiquetas():
+    """El índice del proceso, reconstruido si otro proceso lo cambió o si venció"""
+    version = _version_compartida()
+    with _candado:
+        vencido = time.monotonic() - _indice.construido > settings.ETIQUETAS_INDICE_SEGUNDOS
+        if _indice.version != version or vencido:
+            _indice.construir()
+            _indice.version = version
+        return _indice
+
+
+def actualizar_indice(inmuebles):
+    """Actualiza el índice del proceso y avisa a los demás con una versión nueva"""
+    ids = {pk for pk in inmuebles if pk is not None}
+    if not ids:
+        return
+    with _candado:
+        antes = cache.get(VERSION_KEY)
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            version = time.time_ns()
+            cache.set(VERSION_KEY, version, None)
+        # Solo si nadie más lo cambió entre medio; si no, se reconstruye al usarlo
+        if _indice.version is not None and _indice.version == antes and version == antes + 1:
+            _indice.actualizar(ids)
+            _indice.version = version
+    invalidar_facetas()
+
+
+def invalidar_indice():
+    """Obliga a todos los procesos a reconstruir el índice (tras cargas sin señales)"""
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def programar_indice(inmuebles):
+    """Actualiza el índice al confirmar la transacción en curso"""
+    al_confirmar(actualizar_indice, inmuebles)
+
+
+def _subconsulta(etiquetas):
+    return InmueblesEtiquetas.objects.filter(etiqueta_id__in=etiquetas).values('inmueble_id')
+
+
+def candidatos_etiquetas(todas=(), alguna=(), ninguna=()):
+    """
+    Bitmap de las refs con todas las etiquetas de `todas`, alguna de
+    `alguna` y ninguna de `ninguna`; None si solo se pidió `ninguna`.
+    """
+    candidatos, excluidos = indice_etiquetas().consultar(todas, alguna, ninguna)
+    return None if candidatos is None else candidatos - excluidos
+
+
+def filtro_etiquetas(todas=(), alguna=(), ninguna=()):
+    """
+    Q de los inmuebles con todas las etiquetas de `todas`, alguna de
+    `alguna` y ninguna de `ninguna`. Con el índice, un IN de las refs
+    candidatas; si pasan de MAXIMO_CANDIDATOS, una subconsulta por etiqueta.
+    """
+    candidatos, excluidos = indice_etiquetas().consultar(todas, alguna, ninguna)
+    if candidatos is not None:
+        candidatos = candidatos - excluidos
+        if len(candidatos) <= MAXIMO_CANDIDATOS:
+            return Q(ref__in=list(candidatos))
+    filtro = Q()
+    for etiqueta_id in todas:
+        filtro &= Q(pk__in=_subconsulta([etiqueta_id]))
+    if alguna:
+        filtro &= Q(pk__in=_subconsulta(alguna))
+    if ninguna:
+        if len(excluidos) <= MAXIMO_CANDIDATOS:
+            filtro &= ~Q(ref__in=list(excluidos))
+        else:
+            filtro &= ~Q(pk__in=_subconsulta(ninguna))
+    return filtro
+
+
+def filtrar_joins(queryset, todas=(), alguna=(), ninguna=()):
+    """Los mismos filtros con un JOIN por etiqueta y DISTINCT (para comparar)"""
+    for etiqueta_id in todas:
+        queryset = queryset.filter(inmueblesetiquetas__etiqueta_id=etiqueta_id)
+    if alguna:
+        queryset = queryset.filter(inmueblesetiquetas__etiqueta_id__in=alguna).distinct()
+    if ninguna:
+        queryset = queryset.exclude(inmueblesetiquetas__etiqueta_id__in=ninguna)
+    return queryset
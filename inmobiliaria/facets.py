@@ -0,0 +1,114 @@
+"""
+Conteos por valor (facetas) cacheados para los filtros del admin.
+
+Cada conteo sale de un solo GROUP BY y se guarda en la caché de Django bajo
+una versión global. Cualquier escritura en inmuebles, imágenes o tablas de
+catálogo cambia la versión (ver signals.py) y deja obsoletos todos los
+conteos sin tener que borrarlos uno por uno.
+
+La versión vive en la base de datos (versiones_cache), no en la caché: con
+la caché en memoria de cada proceso, una escritura en un worker no llegaría a
+los demás. Se sube una vez al confirmar la transacción (antes, otro proceso
+podría guardar bajo la versión nueva conteos sin la escritura) y cada proceso
+la relee como mucho cada FACETAS_VERSION_SEGUNDOS.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F
+
+from .models import VersionesCache
+from .transacciones import al_confirmar
+
+VERSION_CLAVE = 'facetas'
+# Contadores de la caché de facetas de la API (ver estadisticas_facetas)
+CONTADORES = ('aciertos', 'fallos', 'calculo_us')
+
+# (versión, momento de la lectura) en este proceso
+_version = [None, 0.0]
+_candado = threading.Lock()
+
+
+def version_facetas():
+    with _candado:
+        valor, leida = _version
+        if valor is None or time.monotonic() - leida > settings.FACETAS_VERSION_SEGUNDOS:
+            valor = VersionesCache.objects.filter(clave=VERSION_CLAVE).values_list('valor', flat=True).first() or 0
+            _version[:] = [valor, time.monotonic()]
+        return valor
+
+
+def invalidar_facetas(**kwargs):
+    """Invalida todos los conteos al confirmar; sirve también como receptor de señales"""
+    al_confirmar(_subir_versiones, {VERSION_CLAVE})
+
+
+def olvidar_version_facetas():
+    """La próxima lectura va a la base de datos"""
+    with _candado:
+        _version[0] = None
+
+
+def _subir_versiones(claves):
+    for clave in claves:
+        if not VersionesCache.objects.filter(clave=clave).update(valor=F('valor') + 1):
+            # Empieza en un valor que no repite versiones de una fila borrada
+            VersionesCache.objects.get_or_create(clave=clave, defaults={'valor': time.time_ns()})
+    # Este proceso ve su propia escritura ya
+    olvidar_version_facetas()
+
+
+def conteos_por_valor(modelo, campo, campo_nombre='nombre', filtros=None):
+    """
+    [(pk, nombre, total)] de los valores de `campo` que aparecen en `modelo`.
+    
+    `campo` puede cruzar relaciones (p. ej. 'inmueble__ciudad'); el nombre
+    se trae con un JOIN en la misma consulta.
+    """
+    filtros = filtros or {}
+    clave = ':'.join([
+        'facetas', str(version_facetas()), modelo._meta.label_lower, campo,
+        *(f'{k}={v}' for k, v in sorted(filtros.items())),
+    ])
+    conteos = cache.get(clave)
+    if conteos is None:
+        conteos = list(
+            modelo._default_manager.filter(**filtros)
+            .values_list(campo, f'{campo}__{campo_nombre}')
+            .annotate(total=Count('pk'))
+            .order_by(f'{campo}__{campo_nombre}')
+        )
+        cache.set(clave, conteos, settings.FACETAS_CACHE_SEGUNDOS)
+    return conteos
+
+
+def incrementar(clave, valor=1, backend=None):
+    """Suma `valor` a un contador de la caché, creándolo si no existe"""
+    backend = backend or cache
+    try:
+        backend.incr(clave, valor)
+    except ValueError:
+        backend.add(clave, 0, None)
+        backend.incr(clave, valor)
+
+
+def registrar_uso(acierto, segundos=0.0):
+    """Suma un acierto, o un fallo con su tiempo de cálculo, a los contadores"""
+    nombres = {'aciertos': 1} if acierto else {'fallos': 1, 'calculo_us': int(segundos * 1_000_000)}
+    for nombre, valor in nombres.items():
+        incrementar(f'facetas:contador:{nombre}', valor)
+
+
+def estadisticas_facetas():
+    """Aciertos, fallos, proporción de aciertos y ms promedio de cálculo"""
+    valores = cache.get_many([f'facetas:contador:{nombre}' for nombre in CONTADORES])
+    aciertos, fallos, calculo_us = (valores.get(f'facetas:contador:{n}', 0) for n in CONTADORES)
+    consultas = aciertos + fallos
+    return {
+        'aciertos': aciertos,
+        'fallos': fallos,
+        'proporcion_aciertos': aciertos / consultas if consultas else 0.0,
+        'calculo_ms_promedio': calculo_us / fallos / 1000 if fallos else 0.0,
+    }
@@ -0,0 +1,72 @@
+from django.contrib import admin
+from django.utils.translation import gettext_lazy as _
+
+from .facets import conteos_por_valor
+
+
+class FacetaCacheadaListFilter(admin.RelatedFieldListFilter):
+    """
+    Filtro de relación que solo lista los valores usados, con su conteo.
+    
+    A diferencia de RelatedFieldListFilter no carga la tabla de catálogo
+    completa: los valores y conteos salen de conteos_por_valor(), cacheados.
+    """
+    
+    # Campo del que depende este filtro (p. ej. barrio depende de ciudad)
+    depende_de = None
+    
+    def field_choices(self, field, request, model_admin):
+        self.conteos = {}
+        filtros = self.filtros_dependencia(request)
+        if filtros is None:
+            return []
+        choices = []
+        for pk, nombre, total in conteos_por_valor(model_admin.model, self.field_path, filtros=filtros):
+            self.conteos[pk] = total
+            if pk is not None:
+                choices.append((pk, nombre))
+        return choices
+    
+    def filtros_dependencia(self, request):
+        """Filtros del GROUP BY; None si falta seleccionar el campo padre"""
+        if self.depende_de is None:
+            return {}
+        valor = request.GET.get(f'{self.depende_de}__id__exact')
+        if not valor:
+            return None
+        return {f'{self.depende_de}__id': valor}
+    
+    def has_output(self):
+        # Mantener visible un valor ya seleccionado aunque falte el padre
+        return bool(self.lookup_choices) or self.lookup_val is not None
+    
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None and not self.lookup_val_isnull,
+            'query_string': changelist.get_query_string(
+                remove=[self.lookup_kwarg, self.lookup_kwarg_isnull]
+            ),
+            'display': _('All'),
+        }
+        for pk, nombre in self.lookup_choices:
+            yield {
+                'selected': self.lookup_val is not None and str(pk) in self.lookup_val,
+                'query_string': changelist.get_query_string(
+                    {self.lookup_kwarg: pk}, [self.lookup_kwarg_isnull]
+                ),
+                'display': f'{nombre} ({self.conteos[pk]})',
+            }
+        if self.include_empty_choice and self.conteos.get(None):
+            yield {
+                'selected': bool(self.lookup_val_isnull),
+                'query_string': changelist.get_query_string(
+                    {self.lookup_kwarg_isnull: 'True'}, [self.lookup_kwarg]
+                ),
+                'display': f'{self.empty_value_display} ({self.conteos[None]})',
+            }
+
+
+class BarrioPorCiudadListFilter(FacetaCacheadaListFilter):
+    """Barrios de la ciudad seleccionada; sin ciudad no se lista ninguno"""
+    
+    depende_de = 'ciudad'
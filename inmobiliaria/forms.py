@@ -1,5 +1,7 @@
 from django import forms
 from django.conf import settings
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.forms.models import BaseInlineFormSet
 from tinymce.widgets import TinyMCE
 from .models import Etiquetas, Inmuebles
 
@@ -22,6 +24,55 @@ class CurrencyWidget(forms.TextInput):
             'all': ('admin/css/currency-widget.css',)
         }
 
+class AutocompleteSelectPrecargado(AutocompleteSelect):
+    """
+    Autocomplete que reutiliza el objeto relacionado ya cargado en la instancia.
+    
+    El AutocompleteSelect de Django consulta la opción seleccionada en cada
+    fila del inline; con precarga se arma la opción sin ir a la base de datos.
+    """
+    
+    precargados = None
+    
+    def precargar(self, instance, nombre):
+        """Toma el objeto relacionado si select_related ya lo dejó en caché"""
+        campo = instance._meta.get_field(nombre)
+        if campo.is_cached(instance):
+            obj = getattr(instance, nombre)
+            self.precargados = {}
+            if obj is not None:
+                self.precargados[str(getattr(obj, campo.target_field.attname))] = obj
+        elif getattr(instance, campo.attname) is None:
+            self.precargados = {}
+    
+    def optgroups(self, name, value, attr=None):
+        seleccionados = {
+            str(v) for v in value if str(v) not in self.choices.field.empty_values
+        }
+        if self.precargados is None or not seleccionados <= self.precargados.keys():
+            return super().optgroups(name, value, attr)
+        
+        default = (None, [], 0)
+        if not self.is_required:
+            default[1].append(self.create_option(name, '', '', False, 0))
+        for clave in seleccionados:
+            obj = self.precargados[clave]
+            default[1].append(self.create_option(
+                name, clave, self.choices.field.label_from_instance(obj),
+                True, len(default[1]),
+            ))
+        return [default]
+
+class RelacionesPrecargadasFormSet(BaseInlineFormSet):
+    """Formset inline que entrega a los autocompletes los objetos ya unidos"""
+    
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        for nombre, campo in form.fields.items():
+            widget = getattr(campo.widget, 'widget', campo.widget)
+            if isinstance(widget, AutocompleteSelectPrecargado):
+                widget.precargar(form.instance, nombre)
+
 class EtiquetasForm(forms.ModelForm):
     class Meta:
         model = Etiquetas
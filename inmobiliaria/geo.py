@@ -0,0 +1,233 @@
+"""
+Coordenadas numéricas y búsqueda por zona de inmuebles.
+
+latitud y longitud llegan del feed como texto. latitud_num, longitud_num y
+geohash se calculan al sincronizar (y al guardar desde el admin); el comando
+rellenar_coordenadas los calcula para las filas existentes.
+
+El geohash tiene índice B-tree: una caja (o el cuadrado que rodea un radio)
+se cubre con pocos prefijos de geohash y cada prefijo es un rango del índice
+(`geohash >= 'd6n' AND geohash < 'd6p'`), en MySQL y en SQLite. Después se recorta con las
+columnas numéricas y se ordena por distancia.
+"""
+import math
+import re
+import time
+from dataclasses import dataclass
+
+from django.db import connections, transaction
+from django.db.models import F, Q
+
+PRECISION = 9
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+RADIO_TIERRA_KM = 6371.0088
+
+# Máximo de prefijos con que se cubre una caja
+MAXIMO_CELDAS = 16
+
+_NUMERO = re.compile(r'[-+]?\d+(?:[.,]\d+)?')
+
+
+def leer_coordenada(texto, limite):
+    """
+    Número de una coordenada escrita a mano ('8.7512', ' 8,7512° ', '-75.88N');
+    None si no se entiende o está fuera de [-limite, limite].
+    """
+    if texto is None:
+        return None
+    if isinstance(texto, (int, float)):
+        valor = float(texto)
+    else:
+        encontrado = _NUMERO.search(str(texto))
+        if not encontrado:
+            return None
+        valor = float(encontrado.group().replace(',', '.'))
+    if math.isnan(valor) or not -limite <= valor <= limite:
+        return None
+    return valor
+
+
+def coordenadas(latitud, longitud):
+    """(lat, lng) numéricas o None; (0, 0) cuenta como dato faltante"""
+    lat = leer_coordenada(latitud, 90)
+    lng = leer_coordenada(longitud, 180)
+    if lat is None or lng is None or (lat == 0 and lng == 0):
+        return None
+    return lat, lng
+
+
+def campos_geo(latitud, longitud):
+    """Valores de latitud_num, longitud_num y geohash para el texto del feed"""
+    punto = coordenadas(latitud, longitud)
+    if punto is None:
+        return {'latitud_num': None, 'longitud_num': None, 'geohash': None}
+    return {'latitud_num': punto[0], 'longitud_num': punto[1], 'geohash': geohash(*punto)}
+
+
+@dataclass
+class ResultadoCoordenadas:
+    validas: int = 0
+    invalidas: int = 0
+    segundos: float = 0.0
+
+
+def rellenar(queryset, lote=2000):
+    """
+    Calcula latitud_num, longitud_num y geohash de los inmuebles de
+    `queryset`, por lotes de pk. Cada lote es un executemany de UPDATE por
+    pk: bulk_update armaría un CASE con una rama por fila y por columna.
+    """
+    resultado = ResultadoCoordenadas()
+    connection = connections[queryset.db]
+    sql = (
+        f'UPDATE {connection.ops.quote_name(queryset.model._meta.db_table)} '
+        f'SET latitud_num = %s, longitud_num = %s, geohash = %s WHERE id = %s'
+    )
+    inicio = time.perf_counter()
+    ultimo = 0
+    while True:
+        filas = list(
+            queryset.filter(pk__gt=ultimo).order_by('pk')
+            .values_list('pk', 'latitud', 'longitud')[:lote]
+        )
+        if not filas:
+            break
+        ultimo = filas[-1][0]
+        parametros = []
+        for pk, latitud, longitud in filas:
+            campos = campos_geo(latitud, longitud)
+            if campos['geohash'] is None:
+                resultado.invalidas += 1
+            else:
+                resultado.validas += 1
+            parametros.append((campos['latitud_num'], campos['longitud_num'], campos['geohash'], pk))
+        with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+            cursor.executemany(sql, parametros)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def geohash(lat, lng, precision=PRECISION):
+    rango_lat, rango_lng = [-90.0, 90.0], [-180.0, 180.0]
+    bits, es_lng, caracteres, valor = 0, True, [], 0
+    while len(caracteres) < precision:
+        rango, coordenada = (rango_lng, lng) if es_lng else (rango_lat, lat)
+        medio = (rango[0] + rango[1]) / 2
+        valor <<= 1
+        if coordenada >= medio:
+            valor |= 1
+            rango[0] = medio
+        else:
+            rango[1] = medio
+        es_lng = not es_lng
+        bits += 1
+        if bits == 5:
+            caracteres.append(BASE32[valor])
+            bits, valor = 0, 0
+    return ''.join(caracteres)
+
+
+def tamano_celda(precision):
+    """(alto, ancho) en grados de una celda de geohash"""
+    bits_lng = math.ceil(5 * precision / 2)
+    bits_lat = 5 * precision // 2
+    return 180 / 2 ** bits_lat, 360 / 2 ** bits_lng
+
+
+def contar_celdas(min_lat, min_lng, max_lat, max_lng, precision):
+    """Cuántas celdas de la precisión tocan la caja"""
+    alto, ancho = tamano_celda(precision)
+    filas = math.floor(max_lat / alto) - math.floor(min_lat / alto) + 1
+    columnas = math.floor(max_lng / ancho) - math.floor(min_lng / ancho) + 1
+    return filas * columnas
+
+
+def celdas_caja(min_lat, min_lng, max_lat, max_lng, precision):
+    """Geohashes de la precisión que tocan la caja"""
+    alto, ancho = tamano_celda(precision)
+    filas = math.floor(max_lat / alto) - math.floor(min_lat / alto) + 1
+    columnas = math.floor(max_lng / ancho) - math.floor(min_lng / ancho) + 1
+    celdas = set()
+    for fila in range(filas):
+        lat = min(max_lat, (math.floor(min_lat / alto) + fila + 0.5) * alto)
+        for columna in range(columnas):
+            lng = min(max_lng, (math.floor(min_lng / ancho) + columna + 0.5) * ancho)
+            celdas.add(geohash(max(lat, min_lat), max(lng, min_lng), precision))
+    return celdas
+
+
+def cubrir_caja(min_lat, min_lng, max_lat, max_lng):
+    """Prefijos de geohash, los más largos posibles, que cubren la caja"""
+    for precision in range(PRECISION, 0, -1):
+        if contar_celdas(min_lat, min_lng, max_lat, max_lng, precision) <= MAXIMO_CELDAS:
+            break
+    return sorted(celdas_caja(min_lat, min_lng, max_lat, max_lng, precision))
+
+
+def siguiente_prefijo(prefijo):
+    """
+    Primer geohash que ya no empieza con `prefijo` ('d6n' -> 'd6p'); '' si no
+    hay. El orden de BASE32 (dígitos y luego letras) es el mismo de las
+    collations de MySQL y de SQLite, así que `>= prefijo AND < siguiente` es
+    un rango del índice (LIKE 'd6n%' no lo es en SQLite).
+    """
+    prefijo = prefijo.rstrip(BASE32[-1])
+    if not prefijo:
+        return ''
+    return prefijo[:-1] + BASE32[BASE32.index(prefijo[-1]) + 1]
+
+
+def filtro_prefijos(prefijos, campo='geohash'):
+    """Q de los valores de `campo` que empiezan con alguno de los prefijos, como rangos"""
+    filtro = Q()
+    for prefijo in prefijos:
+        rango = Q(**{f'{campo}__gte': prefijo})
+        siguiente = siguiente_prefijo(prefijo)
+        if siguiente:
+            rango &= Q(**{f'{campo}__lt': siguiente})
+        filtro |= rango
+    return filtro
+
+
+def filtro_caja(min_lat, min_lng, max_lat, max_lng):
+    """Q de los inmuebles dentro de la caja: prefijos del índice más el recorte exacto"""
+    return filtro_prefijos(cubrir_caja(min_lat, min_lng, max_lat, max_lng)) & Q(
+        latitud_num__range=(min_lat, max_lat), longitud_num__range=(min_lng, max_lng),
+    )
+
+
+def caja_radio(lat, lng, radio_km):
+    """Caja que contiene el círculo de `radio_km` alrededor del punto"""
+    grados_lat = math.degrees(radio_km / RADIO_TIERRA_KM)
+    grados_lng = grados_lat / max(math.cos(math.radians(lat)), 1e-6)
+    return (
+        max(-90.0, lat - grados_lat), max(-180.0, lng - grados_lng),
+        min(90.0, lat + grados_lat), min(180.0, lng + grados_lng),
+    )
+
+
+def distancia_cuadrada(lat, lng):
+    """
+    Expresión SQL proporcional al cuadrado de la distancia (aproximación
+    equirectangular): sirve para ordenar y recortar sin funciones
+    trigonométricas, que SQLite no siempre trae.
+    """
+    escala = math.cos(math.radians(lat))
+    return (F('latitud_num') - lat) * (F('latitud_num') - lat) + (
+        (F('longitud_num') - lng) * escala
+    ) * ((F('longitud_num') - lng) * escala)
+
+
+def grados_a_km(grados):
+    return math.radians(grados) * RADIO_TIERRA_KM
+
+
+def distancia_km(lat1, lng1, lat2, lng2):
+    """Distancia de haversine"""
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = (
+        math.sin(dlat / 2) ** 2
+        + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    )
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(a))
@@ -0,0 +1,125 @@
+"""
+Hash canónico de los registros del feed, guardado en Inmuebles.hash_datos.
+
+Cada registro se normaliza (decimales, fechas, espacios, HTML) y se divide en
+grupos de campos. Se calcula un digest por grupo y uno del registro completo:
+
+    v1 <total> precios=<h> areas=<h> texto=<h> imagenes=<h> general=<h>
+
+Comparando los sub-hashes la sincronización sabe qué grupos cambiaron y
+puede, por ejemplo, tocar las imágenes solo cuando cambió el grupo imagenes.
+"""
+import datetime
+import hashlib
+import html
+import re
+from decimal import Decimal
+from typing import NamedTuple
+
+VERSION = 'v1'
+
+GRUPOS = {
+    'precios': ('precio_venta', 'precio_canon', 'precio_administracion', 'precio_total'),
+    'areas': ('area', 'area_construida', 'area_privada', 'area_terreno'),
+    'texto': ('titulo', 'descripcion', 'descripcion_corta', 'direccion'),
+    'imagenes': ('imagenes',),
+}
+# Los campos que no están en ningún grupo van a 'general'
+GRUPO_GENERAL = 'general'
+CAMPO_A_GRUPO = {campo: grupo for grupo, campos in GRUPOS.items() for campo in campos}
+NOMBRES_GRUPOS = (*GRUPOS, GRUPO_GENERAL)
+
+# Campos con HTML (TinyMCE): se comparan por su texto visible
+CAMPOS_HTML = {'descripcion', 'descripcion_corta'}
+
+_ETIQUETAS = re.compile(r'<[^>]*>')
+_ESPACIOS = re.compile(r'\s+')
+_SEPARADOR = '\x1f'
+
+
+class HashRegistro(NamedTuple):
+    total: str
+    grupos: dict
+
+    def serializar(self):
+        partes = ' '.join(f'{grupo}={self.grupos[grupo]}' for grupo in NOMBRES_GRUPOS)
+        return f'{VERSION} {self.total} {partes}'
+
+    @classmethod
+    def desde_texto(cls, texto):
+        """Lee hash_datos; None si está vacío o en otro formato"""
+        if not texto or not texto.startswith(f'{VERSION} '):
+            return None
+        _, total, *partes = texto.split(' ')
+        grupos = dict(parte.split('=', 1) for parte in partes)
+        if set(grupos) != set(NOMBRES_GRUPOS):
+            return None
+        return cls(total, grupos)
+
+
+def normalizar_valor(campo, valor):
+    """Representación canónica en texto de un valor del registro"""
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return '1' if valor else '0'
+    if isinstance(valor, Decimal):
+        # 250000000.00 y 250000000 son el mismo precio
+        return format(valor.normalize(), 'f') if valor else '0'
+    if isinstance(valor, float):
+        return normalizar_valor(campo, Decimal(repr(valor)))
+    if isinstance(valor, datetime.datetime):
+        if valor.tzinfo is not None:
+            valor = valor.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return valor.isoformat(timespec='seconds')
+    if isinstance(valor, datetime.date):
+        return valor.isoformat()
+    if isinstance(valor, (list, tuple)):
+        return '\x1e'.join(normalizar_valor(campo, v) for v in valor)
+    if isinstance(valor, dict):
+        # Imágenes como {'url': ...}: solo importa la URL
+        return normalizar_valor(campo, valor.get('url'))
+    texto = str(valor)
+    if campo in CAMPOS_HTML:
+        texto = html.unescape(_ETIQUETAS.sub(' ', texto))
+    return _ESPACIOS.sub(' ', texto).strip()
+
+
+def _digest(partes):
+    return hashlib.blake2b(_SEPARADOR.join(partes).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def hash_registros(registros):
+    """
+    HashRegistro de cada registro (dicts campo -> valor), en una sola llamada.
+
+    Los campos ausentes, None y vacíos cuentan igual, así un registro parcial
+    y uno completo con nulos tienen el mismo hash.
+    """
+    grupo_de = CAMPO_A_GRUPO.get
+    normalizar = normalizar_valor
+    resultados = []
+    for registro in registros:
+        partes = {grupo: [] for grupo in NOMBRES_GRUPOS}
+        for campo in sorted(registro):
+            texto = normalizar(campo, registro[campo])
+            if texto:
+                partes[grupo_de(campo, GRUPO_GENERAL)].append(f'{campo}={texto}')
+        grupos = {grupo: _digest(valores) for grupo, valores in partes.items()}
+        total = hashlib.blake2b(
+            ''.join(grupos[grupo] for grupo in NOMBRES_GRUPOS).encode('ascii'), digest_size=16
+        ).hexdigest()
+        resultados.append(HashRegistro(total, grupos))
+    return resultados
+
+
+def hash_registro(registro):
+    return hash_registros([registro])[0]
+
+
+def grupos_cambiados(anterior, nuevo):
+    """Grupos cuyo sub-hash difiere; todos si hash_datos no es legible"""
+    anterior = HashRegistro.desde_texto(anterior) if isinstance(anterior, str) else anterior
+    if anterior is None:
+        return set(NOMBRES_GRUPOS)
+    return {grupo for grupo in NOMBRES_GRUPOS if anterior.grupos[grupo] != nuevo.grupos[grupo]}
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.almacen import limpiar, reporte
+
+
+def megabytes(valor):
+    return f'{valor / 1024 / 1024:,.1f} MB'
+
+
+class Command(BaseCommand):
+    help = 'Reporta el espacio que ahorra el almacén de imágenes por contenido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limpiar', action='store_true',
+                            help='Borra los archivos que ya no usa ninguna imagen')
+
+    def handle(self, *args, **options):
+        if options['limpiar']:
+            borrados = limpiar()
+            self.stdout.write(self.style.SUCCESS(f'{borrados} archivos sin referencias borrados'))
+
+        datos = reporte()
+        self.stdout.write(f'Archivos en el almacén: {datos.archivos:,} ({megabytes(datos.bytes_en_disco)})')
+        self.stdout.write(f'Imágenes que los usan:  {datos.referencias:,}')
+        self.stdout.write(f'Sin deduplicar:         {megabytes(datos.bytes_sin_dedup)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ahorro: {megabytes(datos.bytes_ahorrados)} ({datos.porcentaje_ahorrado:.1f}%)'
+        ))
+        if datos.huerfanos:
+            self.stdout.write(f'{datos.huerfanos} archivos sin referencias (usar --limpiar)')
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from inmobiliaria.api import CAMPOS_LISTADO
+from inmobiliaria.benchmarks import REF_SINTETICO, cronometrar, datos_sinteticos, formatear_tiempos
+from inmobiliaria.models import Inmuebles
+from inmobiliaria.views import inmuebles_lista
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de /api/inmuebles/: primera página, página profunda por cursor y con OFFSET'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inmuebles', type=int, default=100_000,
+                            help='Inmuebles sintéticos a sembrar (0 = usar los datos existentes)')
+        parser.add_argument('--repeticiones', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if options['inmuebles']:
+            self.stdout.write(f"Sembrando {options['inmuebles']} inmuebles sintéticos...")
+            with datos_sinteticos(options['inmuebles'], imagenes=1):
+                self.medir(options['inmuebles'], options['repeticiones'])
+        else:
+            self.medir(Inmuebles.objects.count(), options['repeticiones'])
+
+    def medir(self, cantidad, repeticiones):
+        factory = RequestFactory()
+        profundo = REF_SINTETICO + int(cantidad * 0.9)
+        casos = [
+            ('Primera página', {}),
+            ('Página profunda (cursor)', {'cursor': profundo}),
+            ('Filtrada', {'ciudad': 'Montería', 'tipo_inmueble': 'Casa', 'habitaciones': 3}),
+            ('Filtrada profunda', {'ciudad': 'Montería', 'cursor': profundo}),
+        ]
+        for nombre, params in casos:
+            solicitud = factory.get('/api/inmuebles/', params)
+            tiempos = cronometrar(lambda: inmuebles_lista(solicitud), repeticiones)
+            self.stdout.write(formatear_tiempos(nombre, tiempos))
+
+        # La misma página profunda con OFFSET, para comparar
+        desplazamiento = Inmuebles.objects.activos().filter(ref__lte=profundo).count()
+        queryset = Inmuebles.objects.activos().order_by('ref').values(*CAMPOS_LISTADO.values())
+        tiempos = cronometrar(
+            lambda: list(queryset[desplazamiento:desplazamiento + 20]), repeticiones
+        )
+        self.stdout.write(formatear_tiempos(f'OFFSET {desplazamiento} (referencia)', tiempos))
@@ -0,0 +1,71 @@
+from django.contrib import admin
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from inmobiliaria.admin import InmueblesAdmin
+from inmobiliaria.benchmarks import cronometrar, datos_sinteticos, formatear_tiempos
+from inmobiliaria.models import Inmuebles
+from inmobiliaria.search import MotorLike, obtener_motor
+
+
+class Command(BaseCommand):
+    help = 'Compara el motor de búsqueda configurado y la búsqueda del admin contra el LIKE original'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inmuebles', type=int, default=20000,
+                            help='Inmuebles sintéticos a sembrar (0 = usar los datos existentes)')
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--termino', action='append', dest='terminos',
+                            help='Término a buscar (se puede repetir)')
+        parser.add_argument('--explain', action='store_true',
+                            help='Muestra el EXPLAIN de cada consulta de la búsqueda del admin')
+
+    def handle(self, *args, **options):
+        terminos = options['terminos'] or ['piscina', 'terraza vista', 'balcon', 'Los Álamos', 'SYN-9000001']
+        if options['inmuebles']:
+            self.stdout.write(f"Sembrando {options['inmuebles']} inmuebles sintéticos...")
+            with datos_sinteticos(options['inmuebles']):
+                self.comparar(terminos, options['repeticiones'], options['explain'])
+        else:
+            self.comparar(terminos, options['repeticiones'], options['explain'])
+
+    def comparar(self, terminos, repeticiones, explain=False):
+        motor = obtener_motor()
+        modelo_admin = InmueblesAdmin(Inmuebles, admin.site)
+        busquedas = [
+            ('LIKE', MotorLike().buscar),
+            (type(motor).__name__, motor.buscar),
+            # FULLTEXT más los prefijos de código y slug del changelist
+            ('admin', lambda queryset, termino: modelo_admin.get_search_results(
+                None, queryset, termino)[0]),
+        ]
+        for termino in terminos:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n"{termino}"'))
+            for nombre, buscar in busquedas:
+                total = buscar(Inmuebles.objects.all(), termino).count()
+                # Como el changelist: la búsqueda (el admin ya consulta al armarla),
+                # el conteo y la primera página
+                tiempos = cronometrar(
+                    lambda: self.pagina(buscar(Inmuebles.objects.all(), termino)),
+                    repeticiones,
+                )
+                self.stdout.write(formatear_tiempos(f'{nombre} ({total})', tiempos))
+                if explain and nombre == 'admin':
+                    self.explicar(lambda: self.pagina(buscar(Inmuebles.objects.all(), termino)))
+
+    def pagina(self, queryset):
+        return queryset.count(), list(queryset.order_by('-ref')[:25])
+
+    def explicar(self, funcion):
+        """EXPLAIN de cada SELECT que ejecuta funcion()"""
+        with CaptureQueriesContext(connection) as consultas:
+            funcion()
+        with connection.cursor() as cursor:
+            for consulta in consultas.captured_queries:
+                if not consulta['sql'].startswith('SELECT'):
+                    continue
+                self.stdout.write(f"  {consulta['sql'][:160]}")
+                cursor.execute(f"EXPLAIN {consulta['sql']}")
+                for fila in cursor.fetchall():
+                    self.stdout.write(f'    {fila}')
@@ -0,0 +1,104 @@
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from inmobiliaria.benchmarks import REF_SINTETICO, cronometrar, datos_sinteticos, formatear_tiempos
+from inmobiliaria.caracteristicas import filtrar_eav, filtro_caracteristicas, reconstruir_pivote
+from inmobiliaria.models import Caracteristica, InmuebleCaracteristicas, Inmuebles, PivoteCaracteristicas
+
+BOOLEANAS = 15
+NUMERICAS = 15
+PREFIJO = 'Sintética'
+
+
+class Command(BaseCommand):
+    help = 'Mide filtros de varias características con el pivote contra un JOIN por condición'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inmuebles', type=int, default=100_000)
+        parser.add_argument('--repeticiones', type=int, default=10)
+        parser.add_argument('--condiciones', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Sembrando {options['inmuebles']} inmuebles sintéticos...")
+        with datos_sinteticos(options['inmuebles']):
+            try:
+                self.medir(options)
+            finally:
+                self.borrar()
+
+    def sembrar(self):
+        """Características sintéticas: la mitad booleanas, la mitad numéricas"""
+        ahora = timezone.now()
+        caracteristicas = [
+            Caracteristica.objects.get_or_create(
+                nombre=f'{PREFIJO} {numero}', defaults={'created_at': ahora, 'updated_at': ahora},
+            )[0].pk
+            for numero in range(BOOLEANAS + NUMERICAS)
+        ]
+        rnd = random.Random(7)
+        ids = Inmuebles.objects.filter(ref__gte=REF_SINTETICO).values_list('pk', flat=True)
+        filas = []
+        for inmueble_id in ids.iterator():
+            for orden, caracteristica_id in enumerate(caracteristicas):
+                if rnd.random() < 0.5:
+                    continue
+                fila = InmuebleCaracteristicas(inmueble_id=inmueble_id, caracteristica_id=caracteristica_id)
+                if orden < BOOLEANAS:
+                    fila.valor_booleano = 1 if rnd.random() < 0.6 else 0
+                else:
+                    fila.valor_numerico = Decimal(rnd.randint(0, 100))
+                filas.append(fila)
+        with transaction.atomic():
+            InmuebleCaracteristicas.objects.bulk_create(filas, batch_size=5000)
+        return caracteristicas, len(filas)
+
+    def medir(self, options):
+        caracteristicas, filas = self.sembrar()
+        resultado = reconstruir_pivote()
+        self.stdout.write(
+            f'{filas:,} filas EAV; pivote de {resultado.inmuebles:,} inmuebles '
+            f'({resultado.indices} índices) en {resultado.segundos:.2f} s'
+        )
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute('ANALYZE TABLE inmuebles, inmueble_caracteristicas, caracteristicas_pivote')
+            else:
+                cursor.execute('ANALYZE')
+
+        # Alternadas: 'tiene' en las booleanas, >= 50 en las numéricas
+        condiciones = [
+            (caracteristicas[numero // 2], 'tiene', '') if numero % 2 == 0
+            else (caracteristicas[BOOLEANAS + numero // 2], 'gte', Decimal(50))
+            for numero in range(options['condiciones'])
+        ]
+        base = Inmuebles.objects.activos().filter(ref__gte=REF_SINTETICO)
+        pivote = base.filter(filtro_caracteristicas(condiciones))
+        eav = filtrar_eav(base, condiciones)
+        total = pivote.count()
+        self.stdout.write(f"{options['condiciones']} condiciones: {total:,} inmuebles")
+        if eav.count() != total:
+            self.stderr.write(f'El JOIN encontró {eav.count():,}: el pivote no está al día')
+
+        casos = [
+            ('Pivote', lambda: list(pivote.order_by('ref').values_list('pk', flat=True)[:20])),
+            ('JOIN por condición', lambda: list(eav.order_by('ref').values_list('pk', flat=True)[:20])),
+            ('Pivote (contar)', pivote.count),
+            ('JOIN por condición (contar)', eav.count),
+        ]
+        for nombre, funcion in casos:
+            self.stdout.write(formatear_tiempos(nombre, cronometrar(funcion, options['repeticiones'])))
+
+    def borrar(self):
+        # Sin señales: borrar 1,5 millones de filas una por una tarda minutos
+        with transaction.atomic(), connection.cursor() as cursor:
+            for modelo in (PivoteCaracteristicas, InmuebleCaracteristicas):
+                cursor.execute(
+                    f'DELETE FROM {connection.ops.quote_name(modelo._meta.db_table)} '
+                    f'WHERE inmueble_id IN (SELECT id FROM inmuebles WHERE ref >= %s)',
+                    [REF_SINTETICO],
+                )
+        Caracteristica.objects.filter(nombre__startswith=PREFIJO).delete()
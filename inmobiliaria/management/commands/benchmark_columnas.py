@@ -0,0 +1,90 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from inmobiliaria.benchmarks import cronometrar, datos_sinteticos, formatear_tiempos
+from inmobiliaria.columnas import indice_columnar, reconstruir_columnas, refrescar_columnas
+from inmobiliaria.models import Inmuebles
+
+# (nombre, iguales, rangos) con los campos de columnas.py
+CASOS = [
+    ('Ciudad y habitaciones', {'ciudad_nombre': 'Montería', 'habitaciones': 3}, {}),
+    ('Precio y área', {}, {'precio': (200_000_000, 600_000_000), 'area': (80, 200)}),
+    (
+        'Seis filtros',
+        {'ciudad_nombre': 'Montería', 'tipo_inmueble_nombre': 'Casa', 'estrato': 4},
+        {'precio': (None, 1_500_000_000), 'area': (60, None), 'banos': (2, None)},
+    ),
+]
+# Campo de columnas.py -> expresión del ORM
+CAMPOS_ORM = {'precio': Coalesce('precio_venta', 'precio_canon')}
+
+
+def filtrar_orm(queryset, iguales, rangos):
+    queryset = queryset.annotate(precio=CAMPOS_ORM['precio'])
+    for campo, valor in iguales.items():
+        queryset = queryset.filter(**{campo: valor})
+    for campo, (minimo, maximo) in rangos.items():
+        if minimo is not None:
+            queryset = queryset.filter(**{f'{campo}__gte': minimo})
+        if maximo is not None:
+            queryset = queryset.filter(**{f'{campo}__lte': maximo})
+    return queryset
+
+
+class Command(BaseCommand):
+    help = 'Mide los filtros del listado sobre la copia en columnas contra la misma consulta del ORM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inmuebles', type=int, default=100_000,
+                            help='Inmuebles sintéticos a sembrar (0 = usar los datos existentes)')
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--cambios', type=int, default=500,
+                            help='Inmuebles a modificar para medir la puesta al día')
+
+    def handle(self, *args, **options):
+        if options['inmuebles']:
+            self.stdout.write(f"Sembrando {options['inmuebles']} inmuebles sintéticos...")
+            with datos_sinteticos(options['inmuebles']):
+                self.medir(options)
+        else:
+            self.medir(options)
+
+    def medir(self, options):
+        repeticiones = options['repeticiones']
+        resultado = reconstruir_columnas()
+        self.stdout.write(f'Copia en columnas: {resultado.filas:,} inmuebles en {resultado.segundos * 1000:.0f} ms')
+        indice = indice_columnar()
+        base = Inmuebles.objects.activos()
+
+        for nombre, iguales, rangos in CASOS:
+            orm = filtrar_orm(base, iguales, rangos)
+            total = indice.contar(iguales, rangos)
+            self.stdout.write(f'{nombre}: {total:,} inmuebles')
+            pagina = indice.consultar(iguales, rangos, limite=20)
+            if pagina != list(orm.order_by('ref').values_list('ref', flat=True)[:20]) or orm.count() != total:
+                self.stderr.write('  La copia no coincide con la base de datos')
+            casos = [
+                ('Columnas (página)', lambda: indice.consultar(iguales, rangos, limite=20)),
+                ('ORM (página)', lambda: list(orm.order_by('ref').values_list('ref', flat=True)[:20])),
+                ('Columnas (por precio)', lambda: indice.consultar(iguales, rangos, orden='-precio', limite=20)),
+                ('ORM (por precio)', lambda: list(
+                    orm.order_by(F('precio').desc(nulls_last=True), 'ref').values_list('ref', flat=True)[:20]
+                )),
+                ('Columnas (contar)', lambda: indice.contar(iguales, rangos)),
+                ('ORM (contar)', orm.count),
+            ]
+            for medicion, funcion in casos:
+                self.stdout.write(formatear_tiempos(f'  {medicion}', cronometrar(funcion, repeticiones)))
+
+        refs = list(base.order_by('ref').values_list('ref', flat=True)[:options['cambios']])
+        # Los sembrados comparten fecha: la primera pasada los relee y mueve la marca
+        for precio in (Decimal('123000000'), Decimal('124000000')):
+            Inmuebles.objects.filter(ref__in=refs).update(precio_venta=precio, fecha_actualizacion=timezone.now())
+            resultado = refrescar_columnas()
+        self.stdout.write(
+            f'Puesta al día: {resultado.cambios:,} inmuebles cambiados en {resultado.segundos * 1000:.1f} ms'
+        )
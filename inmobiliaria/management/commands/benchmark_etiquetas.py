@@ -0,0 +1,99 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.text import slugify
+
+from inmobiliaria.api import CAMPOS_LISTADO, imagenes_principales, pagina_listado
+
+from inmobiliaria.benchmarks import REF_SINTETICO, cronometrar, datos_sinteticos, formatear_tiempos
+from inmobiliaria.etiquetas import filtrar_joins, filtro_etiquetas, indice_etiquetas, invalidar_indice
+from inmobiliaria.models import Etiquetas, Inmuebles, InmueblesEtiquetas
+
+PREFIJO = 'Sintética'
+# Proporción de inmuebles con cada etiqueta
+FRECUENCIAS = [0.5, 0.4, 0.3, 0.2, 0.1, 0.05, 0.3, 0.2]
+
+
+class Command(BaseCommand):
+    help = 'Mide filtros de varias etiquetas con el índice de bits contra JOINs y DISTINCT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inmuebles', type=int, default=100_000)
+        parser.add_argument('--repeticiones', type=int, default=10)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Sembrando {options['inmuebles']} inmuebles sintéticos...")
+        with datos_sinteticos(options['inmuebles']):
+            try:
+                self.medir(options)
+            finally:
+                self.borrar()
+
+    def sembrar(self):
+        ahora = timezone.now()
+        etiquetas = [
+            Etiquetas.objects.get_or_create(
+                nombre=f'{PREFIJO} {numero}', defaults={'created_at': ahora, 'updated_at': ahora},
+            )[0].pk
+            for numero in range(len(FRECUENCIAS))
+        ]
+        rnd = random.Random(11)
+        filas = [
+            InmueblesEtiquetas(inmueble_id=inmueble_id, etiqueta_id=etiqueta_id, created_at=ahora)
+            for inmueble_id in Inmuebles.objects.filter(ref__gte=REF_SINTETICO).values_list('pk', flat=True)
+            for etiqueta_id, frecuencia in zip(etiquetas, FRECUENCIAS)
+            if rnd.random() < frecuencia
+        ]
+        with transaction.atomic():
+            InmueblesEtiquetas.objects.bulk_create(filas, batch_size=5000)
+        return etiquetas, len(filas)
+
+    def medir(self, options):
+        etiquetas, filas = self.sembrar()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE TABLE inmuebles, inmuebles_etiquetas' if connection.vendor == 'mysql' else 'ANALYZE')
+        invalidar_indice()
+        cronometro = cronometrar(indice_etiquetas, 1)
+        self.stdout.write(f'{filas:,} etiquetas asignadas; índice construido en {cronometro["mediana"]:.0f} ms')
+
+        base = Inmuebles.objects.activos().filter(ref__gte=REF_SINTETICO)
+        casos = {
+            'A y B y no C': ((0, 1), (), (2,)),
+            'A y B y C y D': ((0, 1, 2, 3), (), ()),
+            '(E o F) y G y no H': ((6,), (4, 5), (7,)),
+            'A y E y F (poco común)': ((0, 4, 5), (), ()),
+        }
+        for nombre, grupos in casos.items():
+            params = QueryDict(mutable=True)
+            for parametro, numeros in zip(('etiqueta', 'etiqueta_alguna', 'sin_etiqueta'), grupos):
+                params.setlist(parametro, [slugify(f'{PREFIJO} {numero}') for numero in numeros])
+            todas, alguna, ninguna = ([etiquetas[numero] for numero in numeros] for numeros in grupos)
+            indice = base.filter(filtro_etiquetas(todas, alguna, ninguna))
+            joins = filtrar_joins(base, todas, alguna, ninguna)
+            total = indice.count()
+            self.stdout.write(f'{nombre}: {total:,} inmuebles')
+            if joins.count() != total:
+                self.stderr.write(f'Los JOINs encontraron {joins.count():,}')
+            mediciones = [
+                ('Índice (página de la API)', lambda: pagina_listado(params)),
+                ('JOINs (página)', lambda: imagenes_principales([
+                    fila['pk'] for fila in joins.order_by('ref').values('pk', *CAMPOS_LISTADO.values())[:21]
+                ])),
+                ('Índice (contar)', lambda: base.filter(filtro_etiquetas(todas, alguna, ninguna)).count()),
+                ('JOINs (contar)', joins.count),
+            ]
+            for medicion, funcion in mediciones:
+                self.stdout.write(formatear_tiempos(f'  {medicion}', cronometrar(funcion, options['repeticiones'])))
+
+    def borrar(self):
+        # Sin señales: borrar cientos de miles de filas una por una tarda minutos
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM inmuebles_etiquetas WHERE inmueble_id IN (SELECT id FROM inmuebles WHERE ref >= %s)',
+                [REF_SINTETICO],
+            )
+        Etiquetas.objects.filter(nombre__startswith=PREFIJO).delete()
+        invalidar_indice()
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from inmobiliaria.benchmarks import REF_SINTETICO, cronometrar, datos_sinteticos, formatear_tiempos
+from inmobiliaria.geo import coordenadas, distancia_km, rellenar
+from inmobiliaria.models import Inmuebles
+
+# Centro de Montería, dentro de la zona de los datos sintéticos
+CENTRO = (8.75, -75.85)
+CAJA = (8.74, -75.86, 8.76, -75.84)
+
+
+class Command(BaseCommand):
+    help = 'Mide la búsqueda por radio y por caja con geohash contra leer las coordenadas de texto en Python'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inmuebles', type=int, default=100_000,
+                            help='Inmuebles sintéticos a sembrar (0 = usar los datos existentes)')
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--radio', type=float, default=1.0, help='Radio en km')
+
+    def handle(self, *args, **options):
+        if options['inmuebles']:
+            self.stdout.write(f"Sembrando {options['inmuebles']} inmuebles sintéticos...")
+            with datos_sinteticos(options['inmuebles']):
+                self.medir(options)
+        else:
+            self.medir(options)
+
+    def medir(self, options):
+        repeticiones, radio = options['repeticiones'], options['radio']
+        queryset = Inmuebles.objects.all()
+        if options['inmuebles']:
+            queryset = queryset.filter(ref__gte=REF_SINTETICO)
+        resultado = rellenar(queryset)
+        self.stdout.write(
+            f'Relleno: {resultado.validas:,} válidas, {resultado.invalidas:,} inválidas '
+            f'en {resultado.segundos:.2f} s'
+        )
+
+        # Con estadísticas al día el planificador elige el índice de geohash
+        # y no el de (activo, ref)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE TABLE inmuebles' if connection.vendor == 'mysql' else 'ANALYZE')
+
+        cerca = queryset.activos().cerca_de(*CENTRO, radio)
+        en_caja = queryset.activos().en_caja(*CAJA)
+        self.stdout.write(f'{cerca.count():,} a menos de {radio} km, {en_caja.count():,} en la caja')
+
+        def ingenuo_radio():
+            puntos = []
+            for pk, latitud, longitud in queryset.activos().values_list('pk', 'latitud', 'longitud'):
+                punto = coordenadas(latitud, longitud)
+                if punto and distancia_km(*CENTRO, *punto) <= radio:
+                    puntos.append((distancia_km(*CENTRO, *punto), pk))
+            return sorted(puntos)
+
+        def ingenuo_caja():
+            return [
+                pk for pk, latitud, longitud in queryset.activos().values_list('pk', 'latitud', 'longitud')
+                if (punto := coordenadas(latitud, longitud))
+                and CAJA[0] <= punto[0] <= CAJA[2] and CAJA[1] <= punto[1] <= CAJA[3]
+            ]
+
+        casos = [
+            ('Radio (geohash)', lambda: list(cerca.values_list('pk', flat=True))),
+            ('Radio (texto en Python)', ingenuo_radio),
+            ('Caja (geohash)', lambda: list(en_caja.values_list('pk', flat=True))),
+            ('Caja (texto en Python)', ingenuo_caja),
+        ]
+        for nombre, funcion in casos:
+            self.stdout.write(formatear_tiempos(nombre, cronometrar(funcion, repeticiones)))
@@ -0,0 +1,41 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.benchmarks import REF_SINTETICO, catalogos_en_memoria, registro_sintetico
+from inmobiliaria.hashing import hash_registros
+
+
+class Command(BaseCommand):
+    help = 'Mide hash_registros sobre registros sintéticos (registros por segundo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registros', type=int, default=100_000)
+        parser.add_argument('--repeticiones', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(7)
+        # hash_registros no lee la base: los catálogos no se guardan
+        barrios, tipos, consignaciones = catalogos_en_memoria()
+        registros = []
+        for i in range(options['registros']):
+            registro = registro_sintetico(
+                REF_SINTETICO + i, rnd, rnd.choice(barrios),
+                rnd.choice(tipos), rnd.choice(consignaciones),
+            )
+            registro['imagenes'] = [
+                f'https://fotos.example.com/{registro["ref"]}/{orden}.jpg' for orden in range(8)
+            ]
+            registros.append(registro)
+
+        tiempos = []
+        for _ in range(options['repeticiones']):
+            inicio = time.perf_counter()
+            hash_registros(registros)
+            tiempos.append(time.perf_counter() - inicio)
+        mejor = min(tiempos)
+        self.stdout.write(
+            f'{len(registros):,} registros  {mejor:8.3f} s  '
+            f'{len(registros) / mejor:12,.0f} registros/s'
+        )
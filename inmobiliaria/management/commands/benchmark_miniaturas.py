@@ -0,0 +1,53 @@
+import os
+import random
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw
+
+from inmobiliaria.miniaturas import procesar_archivos
+
+
+class Command(BaseCommand):
+    help = 'Mide la generación de miniaturas con fotos JPEG sintéticas, con 1 y N procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--imagenes', type=int, default=200)
+        parser.add_argument('--ancho', type=int, default=4000)
+        parser.add_argument('--alto', type=int, default=3000)
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directorio:
+            rutas = self.crear_fotos(Path(directorio), options)
+            for procesos in sorted({1, options['procesos']}):
+                for ruta in Path(directorio).glob('*.*.*'):
+                    ruta.unlink()
+                resultado = procesar_archivos(rutas, procesos=procesos)
+                self.stdout.write(
+                    f'{procesos:>3} procesos  {resultado.segundos:8.2f} s  '
+                    f'{resultado.imagenes_por_segundo:8.1f} imágenes/s  '
+                    f'{resultado.imagenes_por_segundo_por_proceso:8.1f} por núcleo'
+                )
+            resultado = procesar_archivos(rutas, procesos=options['procesos'])
+            self.stdout.write(
+                f'Segunda pasada (incremental): {resultado.omitidas} omitidas '
+                f'en {resultado.segundos * 1000:.0f} ms'
+            )
+
+    def crear_fotos(self, directorio, options):
+        """Una foto base con ruido y formas, guardada con distinta calidad"""
+        rnd = random.Random(3)
+        base = Image.effect_noise((options['ancho'], options['alto']), 40).convert('RGB')
+        dibujo = ImageDraw.Draw(base)
+        for _ in range(60):
+            x, y = rnd.randrange(options['ancho']), rnd.randrange(options['alto'])
+            color = tuple(rnd.randrange(256) for _ in range(3))
+            dibujo.rectangle((x, y, x + rnd.randrange(200, 900), y + rnd.randrange(200, 700)), fill=color)
+        rutas = []
+        for i in range(options['imagenes']):
+            ruta = directorio / f'{i}.jpg'
+            base.save(ruta, 'JPEG', quality=85 + i % 10)
+            rutas.append(str(ruta))
+        return rutas
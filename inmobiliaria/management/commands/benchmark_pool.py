@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+
+from core.mysql_pool.pool import estadisticas_pools
+from inmobiliaria.benchmarks import cronometrar, datos_sinteticos, formatear_tiempos
+
+RUTAS = ['/api/inmuebles/?limite=20', '/api/inmuebles/facetas/?ciudad=Montería']
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de peticiones completas con y sin el pool de conexiones a MySQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inmuebles', type=int, default=10_000,
+                            help='Inmuebles sintéticos a sembrar (0 = usar los datos existentes)')
+        parser.add_argument('--repeticiones', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if 'POOL' not in connection.settings_dict:
+            raise CommandError('Requiere MySQL con el pool: DB_POOL=True (ENGINE core.mysql_pool)')
+        if options['inmuebles']:
+            self.stdout.write(f"Sembrando {options['inmuebles']} inmuebles sintéticos...")
+            with datos_sinteticos(options['inmuebles']):
+                self.medir(options)
+        else:
+            self.medir(options)
+
+    def medir(self, options):
+        # El handler de WSGI manda request_started y request_finished, así que
+        # cada petición abre y cierra (o saca y devuelve) su conexión como en
+        # el servidor; el cliente de pruebas de Django no lo hace
+        handler = WSGIHandler()
+        fabrica = RequestFactory(HTTP_HOST=(settings.ALLOWED_HOSTS or ['localhost'])[0])
+        opciones = connection.settings_dict['POOL']
+        connection.close()
+
+        for ruta in RUTAS:
+            entorno = fabrica.get(ruta).environ
+
+            def peticion():
+                respuesta = handler(dict(entorno), lambda estado, cabeceras: None)
+                b''.join(respuesta)
+                respuesta.close()
+
+            self.stdout.write(ruta)
+            for nombre, activo in (('Sin pool', False), ('Con pool', True)):
+                opciones['ACTIVO'] = activo
+                peticion()
+                self.stdout.write(formatear_tiempos(f'  {nombre}', cronometrar(peticion, options['repeticiones'])))
+        opciones['ACTIVO'] = True
+        self.stdout.write(f'Pool: {estadisticas_pools()}')
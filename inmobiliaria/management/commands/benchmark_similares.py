@@ -0,0 +1,111 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast, Coalesce, Power
+from django.http import QueryDict
+from django.utils import timezone
+
+from inmobiliaria.api import similares
+from inmobiliaria.benchmarks import REF_SINTETICO, cronometrar, datos_sinteticos, formatear_tiempos
+from inmobiliaria.geo import rellenar
+from inmobiliaria.models import Inmuebles
+from inmobiliaria.similares import VECINOS, MatrizSimilares, reconstruir_similares, refrescar_similares
+
+
+def puntaje_sql(fila):
+    """Distancia de cada inmueble a la fila en columnas numéricas, calculada por la base de datos"""
+    terminos = [
+        Power(Coalesce(Cast(campo, FloatField()), valor) - valor, 2)
+        for campo, valor in [
+            ('area', float(fila['area'] or 0) / 50),
+            ('habitaciones', fila['habitaciones'] or 0),
+            ('banos', fila['banos'] or 0),
+            ('estrato', fila['estrato'] or 0),
+            ('latitud_num', (fila['latitud_num'] or 0) * 100),
+            ('longitud_num', (fila['longitud_num'] or 0) * 100),
+        ]
+    ]
+    puntaje = terminos[0]
+    for termino in terminos[1:]:
+        puntaje = puntaje + termino
+    return puntaje
+
+
+class Command(BaseCommand):
+    help = 'Mide el cálculo de inmuebles similares (lote, puesta al día y consulta) contra puntuar en SQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inmuebles', type=int, default=100_000)
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--cambios', type=int, default=500,
+                            help='Inmuebles a modificar para medir la puesta al día')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Sembrando {options['inmuebles']} inmuebles sintéticos...")
+        with datos_sinteticos(options['inmuebles']):
+            try:
+                self.medir(options)
+            finally:
+                self.borrar()
+
+    def medir(self, options):
+        repeticiones = options['repeticiones']
+        sinteticos = Inmuebles.objects.filter(ref__gte=REF_SINTETICO)
+        rellenar(sinteticos)
+
+        cronometro = cronometrar(MatrizSimilares.leer, 1)
+        self.stdout.write(f'Vectores leídos en {cronometro["mediana"]:.0f} ms')
+        resultado = reconstruir_similares()
+        self.stdout.write(
+            f'Lote: {resultado.recalculados:,} inmuebles, {VECINOS} vecinos cada uno, '
+            f'en {resultado.segundos:.2f} s'
+        )
+
+        rnd = random.Random(5)
+        muestra = rnd.sample(list(sinteticos.activos().values_list('ref', flat=True)), 50)
+        slugs = iter(Inmuebles.objects.filter(ref__in=muestra).values_list('slug', flat=True))
+        filas = iter(Inmuebles.objects.filter(ref__in=muestra).values(
+            'area', 'habitaciones', 'banos', 'estrato', 'latitud_num', 'longitud_num', 'tipo_consignacion_id',
+        ))
+        matriz = MatrizSimilares.leer()
+        posiciones = iter(matriz.posiciones[pk] for pk in Inmuebles.objects.filter(ref__in=muestra).values_list('pk', flat=True))
+        params = QueryDict(f'limite={VECINOS}')
+
+        def sql():
+            fila = next(filas)
+            return list(
+                Inmuebles.objects.activos().filter(tipo_consignacion_id=fila['tipo_consignacion_id'])
+                .alias(puntaje=puntaje_sql(fila)).order_by('puntaje').values_list('ref', flat=True)[:VECINOS]
+            )
+
+        casos = [
+            ('Precalculados (API)', lambda: similares(next(slugs), params)),
+            ('NumPy, un inmueble', lambda: matriz.vecinos([next(posiciones)])),
+            ('Puntaje en SQL', sql),
+        ]
+        repeticiones = min(repeticiones, len(muestra))
+        for medicion, funcion in casos:
+            self.stdout.write(formatear_tiempos(medicion, cronometrar(funcion, repeticiones)))
+
+        refs = muestra[:options['cambios']] + list(
+            sinteticos.activos().exclude(ref__in=muestra).order_by('ref')
+            .values_list('ref', flat=True)[:max(0, options['cambios'] - len(muestra))]
+        )
+        Inmuebles.objects.filter(ref__in=refs).update(
+            habitaciones=F('habitaciones') + 1, fecha_actualizacion=timezone.now(),
+        )
+        resultado = refrescar_similares()
+        self.stdout.write(
+            f'Puesta al día: {len(refs):,} cambiados, {resultado.recalculados:,} recalculados '
+            f'en {resultado.segundos:.2f} s'
+        )
+
+    def borrar(self):
+        # Sin señales, igual que las demás tablas de los datos sintéticos
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM inmuebles_similares WHERE inmueble_id IN (SELECT id FROM inmuebles WHERE ref >= %s)',
+                [REF_SINTETICO],
+            )
@@ -0,0 +1,65 @@
+import json
+import random
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.benchmarks import REF_SINTETICO, borrar_sinteticos, catalogos, registro_sintetico
+from inmobiliaria.sync import leer_feed, sincronizar
+
+
+class Command(BaseCommand):
+    help = 'Mide sync_inmuebles con un feed sintético: carga inicial, sin cambios y 10% con otro precio'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inmuebles', type=int, default=100_000)
+        parser.add_argument('--lote', type=int, default=1000)
+        parser.add_argument('--cambios', type=float, default=0.10,
+                            help='Fracción de registros que cambian de precio en la tercera pasada')
+
+    def handle(self, *args, **options):
+        cantidad = options['inmuebles']
+        borrar_sinteticos()
+        with tempfile.TemporaryDirectory() as directorio:
+            feed = Path(directorio) / 'feed.jsonl'
+            self.escribir_feed(feed, cantidad)
+            cambiado = Path(directorio) / 'feed_cambiado.jsonl'
+            self.cambiar_precios(feed, cambiado, options['cambios'])
+            try:
+                for nombre, ruta in [
+                    ('Carga inicial', feed),
+                    ('Sin cambios', feed),
+                    (f"{options['cambios']:.0%} otro precio", cambiado),
+                ]:
+                    resultado = sincronizar(leer_feed(ruta), tamano_lote=options['lote'])
+                    self.stdout.write(
+                        f'{nombre:<16} {resultado.segundos:8.2f} s  '
+                        f'{resultado.filas_por_segundo:10,.0f} filas/s  '
+                        f'(+{resultado.nuevos} ~{resultado.actualizados} ={resultado.sin_cambios})'
+                    )
+            finally:
+                borrar_sinteticos()
+
+    def escribir_feed(self, ruta, cantidad):
+        rnd = random.Random(7)
+        barrios, tipos, consignaciones = catalogos()
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            for i in range(cantidad):
+                registro = registro_sintetico(
+                    REF_SINTETICO + i, rnd, rnd.choice(barrios),
+                    rnd.choice(tipos), rnd.choice(consignaciones),
+                )
+                archivo.write(json.dumps(registro, default=str, ensure_ascii=False) + '\n')
+
+    def cambiar_precios(self, origen, destino, fraccion):
+        rnd = random.Random(11)
+        with open(origen, encoding='utf-8') as entrada, open(destino, 'w', encoding='utf-8') as salida:
+            for linea in entrada:
+                registro = json.loads(linea)
+                if rnd.random() < fraccion:
+                    # Cambia el grupo de precios del hash y las columnas Decimal
+                    campo = 'precio_venta' if registro['precio_venta'] else 'precio_canon'
+                    registro[campo] = str(Decimal(registro[campo]) + 1_000_000)
+                salida.write(json.dumps(registro, ensure_ascii=False) + '\n')
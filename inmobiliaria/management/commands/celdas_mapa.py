@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.mapa import reconstruir_celdas
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye las celdas de agrupación del mapa desde los inmuebles activos'
+
+    def handle(self, *args, **options):
+        resultado = reconstruir_celdas()
+        for nivel, celdas in sorted(resultado.celdas.items()):
+            self.stdout.write(f'Nivel {nivel}: {celdas:,} celdas')
+        self.stdout.write(self.style.SUCCESS(f'Celdas reconstruidas en {resultado.segundos:.2f} s'))
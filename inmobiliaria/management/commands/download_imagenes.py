@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.descargas import descargar_imagenes
+from inmobiliaria.models import Imagenes
+
+
+class Command(BaseCommand):
+    help = 'Descarga a MEDIA_ROOT las imágenes pendientes (descargada = 0)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrencia', type=int, default=32,
+                            help='Descargas simultáneas en total (por defecto 32)')
+        parser.add_argument('--por-host', type=int, default=6,
+                            help='Descargas simultáneas por servidor (por defecto 6)')
+        parser.add_argument('--reintentos', type=int, default=3)
+        parser.add_argument('--lote', type=int, default=500,
+                            help='Imágenes por bulk_update (por defecto 500)')
+        parser.add_argument('--limite', type=int, help='Máximo de imágenes a procesar')
+        parser.add_argument('--sin-etag', action='store_true',
+                            help='No consultar el ETag con HEAD antes de descargar')
+        parser.add_argument('--inmueble', type=int, nargs='+', metavar='REF',
+                            help='Solo las imágenes de estas refs')
+
+    def handle(self, *args, **options):
+        queryset = Imagenes.objects.all()
+        if options['inmueble']:
+            queryset = queryset.filter(inmueble__ref__in=options['inmueble'])
+        resultado = descargar_imagenes(
+            queryset, lote=options['lote'], limite=options['limite'],
+            concurrencia=options['concurrencia'], por_host=options['por_host'],
+            reintentos=options['reintentos'], verificar_etag=not options['sin_etag'],
+        )
+
+        for pk, error in resultado.errores[:20]:
+            self.stderr.write(f'  imagen {pk}: {error}')
+        if len(resultado.errores) > 20:
+            self.stderr.write(f'  ... y {len(resultado.errores) - 20} errores más')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.descargadas} descargadas ({resultado.deduplicadas} ya estaban en el almacén), '
+            f'{resultado.reutilizadas} reutilizadas sin descargar, {resultado.fallidas} fallidas, '
+            f'{resultado.bytes / 1024 / 1024:.1f} MB'
+        ))
+        self.stdout.write(
+            f'{resultado.segundos:.2f} s ({resultado.imagenes_por_segundo:,.1f} imágenes/s)'
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.miniaturas import generar_miniaturas
+from inmobiliaria.models import Imagenes
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas (WebP y JPEG) de las imágenes descargadas que no las tengan al día'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int,
+                            help='Procesos del pool (por defecto uno por CPU)')
+        parser.add_argument('--inmueble', type=int, nargs='+', metavar='REF',
+                            help='Solo las imágenes de estas refs')
+
+    def handle(self, *args, **options):
+        queryset = Imagenes.objects.all()
+        if options['inmueble']:
+            queryset = queryset.filter(inmueble__ref__in=options['inmueble'])
+        resultado = generar_miniaturas(queryset, procesos=options['procesos'])
+
+        for archivo, error in resultado.errores[:20]:
+            self.stderr.write(f'  {archivo}: {error}')
+        if len(resultado.errores) > 20:
+            self.stderr.write(f'  ... y {len(resultado.errores) - 20} errores más')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.generadas} generadas, {resultado.omitidas} al día, '
+            f'{resultado.fallidas} fallidas'
+        ))
+        self.stdout.write(
+            f'{resultado.segundos:.2f} s con {resultado.procesos} procesos '
+            f'({resultado.imagenes_por_segundo:,.1f} imágenes/s, '
+            f'{resultado.imagenes_por_segundo_por_proceso:,.1f} por proceso)'
+        )
@@ -0,0 +1,30 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.miniaturas import TAMANOS_ASESOR, procesar_archivos
+from inmobiliaria.models import Assesor
+
+
+class Command(BaseCommand):
+    help = 'Genera las versiones reducidas de las fotos de asesores que no las tengan al día'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int,
+                            help='Procesos del pool (por defecto uno por CPU)')
+
+    def handle(self, *args, **options):
+        fotos = Assesor.objects.exclude(foto='').exclude(foto__isnull=True).values_list('pk', 'foto')
+        pks, rutas = [], []
+        for pk, foto in fotos:
+            pks.append(pk)
+            rutas.append(os.path.join(settings.MEDIA_ROOT, foto))
+        resultado = procesar_archivos(rutas, pks, procesos=options['procesos'], tamanos=TAMANOS_ASESOR)
+
+        for pk, error in resultado.errores:
+            self.stderr.write(f'  asesor {pk}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.generadas} generadas, {resultado.omitidas} al día, '
+            f'{resultado.fallidas} fallidas en {resultado.segundos:.2f} s'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.caracteristicas import reconstruir_pivote
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el pivote de características de los inmuebles y crea los índices que falten'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        resultado = reconstruir_pivote(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.inmuebles:,} inmuebles en el pivote, {resultado.indices} índices nuevos, '
+            f'en {resultado.segundos:.2f} s'
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.estados import CAMPOS_ESTADO, aplicar_estados, capturar_estados
+
+
+class Command(BaseCommand):
+    help = 'Aplica los estados de inmuebles_estados sobre inmuebles (o los captura desde inmuebles)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo reporta las diferencias, sin escribir')
+        parser.add_argument('--lote', type=int, default=5000,
+                            help='Filas de inmuebles_estados por UPDATE (por defecto 5000)')
+        parser.add_argument('--capturar', nargs='+', type=int, metavar='REF',
+                            help='Guarda en inmuebles_estados el estado actual de estas refs')
+
+    def handle(self, *args, **options):
+        if options['capturar']:
+            resultado = capturar_estados(options['capturar'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{resultado.filas} estados capturados en {resultado.segundos * 1000:.1f} ms'
+            ))
+            return
+
+        resultado = aplicar_estados(dry_run=options['dry_run'], lote=options['lote'])
+        if options['dry_run']:
+            self.stdout.write(f'{resultado.filas} inmuebles difieren de su estado guardado')
+            for campo, total in resultado.diferencias.items():
+                self.stdout.write(f'  {campo}: {total}')
+            if resultado.muestra:
+                self.stdout.write('  ref | ' + ' | '.join(f'{c} (actual -> guardado)' for c in CAMPOS_ESTADO))
+            for ref, *valores in resultado.muestra:
+                pares = [f'{valores[i]} -> {valores[i + 1]}' for i in range(0, len(valores), 2)]
+                self.stdout.write(f'  {ref} | ' + ' | '.join(pares))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{resultado.filas} inmuebles actualizados'))
+        self.stdout.write(f'{resultado.segundos * 1000:.1f} ms')
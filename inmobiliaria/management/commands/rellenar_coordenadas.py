@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.geo import rellenar
+from inmobiliaria.mapa import reconstruir_celdas
+from inmobiliaria.models import Inmuebles
+
+
+class Command(BaseCommand):
+    help = 'Calcula latitud_num, longitud_num y geohash desde las coordenadas de texto'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000)
+        parser.add_argument('--pendientes', action='store_true',
+                            help='Solo los inmuebles sin geohash')
+
+    def handle(self, *args, **options):
+        queryset = Inmuebles.objects.all()
+        if options['pendientes']:
+            queryset = queryset.filter(geohash__isnull=True)
+        resultado = rellenar(queryset, lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.validas:,} inmuebles con coordenadas en {resultado.segundos:.1f} s'
+        ))
+        if resultado.invalidas:
+            self.stdout.write(f'{resultado.invalidas:,} sin coordenadas válidas')
+        celdas = reconstruir_celdas()
+        self.stdout.write(f'{sum(celdas.celdas.values()):,} celdas del mapa reconstruidas')
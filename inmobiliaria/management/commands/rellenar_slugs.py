@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.slugs import rellenar_slugs
+
+
+class Command(BaseCommand):
+    help = 'Genera los slugs que faltan y resuelve los repetidos (conserva el del menor ref)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        resultado = rellenar_slugs(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.cambiados:,} de {resultado.revisados:,} slugs cambiados '
+            f'en {resultado.segundos:.1f} s'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from inmobiliaria.similares import reconstruir_similares, refrescar_similares
+
+
+class Command(BaseCommand):
+    help = 'Pone al día los inmuebles similares de los que cambiaron (o de todos con --reconstruir)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reconstruir', action='store_true', help='Recalcula todos los inmuebles')
+
+    def handle(self, *args, **options):
+        resultado = reconstruir_similares() if options['reconstruir'] else refrescar_similares()
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.recalculados:,} de {resultado.inmuebles:,} inmuebles recalculados, '
+            f'{resultado.retirados:,} retirados, en {resultado.segundos:.2f} s'
+        ))
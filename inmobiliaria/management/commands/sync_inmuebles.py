@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inmobiliaria.estados import aplicar_estados
+from inmobiliaria.sync import leer_feed, sincronizar
+
+
+class Command(BaseCommand):
+    help = 'Sincroniza la tabla inmuebles con un archivo del feed (JSON Lines o CSV)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ruta', help='Archivo del feed (.jsonl o .csv)')
+        parser.add_argument('--formato', choices=['jsonl', 'csv'],
+                            help='Formato del archivo (por defecto según la extensión)')
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Registros por transacción (por defecto 1000)')
+        parser.add_argument('--sin-estados', action='store_true',
+                            help='No reaplicar los estados de inmuebles_estados al terminar')
+
+    def handle(self, *args, **options):
+        try:
+            registros = leer_feed(options['ruta'], options['formato'])
+            resultado = sincronizar(registros, tamano_lote=options['lote'])
+        except FileNotFoundError as error:
+            raise CommandError(f'No existe el archivo del feed: {error.filename}')
+
+        for ref, error in resultado.errores[:20]:
+            self.stderr.write(f'  ref {ref}: {error}')
+        if len(resultado.errores) > 20:
+            self.stderr.write(f'  ... y {len(resultado.errores) - 20} errores más')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Leídos {resultado.leidos}: {resultado.nuevos} nuevos, '
+            f'{resultado.actualizados} actualizados, {resultado.sin_cambios} sin cambios, '
+            f'{len(resultado.errores)} errores'
+        ))
+        self.stdout.write(
+            f'{resultado.segundos:.2f} s ({resultado.filas_por_segundo:,.0f} filas/s)'
+        )
+
+        if not options['sin_estados']:
+            estados = aplicar_estados()
+            self.stdout.write(
+                f'Estados reaplicados a {estados.filas} inmuebles en {estados.segundos * 1000:.1f} ms'
+            )
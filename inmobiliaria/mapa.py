@@ -0,0 +1,180 @@
+"""
+Agrupación de los marcadores del mapa en el servidor.
+
+celdas_mapa guarda, para cada celda de geohash de 1 a NIVEL_MAXIMO
+caracteres que tiene inmuebles activos, cuántos hay, la suma de sus
+coordenadas (para el centroide) y el precio mínimo y máximo, de venta y de
+canon por separado. El nivel más fino se calcula desde inmuebles y cada
+nivel superior sumando los 32 hijos del anterior, así que recalcular una
+celda cuesta lo mismo sin importar el tamaño del inventario.
+
+La sincronización y las acciones del admin recalculan solo las celdas de
+los inmuebles que tocaron (actualizar_celdas). Las señales juntan los
+geohashes de toda la transacción y los recalculan una vez al confirmarla
+(programar_celdas), así borrar mil inmuebles no recalcula mil veces. El
+comando celdas_mapa las reconstruye todas.
+
+Una consulta del mapa lee las celdas de un solo nivel que tocan la vista,
+nunca más de MAXIMO_CLUSTERS (el nivel baja si la vista pediría más).
+"""
+import time
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from .geo import celdas_caja, contar_celdas, filtro_prefijos, tamano_celda
+from .models import CeldasMapa, Inmuebles
+from .transacciones import al_confirmar
+
+NIVEL_MAXIMO = 7
+MAXIMO_CLUSTERS = 400
+# Con más celdas tocadas que esto, reconstruir todo es más barato
+MAXIMO_INCREMENTAL = 500
+# Celdas por tesela de 256 px: un grupo cada ~64 px
+CELDAS_POR_TESELA = 4
+CAMPOS_PRECIO = ('venta_min', 'venta_max', 'canon_min', 'canon_max')
+
+
+@dataclass
+class ResultadoCeldas:
+    celdas: dict = field(default_factory=dict)
+    segundos: float = 0.0
+
+
+def _agregados_inmuebles(prefijos=None):
+    """Agregados del nivel más fino, desde inmuebles (de `prefijos`, o todos)"""
+    queryset = Inmuebles.objects.activos().filter(geohash__isnull=False)
+    if prefijos is not None:
+        queryset = queryset.filter(filtro_prefijos(prefijos))
+    return queryset.annotate(prefijo=Substr('geohash', 1, NIVEL_MAXIMO)).values('prefijo').annotate(
+        cantidad=Count('pk'),
+        latitudes=Sum('latitud_num'),
+        longitudes=Sum('longitud_num'),
+        venta_min=Min('precio_venta'),
+        venta_max=Max('precio_venta'),
+        canon_min=Min('precio_canon'),
+        canon_max=Max('precio_canon'),
+    ).order_by()
+
+
+def _agregados_hijos(nivel, prefijos=None):
+    """Agregados del `nivel` sumando las celdas del nivel siguiente"""
+    queryset = CeldasMapa.objects.filter(nivel=nivel + 1)
+    if prefijos is not None:
+        queryset = queryset.filter(filtro_prefijos(prefijos, 'celda'))
+    return queryset.annotate(prefijo=Substr('celda', 1, nivel)).values('prefijo').annotate(
+        cantidad=Sum('total'),
+        latitudes=Sum('suma_latitud'),
+        longitudes=Sum('suma_longitud'),
+        venta_min=Min('venta_min'),
+        venta_max=Max('venta_max'),
+        canon_min=Min('canon_min'),
+        canon_max=Max('canon_max'),
+    ).order_by()
+
+
+def _reemplazar(nivel, celdas, agregados):
+    """
+    Guarda los agregados del nivel sobre las filas que ya existen (un upsert
+    por lote, sin borrar y volver a insertar) y borra las de `celdas` (todas
+    las del nivel si es None) que se quedaron sin inmuebles.
+    """
+    marca = timezone.now()
+    nuevas = CeldasMapa.objects.bulk_create(
+        [
+            CeldasMapa(
+                nivel=nivel, celda=fila['prefijo'], total=fila['cantidad'],
+                suma_latitud=fila['latitudes'], suma_longitud=fila['longitudes'],
+                **{campo: fila[campo] for campo in CAMPOS_PRECIO},
+            )
+            for fila in agregados
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['nivel', 'celda'],
+        update_fields=['total', 'suma_latitud', 'suma_longitud', *CAMPOS_PRECIO, 'updated_at'],
+    )
+    # Las que siguen teniendo inmuebles quedaron con updated_at desde `marca`
+    vacias = CeldasMapa.objects.filter(nivel=nivel, updated_at__lt=marca)
+    if celdas is not None:
+        vacias = vacias.filter(celda__in=celdas)
+    vacias.delete()
+    return len(nuevas)
+
+
+def actualizar_celdas(geohashes):
+    """
+    Recalcula las celdas, en todos los niveles, que contienen los
+    `geohashes` (los de antes y los de después de un cambio).
+    """
+    celdas = {g[:NIVEL_MAXIMO] for g in geohashes if g}
+    if not celdas:
+        return
+    if len(celdas) > MAXIMO_INCREMENTAL:
+        reconstruir_celdas()
+        return
+    with transaction.atomic():
+        _reemplazar(NIVEL_MAXIMO, celdas, _agregados_inmuebles(celdas))
+        for nivel in range(NIVEL_MAXIMO - 1, 0, -1):
+            celdas = {celda[:nivel] for celda in celdas}
+            _reemplazar(nivel, celdas, _agregados_hijos(nivel, celdas))
+
+
+def programar_celdas(geohashes):
+    """
+    Recalcula las celdas de `geohashes` al confirmar la transacción en curso
+    (o ya, si no hay una), juntando todas las llamadas de la transacción.
+    """
+    al_confirmar(actualizar_celdas, geohashes)
+
+
+def reconstruir_celdas():
+    """Recalcula todas las celdas; una consulta agregada por nivel"""
+    resultado = ResultadoCeldas()
+    inicio = time.perf_counter()
+    with transaction.atomic():
+        resultado.celdas[NIVEL_MAXIMO] = _reemplazar(NIVEL_MAXIMO, None, _agregados_inmuebles())
+        for nivel in range(NIVEL_MAXIMO - 1, 0, -1):
+            resultado.celdas[nivel] = _reemplazar(nivel, None, _agregados_hijos(nivel))
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def nivel_para(zoom, min_lat, min_lng, max_lat, max_lng):
+    """
+    Nivel de celda para el zoom del mapa (teselas de 256 px): el más fino
+    cuyas celdas siguen siendo de ~256/CELDAS_POR_TESELA px, y si la vista
+    pide demasiadas, uno más grueso.
+    """
+    ancho = 360 / 2 ** zoom / CELDAS_POR_TESELA
+    nivel = 1
+    while nivel < NIVEL_MAXIMO and tamano_celda(nivel + 1)[1] >= ancho:
+        nivel += 1
+    while nivel > 1 and contar_celdas(min_lat, min_lng, max_lat, max_lng, nivel) > MAXIMO_CLUSTERS:
+        nivel -= 1
+    return nivel
+
+
+def clusters(min_lat, min_lng, max_lat, max_lng, zoom):
+    """
+    (nivel, [grupos]) de las celdas que tocan la vista. Cada grupo trae su
+    celda, el total, el centroide y los rangos de precio de venta y de
+    canon (None si no hay inmuebles con ese precio). Una consulta.
+    """
+    nivel = nivel_para(zoom, min_lat, min_lng, max_lat, max_lng)
+    celdas = CeldasMapa.objects.filter(
+        nivel=nivel, celda__in=celdas_caja(min_lat, min_lng, max_lat, max_lng, nivel),
+    ).order_by('celda').values_list('celda', 'total', 'suma_latitud', 'suma_longitud', *CAMPOS_PRECIO)
+    return nivel, [
+        {
+            'celda': celda,
+            'total': total,
+            'lat': round(latitudes / total, 6),
+            'lng': round(longitudes / total, 6),
+            **dict(zip(CAMPOS_PRECIO, precios)),
+        }
+        for celda, total, latitudes, longitudes, *precios in celdas
+    ]
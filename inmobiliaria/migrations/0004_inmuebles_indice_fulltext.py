@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# La tabla inmuebles es managed=False: los índices se crean con SQL propio y
+# solo en MySQL, que es la base de datos de producción. MotorFullText ignora
+# acentos y mayúsculas gracias a la collation de las columnas (*_ai_ci,
+# *_unicode_ci, *_general_ci); con otra, la búsqueda cambiaría sin avisar,
+# así que la migración se detiene antes de crear el índice.
+INDICES = [
+    (
+        "inmuebles_busqueda_ft",
+        "CREATE FULLTEXT INDEX inmuebles_busqueda_ft "
+        "ON inmuebles (titulo, descripcion_corta, direccion)",
+    ),
+    (
+        "inmuebles_codigo_sincronizacion_idx",
+        "CREATE INDEX inmuebles_codigo_sincronizacion_idx "
+        "ON inmuebles (codigo_sincronizacion)",
+    ),
+]
+
+
+COLUMNAS_TEXTO = ("titulo", "descripcion_corta", "direccion")
+
+
+def comprobar_collation(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT column_name, collation_name FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = 'inmuebles' "
+            "AND column_name IN (%s, %s, %s)",
+            COLUMNAS_TEXTO,
+        )
+        distintas = [
+            f"{columna} ({collation})"
+            for columna, collation in cursor.fetchall()
+            if not collation or not collation.endswith("_ci") or collation.endswith("_as_ci")
+        ]
+    if distintas:
+        raise RuntimeError(
+            "El índice FULLTEXT necesita columnas que ignoren acentos y mayúsculas; "
+            f"cambia la collation de {', '.join(distintas)} (por ejemplo "
+            "ALTER TABLE inmuebles CONVERT TO CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci) "
+            "y vuelve a migrar"
+        )
+
+
+def crear_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    comprobar_collation(schema_editor)
+    for _, sql in INDICES:
+        schema_editor.execute(sql)
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    for nombre, _ in INDICES:
+        schema_editor.execute(f"DROP INDEX {nombre} ON inmuebles")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0003_caracteristica_delete_caracteristicas_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
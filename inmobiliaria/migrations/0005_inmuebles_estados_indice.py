@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# inmuebles_estados es managed=False: el índice del JOIN con inmuebles
+# (ref + codigo_sincronizacion) se crea con SQL propio, solo en MySQL.
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX inmuebles_estados_ref_cod_idx "
+        "ON inmuebles_estados (inmueble_ref, codigo_sincronizacion)"
+    )
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute("DROP INDEX inmuebles_estados_ref_cod_idx ON inmuebles_estados")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0004_inmuebles_indice_fulltext"),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
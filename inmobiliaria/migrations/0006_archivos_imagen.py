@@ -0,0 +1,69 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0005_inmuebles_estados_indice"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivosImagen",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "digest",
+                    models.CharField(
+                        help_text="SHA-256 del contenido", max_length=64, unique=True
+                    ),
+                ),
+                (
+                    "ruta",
+                    models.CharField(
+                        help_text="Ruta relativa a MEDIA_ROOT", max_length=255, unique=True
+                    ),
+                ),
+                ("tamano", models.PositiveBigIntegerField(help_text="Tamaño en bytes")),
+                (
+                    "etag",
+                    models.CharField(
+                        blank=True,
+                        db_index=True,
+                        help_text="ETag con que se descargó",
+                        max_length=255,
+                        null=True,
+                    ),
+                ),
+                (
+                    "referencias",
+                    models.IntegerField(
+                        default=0, help_text="Filas de imagenes que usan el archivo"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Archivo de imagen",
+                "verbose_name_plural": "Archivos de imagen",
+                "db_table": "archivos_imagen",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="imagenes",
+            index=models.Index(fields=["url"], name="imagenes_url_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="imagenes",
+            index=models.Index(fields=["url_local"], name="imagenes_url_local_idx"),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# inmuebles es managed=False: los índices de la paginación por cursor de la
+# API (WHERE activo = 1 [AND ciudad_nombre = ...] AND ref > ? ORDER BY ref)
+# se crean con SQL propio, solo en MySQL.
+
+INDICES = {
+    "inmuebles_activo_ref_idx": "activo, ref",
+    "inmuebles_ciudad_ref_idx": "ciudad_nombre, activo, ref",
+}
+
+
+def crear_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    for nombre, columnas in INDICES.items():
+        schema_editor.execute(f"CREATE INDEX {nombre} ON inmuebles ({columnas})")
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    for nombre in INDICES:
+        schema_editor.execute(f"DROP INDEX {nombre} ON inmuebles")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0006_archivos_imagen"),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# inmuebles es managed=False: las columnas numéricas de coordenadas y el
+# geohash (con su índice) se agregan con SQL propio, solo en MySQL. Para
+# llenarlas: python manage.py rellenar_coordenadas
+
+
+def agregar_columnas(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute(
+        "ALTER TABLE inmuebles "
+        "ADD COLUMN latitud_num DOUBLE NULL, "
+        "ADD COLUMN longitud_num DOUBLE NULL, "
+        "ADD COLUMN geohash VARCHAR(12) NULL"
+    )
+    schema_editor.execute("CREATE INDEX inmuebles_geohash_idx ON inmuebles (geohash)")
+
+
+def quitar_columnas(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute("DROP INDEX inmuebles_geohash_idx ON inmuebles")
+    schema_editor.execute(
+        "ALTER TABLE inmuebles DROP COLUMN latitud_num, DROP COLUMN longitud_num, DROP COLUMN geohash"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0007_inmuebles_indices_api"),
+    ]
+
+    operations = [
+        migrations.RunPython(agregar_columnas, quitar_columnas),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0008_inmuebles_coordenadas"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CeldasMapa",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("nivel", models.PositiveSmallIntegerField()),
+                ("celda", models.CharField(max_length=12)),
+                ("total", models.IntegerField(default=0)),
+                ("suma_latitud", models.FloatField(default=0)),
+                ("suma_longitud", models.FloatField(default=0)),
+                (
+                    "precio_min",
+                    models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True),
+                ),
+                (
+                    "precio_max",
+                    models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Celda del mapa",
+                "verbose_name_plural": "Celdas del mapa",
+                "db_table": "celdas_mapa",
+                "unique_together": {("nivel", "celda")},
+            },
+        ),
+    ]
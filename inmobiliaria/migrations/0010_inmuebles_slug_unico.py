@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# inmuebles es managed=False: el índice único de slug se crea con SQL propio,
+# solo en MySQL. Antes se quitan los repetidos (gana el de menor ref) para que
+# el índice se pueda crear; rellenar_slugs genera los que faltan.
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute("UPDATE inmuebles SET slug = NULL WHERE slug = ''")
+    schema_editor.execute(
+        "UPDATE inmuebles i JOIN ("
+        "SELECT slug, MIN(ref) AS ref FROM inmuebles WHERE slug IS NOT NULL "
+        "GROUP BY slug HAVING COUNT(*) > 1"
+        ") d ON i.slug = d.slug AND i.ref <> d.ref "
+        "SET i.slug = CONCAT(LEFT(i.slug, 240), '-', i.ref)"
+    )
+    schema_editor.execute("CREATE UNIQUE INDEX inmuebles_slug_uniq ON inmuebles (slug)")
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute("DROP INDEX inmuebles_slug_uniq ON inmuebles")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0009_celdas_mapa"),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0010_inmuebles_slug_unico"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PivoteCaracteristicas",
+            fields=[
+                (
+                    "inmueble",
+                    models.OneToOneField(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="pivote_caracteristicas",
+                        serialize=False,
+                        to="inmobiliaria.inmuebles",
+                    ),
+                ),
+                ("valores", models.JSONField(default=dict)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Características del inmueble (pivote)",
+                "verbose_name_plural": "Características de los inmuebles (pivote)",
+                "db_table": "caracteristicas_pivote",
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+# inmuebles es managed=False: el índice con que el listado en columnas lee
+# los cambios (WHERE fecha_actualizacion >= ?) se crea con SQL propio, solo
+# en MySQL.
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute("CREATE INDEX inmuebles_fecha_act_idx ON inmuebles (fecha_actualizacion)")
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute("DROP INDEX inmuebles_fecha_act_idx ON inmuebles")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0011_caracteristicas_pivote"),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
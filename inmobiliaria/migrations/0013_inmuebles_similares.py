@@ -0,0 +1,36 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0012_inmuebles_fecha_actualizacion_indice"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimilaresInmueble",
+            fields=[
+                (
+                    "inmueble",
+                    models.OneToOneField(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="similares",
+                        serialize=False,
+                        to="inmobiliaria.inmuebles",
+                    ),
+                ),
+                ("refs", models.JSONField(default=list)),
+                ("fecha_origen", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Inmuebles similares",
+                "verbose_name_plural": "Inmuebles similares",
+                "db_table": "inmuebles_similares",
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0013_inmuebles_similares"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivosimagen",
+            name="host",
+            field=models.CharField(
+                blank=True,
+                help_text="Servidor (host:puerto) del que se descargó",
+                max_length=255,
+                null=True,
+            ),
+        ),
+    ]
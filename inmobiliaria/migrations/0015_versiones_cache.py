@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0014_archivos_imagen_host"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VersionesCache",
+            fields=[
+                ("clave", models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ("valor", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Versión de caché",
+                "verbose_name_plural": "Versiones de caché",
+                "db_table": "versiones_cache",
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Las celdas son datos derivados: tras migrar se recalculan con
+# `python manage.py celdas_mapa`
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inmobiliaria", "0015_versiones_cache"),
+    ]
+
+    operations = [
+        migrations.RemoveField(model_name="celdasmapa", name="precio_min"),
+        migrations.RemoveField(model_name="celdasmapa", name="precio_max"),
+        migrations.AddField(
+            model_name="celdasmapa",
+            name="venta_min",
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True),
+        ),
+        migrations.AddField(
+            model_name="celdasmapa",
+            name="venta_max",
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True),
+        ),
+        migrations.AddField(
+            model_name="celdasmapa",
+            name="canon_min",
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True),
+        ),
+        migrations.AddField(
+            model_name="celdasmapa",
+            name="canon_max",
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True),
+        ),
+    ]
@@ -0,0 +1,195 @@
+"""
+Miniaturas de las imágenes descargadas (Imagenes.url_local).
+
+Cada imagen se decodifica una sola vez, reducida desde el JPEG con draft()
+al menor tamaño que alcanza para la miniatura más grande, y de ahí se
+recortan todos los tamaños (como object-fit: cover) en WebP y JPEG:
+
+    inmuebles/12/345.jpg -> inmuebles/12/345.chica.webp, 345.chica.jpg, ...
+
+El trabajo de Pillow corre en un pool de procesos; la base de datos solo se
+lee en el proceso principal. Las miniaturas más nuevas que su original se
+omiten, así que volver a correr el comando solo procesa lo pendiente.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+# Nombre -> (ancho, alto). Al doble de lo que muestra el admin para pantallas HiDPI:
+# chica para la lista (80x60 y 60x45), mediana para el inline (100x80),
+# grande para el formulario de la imagen (400x300).
+TAMANOS = {
+    'chica': (160, 120),
+    'mediana': (200, 160),
+    'grande': (800, 600),
+}
+# Fotos de Assesor: 50x50 en la lista y 150x150 en el formulario
+TAMANOS_ASESOR = {
+    'lista': (100, 100),
+    'detalle': (300, 300),
+}
+FORMATOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+@dataclass
+class ResultadoMiniaturas:
+    generadas: int = 0
+    omitidas: int = 0
+    fallidas: int = 0
+    procesos: int = 1
+    segundos: float = 0.0
+    errores: list = field(default_factory=list)
+    claves_generadas: list = field(default_factory=list)
+
+    @property
+    def imagenes_por_segundo(self):
+        return self.generadas / self.segundos if self.segundos else 0.0
+
+    @property
+    def imagenes_por_segundo_por_proceso(self):
+        return self.imagenes_por_segundo / self.procesos
+
+
+def ruta_miniatura(url_local, tamano, formato='webp'):
+    """'inmuebles/1/2.jpg' -> 'inmuebles/1/2.chica.webp'"""
+    base, _ = os.path.splitext(url_local)
+    return f'{base}.{tamano}.{formato}'
+
+
+def _recorte(ancho, alto, destino):
+    """Caja centrada del original con la proporción de `destino`"""
+    proporcion = destino[0] / destino[1]
+    if ancho / alto > proporcion:
+        nuevo = alto * proporcion
+        return ((ancho - nuevo) / 2, 0, (ancho + nuevo) / 2, alto)
+    nuevo = ancho / proporcion
+    return (0, (alto - nuevo) / 2, ancho, (alto + nuevo) / 2)
+
+
+def al_dia(origen, destinos):
+    """True si todas las miniaturas existen y son más nuevas que el original"""
+    try:
+        modificado = os.stat(origen).st_mtime
+        return all(os.stat(destino).st_mtime >= modificado for destino in destinos)
+    except FileNotFoundError:
+        return False
+
+
+def generar(origen, tamanos=None, formatos=None):
+    """
+    Genera las miniaturas de un archivo (rutas absolutas). Corre en los
+    procesos del pool, así que no toca la base de datos.
+
+    Devuelve 'generada', 'omitida' o el mensaje de error.
+    """
+    tamanos = tamanos or TAMANOS
+    formatos = formatos or FORMATOS
+    destinos = {
+        (tamano, formato): ruta_miniatura(origen, tamano, formato)
+        for tamano in tamanos for formato in formatos
+    }
+    if al_dia(origen, destinos.values()):
+        return 'omitida'
+    try:
+        with Image.open(origen) as imagen:
+            # JPEG: decodifica directo a 1/2, 1/4 u 1/8 si sobra resolución
+            imagen.draft('RGB', max(tamanos.values()))
+            imagen = ImageOps.exif_transpose(imagen).convert('RGB')
+            for tamano, medidas in sorted(tamanos.items(), key=lambda t: -t[1][0]):
+                caja = _recorte(*imagen.size, medidas)
+                miniatura = imagen.resize(
+                    medidas, Image.Resampling.LANCZOS, box=caja, reducing_gap=2.0
+                )
+                for formato, (nombre, opciones) in formatos.items():
+                    destino = destinos[tamano, formato]
+                    temporal = f'{destino}.part'
+                    miniatura.save(temporal, nombre, **opciones)
+                    os.replace(temporal, destino)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        return f'{type(error).__name__}: {error}'
+    return 'generada'
+
+
+def generar_miniaturas(queryset, procesos=None, raiz=None, lote=200):
+    """
+    Genera las miniaturas de las imágenes descargadas de `queryset` y toca
+    los inmuebles que estrenan alguna (el detalle de la API las muestra).
+
+    Con el almacén por digest varias filas comparten url_local: cada archivo
+    se procesa una vez, y se tocan los inmuebles de todas las filas que lo
+    usan, estén o no en `queryset`.
+    """
+    raiz = raiz or settings.MEDIA_ROOT
+    archivos = queryset.filter(descargada=1, url_local__isnull=False).exclude(
+        url_local=''
+    ).order_by('url_local').values_list('url_local', flat=True).distinct()
+    nombres = list(archivos.iterator(chunk_size=2000))
+    rutas = [os.path.join(raiz, nombre) for nombre in nombres]
+    resultado = procesar_archivos(rutas, nombres, procesos=procesos, lote=lote)
+    # models.py importa este módulo: Inmuebles se toma de la relación
+    inmuebles_modelo = queryset.model._meta.get_field('inmueble').related_model
+    tocados = set()
+    for inicio in range(0, len(resultado.claves_generadas), 2000):
+        tocados.update(queryset.model.objects.filter(
+            url_local__in=resultado.claves_generadas[inicio:inicio + 2000],
+        ).values_list('inmueble_id', flat=True))
+    tocados = sorted(tocados - {None})
+    for inicio in range(0, len(tocados), 2000):
+        inmuebles_modelo.objects.filter(pk__in=tocados[inicio:inicio + 2000]).tocar()
+    return resultado
+
+
+def procesar_archivos(rutas, claves=None, procesos=None, lote=200, tamanos=None):
+    """
+    Llama generar() para cada ruta en un pool de `procesos` (por defecto uno
+    por CPU). Con procesos=1 trabaja en el proceso actual.
+    """
+    generar_tamanos = partial(generar, tamanos=tamanos)
+    procesos = procesos or os.cpu_count() or 1
+    resultado = ResultadoMiniaturas(procesos=procesos)
+    claves = rutas if claves is None else claves
+    inicio = time.perf_counter()
+    if procesos == 1:
+        _contar(resultado, claves, map(generar_tamanos, rutas))
+    else:
+        # Bloques grandes para no pagar un viaje al pool por imagen
+        bloque = min(lote, max(1, len(rutas) // (procesos * 4)))
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            _contar(resultado, claves, pool.map(generar_tamanos, rutas, chunksize=bloque))
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def _contar(resultado, claves, estados):
+    for clave, estado in zip(claves, estados):
+        if estado == 'generada':
+            resultado.generadas += 1
+            resultado.claves_generadas.append(clave)
+        elif estado == 'omitida':
+            resultado.omitidas += 1
+        else:
+            resultado.fallidas += 1
+            resultado.errores.append((clave, estado))
+
+
+def url_miniatura(imagen, tamano='chica', formato='webp', raiz=None):
+    """URL de la miniatura si ya existe en MEDIA_ROOT; si no, None"""
+    if not imagen.url_local or not imagen.descargada:
+        return None
+    return url_archivo_miniatura(imagen.url_local, tamano, formato, raiz)
+
+
+def url_archivo_miniatura(nombre, tamano, formato='webp', raiz=None):
+    """URL de la miniatura del archivo `nombre` (relativo a MEDIA_ROOT) si existe"""
+    ruta = ruta_miniatura(nombre, tamano, formato)
+    if not os.path.exists(os.path.join(raiz or settings.MEDIA_ROOT, ruta)):
+        return None
+    return f'{settings.MEDIA_URL}{ruta}'
@@ -1,7 +1,14 @@
 from django.db import models
+from django.db.models import Case, Prefetch, Value, When
 from django.conf import settings
+from django.utils import timezone
+import math
 import os
 
+from .geo import RADIO_TIERRA_KM, caja_radio, distancia_cuadrada, filtro_caja
+from .miniaturas import url_archivo_miniatura, url_miniatura
+from .search import obtener_motor
+
 
 class Assesor(models.Model):
     nombre = models.CharField(max_length=255)
@@ -35,9 +42,11 @@ class Assesor(models.Model):
                 return self.telefono
         return "Sin teléfono"
     
-    def get_foto_url(self):
-        """Devuelve la URL completa de la foto usando ImageField"""
+    def get_foto_url(self, size=None):
+        """Devuelve la URL de la foto; con size ('lista', 'detalle') la versión reducida si existe"""
         if self.foto:
+            if size:
+                return url_archivo_miniatura(self.foto.name, size) or self.foto.url
             return self.foto.url
         return None
     
@@ -136,6 +145,13 @@ class Etiquetas(models.Model):
         verbose_name_plural = 'Etiquetas'
         
 
+class ImagenesQuerySet(models.QuerySet):
+
+    def con_relaciones(self):
+        """Une el inmueble que usan __str__ y los listados del admin"""
+        return self.select_related('inmueble')
+
+
 class Imagenes(models.Model):
     inmueble = models.ForeignKey('Inmuebles', models.DO_NOTHING, blank=True, null=True)
     url = models.CharField(max_length=255, help_text='URL de la imagen externa')
@@ -145,6 +161,8 @@ class Imagenes(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ImagenesQuerySet.as_manager()
+
     def __str__(self):
         inmueble_info = f"Inmueble #{self.inmueble.ref}" if self.inmueble else "Sin inmueble"
         orden_info = f"Orden {self.orden}" if self.orden is not None else "Sin orden"
@@ -153,6 +171,10 @@ class Imagenes(models.Model):
     def get_imagen_display_url(self):
         """Devuelve la URL principal para mostrar la imagen"""
         return self.url
+
+    def get_miniatura_url(self, tamano='chica'):
+        """Miniatura local si ya se generó; si no, la URL original"""
+        return url_miniatura(self, tamano) or self.url
     
     def esta_descargada(self):
         """Indica si la imagen está descargada localmente"""
@@ -164,6 +186,81 @@ class Imagenes(models.Model):
         verbose_name = 'Imagen del Inmueble'
         verbose_name_plural = 'Imágenes del Inmueble'
         ordering = ['orden', 'created_at']
+        indexes = [
+            models.Index(fields=['url'], name='imagenes_url_idx'),
+            models.Index(fields=['url_local'], name='imagenes_url_local_idx'),
+        ]
+
+
+class ArchivosImagen(models.Model):
+    """Archivo del almacén por contenido (almacen.py) que comparten las filas de imagenes"""
+    digest = models.CharField(max_length=64, unique=True, help_text='SHA-256 del contenido')
+    ruta = models.CharField(max_length=255, unique=True, help_text='Ruta relativa a MEDIA_ROOT')
+    tamano = models.PositiveBigIntegerField(help_text='Tamaño en bytes')
+    etag = models.CharField(max_length=255, blank=True, null=True, db_index=True, help_text='ETag con que se descargó')
+    host = models.CharField(max_length=255, blank=True, null=True, help_text='Servidor (host:puerto) del que se descargó')
+    referencias = models.IntegerField(default=0, help_text='Filas de imagenes que usan el archivo')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.ruta
+
+    class Meta:
+        db_table = 'archivos_imagen'
+        verbose_name = 'Archivo de imagen'
+        verbose_name_plural = 'Archivos de imagen'
+
+
+class VersionesCache(models.Model):
+    """
+    Contador de versión de una caché, compartido por todos los procesos (la
+    caché por defecto es memoria de cada proceso). Ver facets.py.
+    """
+    clave = models.CharField(max_length=50, primary_key=True)
+    valor = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.clave}: {self.valor}'
+
+    class Meta:
+        db_table = 'versiones_cache'
+        verbose_name = 'Versión de caché'
+        verbose_name_plural = 'Versiones de caché'
+
+
+class CeldasMapa(models.Model):
+    """
+    Agregado de los inmuebles activos de una celda de geohash, para agrupar
+    los marcadores del mapa (mapa.py). `celda` es el prefijo y `nivel` su largo.
+    """
+    nivel = models.PositiveSmallIntegerField()
+    celda = models.CharField(max_length=12)
+    total = models.IntegerField(default=0)
+    suma_latitud = models.FloatField(default=0)
+    suma_longitud = models.FloatField(default=0)
+    # Rangos por separado: un canon mensual no se mezcla con un precio de venta
+    venta_min = models.DecimalField(max_digits=15, decimal_places=2, blank=True, null=True)
+    venta_max = models.DecimalField(max_digits=15, decimal_places=2, blank=True, null=True)
+    canon_min = models.DecimalField(max_digits=15, decimal_places=2, blank=True, null=True)
+    canon_max = models.DecimalField(max_digits=15, decimal_places=2, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.celda} ({self.total})'
+
+    class Meta:
+        db_table = 'celdas_mapa'
+        unique_together = (('nivel', 'celda'),)
+        verbose_name = 'Celda del mapa'
+        verbose_name_plural = 'Celdas del mapa'
+
+
+class InmuebleCaracteristicasQuerySet(models.QuerySet):
+
+    def con_relaciones(self):
+        """Une la característica que usa __str__"""
+        return self.select_related('caracteristica')
 
 
 class InmuebleCaracteristicas(models.Model):
@@ -175,6 +272,8 @@ class InmuebleCaracteristicas(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = InmuebleCaracteristicasQuerySet.as_manager()
+
     def __str__(self):
         caracteristica_nombre = self.caracteristica.nombre if self.caracteristica else "Sin característica"
         if self.valor_texto:
@@ -193,9 +292,100 @@ class InmuebleCaracteristicas(models.Model):
         verbose_name_plural = 'Características del Inmueble'
 
 
+class PivoteCaracteristicas(models.Model):
+    """
+    Las características de un inmueble en una sola fila, para filtrar sin un
+    JOIN por condición (caracteristicas.py). `valores` guarda 'n<id>' con el
+    número (los booleanos como 1/0) y 't<id>' con el texto de cada una.
+    """
+    inmueble = models.OneToOneField(
+        'Inmuebles', models.DO_NOTHING, primary_key=True, db_constraint=False,
+        related_name='pivote_caracteristicas',
+    )
+    valores = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'caracteristicas_pivote'
+        verbose_name = 'Características del inmueble (pivote)'
+        verbose_name_plural = 'Características de los inmuebles (pivote)'
+
+
+class SimilaresInmueble(models.Model):
+    """
+    Los inmuebles activos más parecidos a uno, precalculados (similares.py).
+    `refs` va del más parecido al menos; `fecha_origen` es la
+    fecha_actualizacion del inmueble con la que se calcularon.
+    """
+    inmueble = models.OneToOneField(
+        'Inmuebles', models.DO_NOTHING, primary_key=True, db_constraint=False,
+        related_name='similares',
+    )
+    refs = models.JSONField(default=list)
+    fecha_origen = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'inmuebles_similares'
+        verbose_name = 'Inmuebles similares'
+        verbose_name_plural = 'Inmuebles similares'
+
+
+def imagenes_por_prioridad():
+    """Imágenes ordenadas como las elige get_imagen_principal (orden 0 primero)"""
+    return Imagenes.objects.order_by(
+        Case(When(orden=0, then=Value(0)), default=Value(1)),
+        'orden',
+        'created_at',
+    )
+
+
+class InmueblesQuerySet(models.QuerySet):
+
+    def con_relaciones(self):
+        """Une en la misma consulta las tablas de catálogo que muestra el admin"""
+        return self.select_related('ciudad', 'barrio', 'tipo_inmueble')
+
+    def con_imagen_principal(self):
+        """Carga la imagen principal de todos los inmuebles en una sola consulta"""
+        return self.prefetch_related(
+            Prefetch(
+                'imagenes_set',
+                queryset=imagenes_por_prioridad()[:1],
+                to_attr='_imagen_principal',
+            )
+        )
+
+    def activos(self):
+        """Inmuebles publicados en el sitio"""
+        return self.filter(activo=1)
+
+    def tocar(self):
+        """
+        Pone fecha_actualizacion en ahora: es la versión del ETag y de la
+        caché del detalle (cache_detalle.py). Un UPDATE para todos.
+        """
+        return self.update(fecha_actualizacion=timezone.now())
+
+    def en_caja(self, min_lat, min_lng, max_lat, max_lng):
+        """Inmuebles dentro de la caja, por el índice de geohash"""
+        return self.filter(filtro_caja(min_lat, min_lng, max_lat, max_lng))
+
+    def cerca_de(self, lat, lng, radio_km):
+        """Inmuebles a menos de radio_km del punto, del más cercano al más lejano"""
+        radio = math.degrees(radio_km / RADIO_TIERRA_KM)
+        return self.en_caja(*caja_radio(lat, lng, radio_km)).alias(
+            distancia=distancia_cuadrada(lat, lng)
+        ).filter(distancia__lte=radio * radio).order_by('distancia')
+
+    def buscar(self, termino):
+        """Filtra por el término con el motor configurado en BUSQUEDA_MOTOR"""
+        return obtener_motor(self.db).buscar(self, termino)
+
+
 class Inmuebles(models.Model):
     ref = models.IntegerField(unique=True)
-    codigo_sincronizacion = models.CharField(max_length=255, blank=True, null=True)
+    codigo_sincronizacion = models.CharField(max_length=255, blank=True, null=True, db_index=True)
     titulo = models.CharField(max_length=255, blank=True, null=True)
     descripcion = models.TextField(blank=True, null=True)
     descripcion_corta = models.TextField(blank=True, null=True)
@@ -228,6 +418,10 @@ class Inmuebles(models.Model):
     direccion = models.CharField(max_length=255, blank=True, null=True)
     latitud = models.CharField(max_length=255, blank=True, null=True)
     longitud = models.CharField(max_length=255, blank=True, null=True)
+    # Calculados desde latitud/longitud (geo.py)
+    latitud_num = models.FloatField(blank=True, null=True)
+    longitud_num = models.FloatField(blank=True, null=True)
+    geohash = models.CharField(max_length=12, blank=True, null=True, db_index=True)
     activo = models.IntegerField(blank=True, null=True)
     destacado = models.IntegerField(blank=True, null=True)
     en_caliente = models.IntegerField(blank=True, null=True)
@@ -235,7 +429,9 @@ class Inmuebles(models.Model):
     fecha_creacion = models.DateTimeField(blank=True, null=True)
     fecha_sincronizacion = models.DateTimeField(blank=True, null=True)
     hash_datos = models.TextField(blank=True, null=True)
-    slug = models.CharField(max_length=255, blank=True, null=True, db_comment='URL amigable para el inmueble')
+    slug = models.CharField(max_length=255, blank=True, null=True, unique=True, db_comment='URL amigable para el inmueble')
+
+    objects = InmueblesQuerySet.as_manager()
 
     def __str__(self):
         titulo = self.titulo or f"Inmueble #{self.ref}"
@@ -245,6 +441,9 @@ class Inmuebles(models.Model):
     
     def get_imagen_principal(self):
         """Obtiene la imagen principal (orden 0) del inmueble"""
+        # Si viene de con_imagen_principal() no se consulta la base de datos
+        if hasattr(self, '_imagen_principal'):
+            return self._imagen_principal[0] if self._imagen_principal else None
         try:
             # Buscar imagen con orden 0 o la primera imagen disponible
             imagen = self.imagenes_set.filter(orden=0).first()
@@ -264,6 +463,13 @@ class Inmuebles(models.Model):
         db_table = 'inmuebles'
         verbose_name = 'Inmueble'
         verbose_name_plural = 'Inmuebles'
+        indexes = [
+            # Paginación por cursor de la API (api.py)
+            models.Index(fields=['activo', 'ref'], name='inmuebles_activo_ref_idx'),
+            models.Index(fields=['ciudad_nombre', 'activo', 'ref'], name='inmuebles_ciudad_ref_idx'),
+            # Cambios desde la última marca del listado en columnas (columnas.py)
+            models.Index(fields=['fecha_actualizacion'], name='inmuebles_fecha_act_idx'),
+        ]
 
 
 class InmueblesEstados(models.Model):
@@ -279,6 +485,9 @@ class InmueblesEstados(models.Model):
     class Meta:
         managed = False
         db_table = 'inmuebles_estados'
+        indexes = [
+            models.Index(fields=['inmueble_ref', 'codigo_sincronizacion'], name='inmuebles_estados_ref_cod_idx'),
+        ]
 
 
 class InmueblesEtiquetas(models.Model):
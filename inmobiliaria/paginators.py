@@ -0,0 +1,109 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Paginator
+from django.db import OperationalError, connections
+from django.utils import formats
+from django.utils.functional import cached_property
+
+
+@contextmanager
+def tiempo_maximo(connection, milisegundos):
+    """Limita la duración de las consultas SELECT de la sesión en MySQL/MariaDB"""
+    if connection.vendor != 'mysql' or not milisegundos:
+        yield
+        return
+    if connection.mysql_is_mariadb:
+        variable, valor = 'max_statement_time', milisegundos / 1000
+    else:
+        variable, valor = 'max_execution_time', milisegundos
+    with connection.cursor() as cursor:
+        cursor.execute(f'SET SESSION {variable} = %s', [valor])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SET SESSION {variable} = 0')
+
+
+class ConteoAproximadoPaginator(Paginator):
+    """
+    Paginador que evita el COUNT(*) exacto sobre tablas grandes.
+    
+    Sin filtros usa las estadísticas de la tabla en MySQL; con filtros cuenta
+    como máximo ADMIN_CONTEO_LIMITE filas y muestra "1000+". Solo se activa
+    con ADMIN_CONTEO_APROXIMADO; si no, se comporta como Paginator.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.aproximado = False
+        self.truncado = False
+    
+    @cached_property
+    def count(self):
+        if not settings.ADMIN_CONTEO_APROXIMADO:
+            return super().count
+        queryset = self.object_list
+        limite = settings.ADMIN_CONTEO_LIMITE
+        if not queryset.query.where:
+            estimado = self._conteo_estimado(queryset)
+            # En tablas pequeñas el conteo exacto es barato y más preciso
+            if estimado is not None and estimado > limite:
+                self.aproximado = True
+                return estimado
+        return self._conteo_limitado(queryset, limite)
+    
+    def _conteo_estimado(self, queryset):
+        """Filas según information_schema (estadística de InnoDB)"""
+        connection = connections[queryset.db]
+        if connection.vendor != 'mysql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [queryset.model._meta.db_table],
+            )
+            fila = cursor.fetchone()
+        return fila[0] if fila and fila[0] is not None else None
+    
+    def _conteo_limitado(self, queryset, limite):
+        """Cuenta hasta limite + 1 filas; si se agota el tiempo asume que hay más"""
+        connection = connections[queryset.db]
+        try:
+            with tiempo_maximo(connection, settings.ADMIN_CONTEO_TIMEOUT_MS):
+                conteo = queryset.order_by()[:limite + 1].count()
+        except OperationalError:
+            conteo = limite + 1
+        if conteo > limite:
+            self.truncado = True
+            return limite
+        return conteo
+    
+    @property
+    def conteo_texto(self):
+        """Texto para el admin: '1000+', '≈ 1.234.567' o vacío si es exacto"""
+        if self.truncado:
+            return f"{formats.number_format(self.count, force_grouping=True)}+"
+        if self.aproximado:
+            return f"≈ {formats.number_format(self.count, force_grouping=True)}"
+        return ''
+    
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # Con un total aproximado puede haber páginas después de la última
+            if (self.truncado or self.aproximado) and int(number) > 1:
+                return int(number)
+            raise
+    
+    def page(self, number):
+        if not (self.truncado or self.aproximado):
+            return super().page(number)
+        number = self.validate_number(number)
+        inicio = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[inicio:inicio + self.per_page], number, self
+        )
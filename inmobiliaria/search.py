@@ -0,0 +1,178 @@
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, FloatField, Func, Q, TextField, Value
+from django.db.models.functions import Coalesce, Concat
+from django.utils.module_loading import import_string
+
+# Columnas del índice FULLTEXT inmuebles_busqueda_ft (migración 0004)
+CAMPOS_TEXTO = ('titulo', 'descripcion_corta', 'direccion')
+
+# Largo mínimo de palabra que indexa InnoDB (innodb_ft_min_token_size)
+LARGO_MINIMO_PALABRA = 3
+
+
+def quitar_acentos(texto):
+    """'Montería Café' -> 'monteria cafe'"""
+    if texto is None:
+        return None
+    descompuesto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def palabras(termino):
+    """Palabras de la búsqueda, sin operadores ni signos de puntuación"""
+    return re.findall(r'\w+', termino)
+
+
+def es_identificador(termino):
+    """Códigos, slugs y refs: una sola palabra con dígitos o guiones"""
+    termino = termino.strip()
+    return bool(termino) and ' ' not in termino and bool(re.search(r'[\d\-_]', termino))
+
+
+def filtro_identificadores(termino):
+    """Coincidencia exacta por ref, código de sincronización o slug"""
+    termino = termino.strip()
+    filtro = Q(codigo_sincronizacion=termino) | Q(slug=termino)
+    if termino.isdigit():
+        filtro |= Q(ref=int(termino))
+    return filtro
+
+
+def filtros_prefijos(termino):
+    """
+    Un Q por columna para los códigos y slugs que empiezan por el término
+    ('SYN' -> 'SYN-77').
+
+    Solo prefijos: en MySQL istartswith es LIKE 'x%' y usa los índices de
+    codigo_sincronizacion y slug; un '%x%' recorrería toda la tabla. Los
+    términos con espacios no son códigos y no dan ninguno.
+    """
+    termino = termino.strip()
+    if not termino or ' ' in termino:
+        return []
+    return [Q(codigo_sincronizacion__istartswith=termino), Q(slug__istartswith=termino)]
+
+
+class MotorBusqueda:
+    """
+    Interfaz de los motores de búsqueda de inmuebles.
+
+    buscar() recibe un QuerySet de Inmuebles y devuelve otro filtrado por el
+    término, sin duplicados.
+    """
+
+    def buscar(self, queryset, termino):
+        raise NotImplementedError
+
+
+class MotorLike(MotorBusqueda):
+    """Búsqueda original del admin: icontains (LIKE '%x%') sobre cada campo"""
+
+    campos = ('titulo', 'codigo_sincronizacion', 'direccion', 'slug')
+
+    def buscar(self, queryset, termino):
+        for palabra in termino.split():
+            filtro = Q()
+            for campo in self.campos:
+                filtro |= Q(**{f'{campo}__icontains': palabra})
+            queryset = queryset.filter(filtro)
+        return queryset
+
+
+class SinAcentos(Func):
+    """Función SIN_ACENTOS que registrar_sin_acentos agrega a SQLite"""
+    function = 'SIN_ACENTOS'
+    output_field = TextField()
+
+
+def registrar_sin_acentos(sender, connection, **kwargs):
+    """Receptor de connection_created: SIN_ACENTOS en cada conexión SQLite"""
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function(
+            'SIN_ACENTOS', 1, quitar_acentos, deterministic=True
+        )
+
+
+class MotorRespaldo(MotorBusqueda):
+    """
+    Motor portable para bases sin FULLTEXT (SQLite en las pruebas).
+
+    Exige todas las palabras en titulo, descripcion_corta o direccion e
+    ignora acentos en SQLite con SIN_ACENTOS (ver registrar_sin_acentos).
+    """
+
+    def buscar(self, queryset, termino):
+        texto = Concat(
+            *(Coalesce(F(campo), Value('')) for campo in CAMPOS_TEXTO),
+            output_field=TextField(),
+        )
+        if connections[queryset.db].vendor == 'sqlite':
+            texto = SinAcentos(texto)
+        queryset = queryset.alias(texto_busqueda=texto)
+
+        filtro = Q()
+        for palabra in palabras(termino):
+            filtro &= Q(texto_busqueda__icontains=quitar_acentos(palabra))
+        if es_identificador(termino):
+            filtro |= filtro_identificadores(termino)
+        return queryset.filter(filtro)
+
+
+class Coincidencia(Func):
+    """
+    MATCH (columnas) AGAINST (consulta IN BOOLEAN MODE). Las columnas son
+    F() para que el compilador ponga el alias de la tabla, también dentro de
+    una subconsulta (U0), y el MATCH no quede correlacionado con la externa.
+    """
+    template = 'MATCH (%(expressions)s) AGAINST (%%s IN BOOLEAN MODE)'
+    output_field = FloatField()
+
+    def __init__(self, *columnas, consulta):
+        super().__init__(*(F(columna) for columna in columnas))
+        self.consulta = consulta
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = super().as_sql(compiler, connection, **extra_context)
+        return sql, (*params, self.consulta)
+
+
+class MotorFullText(MotorBusqueda):
+    """
+    Búsqueda con MATCH ... AGAINST sobre el índice FULLTEXT de MySQL.
+
+    Los acentos se ignoran por la collation *_ai_ci / *_unicode_ci de las
+    columnas. Las palabras más cortas que el mínimo de InnoDB no están en el
+    índice, así que si no queda ninguna se usa MotorRespaldo.
+    """
+
+    def consulta_booleana(self, termino):
+        """'casa cerca' -> '+casa* +cerca*' (IN BOOLEAN MODE)"""
+        return ' '.join(
+            f'+{palabra}*' for palabra in palabras(termino)
+            if len(palabra) >= LARGO_MINIMO_PALABRA
+        )
+
+    def buscar(self, queryset, termino):
+        consulta = self.consulta_booleana(termino)
+        if not consulta:
+            return MotorRespaldo().buscar(queryset, termino)
+        queryset = queryset.alias(relevancia=Coincidencia(*CAMPOS_TEXTO, consulta=consulta))
+        filtro = Q(relevancia__gt=0)
+        # El OR impide usar el índice FULLTEXT: solo se agrega para códigos
+        if es_identificador(termino):
+            filtro |= filtro_identificadores(termino)
+        return queryset.filter(filtro)
+
+
+def obtener_motor(using='default'):
+    """Motor configurado en BUSQUEDA_MOTOR; 'auto' elige según la base de datos"""
+    motor = settings.BUSQUEDA_MOTOR
+    if motor == 'auto':
+        if connections[using].vendor == 'mysql':
+            return MotorFullText()
+        return MotorRespaldo()
+    return import_string(motor)()
@@ -0,0 +1,121 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+from .facets import invalidar_facetas
+from .geo import campos_geo
+from .caracteristicas import programar_pivote
+from .etiquetas import programar_indice
+from .mapa import programar_celdas
+from .miniaturas import TAMANOS_ASESOR, generar
+from .search import registrar_sin_acentos
+from .models import (
+    Assesor,
+    Barrios,
+    Caracteristica,
+    City,
+    EstadosInmueble,
+    Etiquetas,
+    Imagenes,
+    InmuebleCaracteristicas,
+    Inmuebles,
+    InmueblesEtiquetas,
+    TipoConsignacion,
+)
+
+# Modelos cuyas escrituras cambian los conteos de los filtros del admin y de
+# la API (Caracteristica y Etiquetas: los catálogos de sus filtros)
+MODELOS_FACETAS = (
+    Inmuebles, Imagenes, City, Barrios, EstadosInmueble, TipoConsignacion, Caracteristica, Etiquetas,
+)
+
+for modelo in MODELOS_FACETAS:
+    post_save.connect(invalidar_facetas, sender=modelo, dispatch_uid=f'facetas_save_{modelo.__name__}')
+    post_delete.connect(invalidar_facetas, sender=modelo, dispatch_uid=f'facetas_delete_{modelo.__name__}')
+
+connection_created.connect(registrar_sin_acentos, dispatch_uid='sin_acentos_sqlite')
+
+
+def miniaturas_asesor(sender, instance, **kwargs):
+    """Genera las versiones reducidas de la foto; no hace nada si ya están al día"""
+    if instance.foto:
+        generar(instance.foto.path, TAMANOS_ASESOR)
+
+
+post_save.connect(miniaturas_asesor, sender=Assesor, dispatch_uid='miniaturas_asesor')
+
+
+def coordenadas_inmueble(sender, instance, **kwargs):
+    """
+    Mantiene latitud_num, longitud_num y geohash al guardar desde el admin, y
+    recuerda el geohash anterior para recalcular su celda del mapa.
+    """
+    instance._geohash_anterior = None
+    if instance.pk is not None:
+        instance._geohash_anterior = sender.objects.filter(pk=instance.pk).values_list(
+            'geohash', flat=True
+        ).first()
+    for campo, valor in campos_geo(instance.latitud, instance.longitud).items():
+        setattr(instance, campo, valor)
+
+
+def celdas_inmueble(sender, instance, **kwargs):
+    """Recalcula las celdas del mapa donde estaba y donde está el inmueble"""
+    programar_celdas({instance.geohash, getattr(instance, '_geohash_anterior', None)})
+
+
+pre_save.connect(coordenadas_inmueble, sender=Inmuebles, dispatch_uid='coordenadas_inmueble')
+post_save.connect(celdas_inmueble, sender=Inmuebles, dispatch_uid='celdas_inmueble_save')
+post_delete.connect(celdas_inmueble, sender=Inmuebles, dispatch_uid='celdas_inmueble_delete')
+
+
+def tocar_inmueble(sender, instance, **kwargs):
+    """
+    Cambia fecha_actualizacion del inmueble de una imagen, característica o
+    etiqueta: es la versión del ETag y de la caché del detalle (cache_detalle.py).
+    """
+    if instance.inmueble_id is not None:
+        Inmuebles.objects.filter(pk=instance.inmueble_id).tocar()
+
+
+for modelo in (Imagenes, InmuebleCaracteristicas, InmueblesEtiquetas):
+    post_save.connect(tocar_inmueble, sender=modelo, dispatch_uid=f'tocar_save_{modelo.__name__}')
+    post_delete.connect(tocar_inmueble, sender=modelo, dispatch_uid=f'tocar_delete_{modelo.__name__}')
+
+
+def tocar_inmuebles_catalogo(sender, instance, created=False, **kwargs):
+    """
+    El detalle muestra el nombre y la unidad de las características y el
+    nombre y el color de las etiquetas: al cambiarlas se tocan los inmuebles
+    que las usan (un UPDATE con subconsulta).
+    """
+    if created:
+        return
+    if sender is Caracteristica:
+        usos = InmuebleCaracteristicas.objects.filter(caracteristica_id=instance.pk)
+    else:
+        usos = InmueblesEtiquetas.objects.filter(etiqueta_id=instance.pk)
+    Inmuebles.objects.filter(pk__in=usos.values('inmueble_id')).tocar()
+
+
+for modelo in (Caracteristica, Etiquetas):
+    post_save.connect(tocar_inmuebles_catalogo, sender=modelo, dispatch_uid=f'tocar_catalogo_save_{modelo.__name__}')
+    # Antes de borrar: después ya no se sabe qué inmuebles la usaban
+    pre_delete.connect(tocar_inmuebles_catalogo, sender=modelo, dispatch_uid=f'tocar_catalogo_delete_{modelo.__name__}')
+
+
+def pivote_inmueble(sender, instance, **kwargs):
+    """Rehace la fila del pivote de características del inmueble"""
+    programar_pivote({instance.inmueble_id})
+
+
+post_save.connect(pivote_inmueble, sender=InmuebleCaracteristicas, dispatch_uid='pivote_inmueble_save')
+post_delete.connect(pivote_inmueble, sender=InmuebleCaracteristicas, dispatch_uid='pivote_inmueble_delete')
+
+
+def indice_etiquetas_inmueble(sender, instance, **kwargs):
+    """Actualiza el índice de etiquetas del inmueble"""
+    programar_indice({instance.inmueble_id})
+
+
+post_save.connect(indice_etiquetas_inmueble, sender=InmueblesEtiquetas, dispatch_uid='indice_etiquetas_save')
+post_delete.connect(indice_etiquetas_inmueble, sender=InmueblesEtiquetas, dispatch_uid='indice_etiquetas_delete')
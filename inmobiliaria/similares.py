@@ -0,0 +1,297 @@
+"""
+Inmuebles parecidos a cada inmueble activo ("inmuebles como este").
+
+Buscarlos en SQL es puntuar todas las filas de inmuebles en cada visita. Aquí
+cada inmueble activo es un vector: precio por m², área, habitaciones, baños,
+estrato y coordenadas (divididos por una escala fija, con los faltantes en
+la media), el tipo de inmueble y sus etiquetas (uno por valor). Los vecinos
+son los de menor distancia euclídea con la misma consignación (una venta no
+se parece a un arriendo), puntuados con NumPy por bloques de filas.
+
+Las listas se guardan en inmuebles_similares y el detalle solo las lee. El
+comando similares las pone al día: recalcula los inmuebles con otra
+fecha_actualizacion, los que tenían en su lista uno cambiado o retirado y
+aquellos a los que un cambiado ahora les queda más cerca que su último
+vecino; con --reconstruir, todas. Como las escalas son fijas, el vector de
+un inmueble sin cambios no se mueve y la puesta al día da lo mismo que
+reconstruir (salvo en los que no tienen algún dato, que toman la media).
+"""
+import math
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from django.db import transaction
+from django.db.models.functions import Coalesce
+
+from .models import Inmuebles, InmueblesEtiquetas, SimilaresInmueble
+
+VECINOS = 12
+# Filas puntuadas a la vez contra todas las de su consignación
+LOTE = 256
+# Con más inmuebles cambiados que esto, reconstruir todo es más barato
+MAXIMO_INCREMENTAL = 5000
+
+# Diferencia que vale 1 en la distancia; precio por m² y área en logaritmo
+ESCALAS = {
+    'precio_m2': 0.25,
+    'area': 0.35,
+    'habitaciones': 1.0,
+    'banos': 1.5,
+    'estrato': 1.0,
+    'coordenadas': 2.0,  # km
+}
+# Distancia entre dos tipos de inmueble distintos, y por cada etiqueta no compartida
+PESO_TIPO = 2.0
+PESO_ETIQUETA = 0.5
+KM_POR_GRADO = 111.32
+
+
+@dataclass
+class ResultadoSimilares:
+    inmuebles: int = 0
+    recalculados: int = 0
+    retirados: int = 0
+    segundos: float = 0.0
+
+
+def _escalar(valores, escala):
+    """(x - media) / escala; los NaN quedan en la media (centrar no cambia las distancias)"""
+    conocidos = valores[~np.isnan(valores)]
+    if not len(conocidos):
+        return np.zeros_like(valores)
+    return np.nan_to_num((valores - conocidos.mean()) / escala, nan=0.0)
+
+
+def _una_por_valor(codigos, peso):
+    """Una columna con `peso` por cada valor distinto de `codigos` (-1 = ninguno)"""
+    valores = np.unique(codigos[codigos >= 0])
+    columnas = np.zeros((len(codigos), len(valores)), dtype=np.float32)
+    filas = np.flatnonzero(codigos >= 0)
+    columnas[filas, np.searchsorted(valores, codigos[filas])] = peso
+    return columnas
+
+
+class MatrizSimilares:
+    """Vectores de los inmuebles activos, una fila por inmueble, en orden de ref"""
+
+    def __init__(self, ids, refs, fechas, consignaciones, vectores):
+        self.ids = ids
+        self.refs = refs
+        self.fechas = fechas
+        self.consignaciones = consignaciones
+        self.vectores = vectores
+        self.normas = np.einsum('ij,ij->i', vectores, vectores)
+        self.posiciones = {pk: posicion for posicion, pk in enumerate(ids.tolist())}
+        self.grupos = {
+            codigo: np.flatnonzero(consignaciones == codigo) for codigo in np.unique(consignaciones)
+        }
+        # Los vectores y normas de cada consignación, contiguos para la multiplicación
+        self.vectores_grupo = {codigo: vectores[grupo] for codigo, grupo in self.grupos.items()}
+        self.normas_grupo = {codigo: self.normas[grupo] for codigo, grupo in self.grupos.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def leer(cls):
+        """Los inmuebles activos y sus etiquetas: dos consultas"""
+        filas = list(Inmuebles.objects.activos().annotate(
+            precio=Coalesce('precio_venta', 'precio_canon'),
+        ).order_by('ref').values_list(
+            'pk', 'ref', 'fecha_actualizacion', 'tipo_consignacion_id', 'precio', 'area',
+            'habitaciones', 'banos', 'estrato', 'latitud_num', 'longitud_num', 'tipo_inmueble_id',
+        ))
+        ids = np.array([fila[0] for fila in filas], dtype=np.int64)
+        refs = np.array([fila[1] for fila in filas], dtype=np.int64)
+        fechas = [fila[2] for fila in filas]
+        consignaciones = np.array([-1 if fila[3] is None else fila[3] for fila in filas], dtype=np.int64)
+
+        def columna(posicion):
+            return np.array(
+                [np.nan if fila[posicion] is None else float(fila[posicion]) for fila in filas],
+                dtype=np.float64,
+            )
+
+        precio, area = columna(4), columna(5)
+        validos = (precio > 0) & (area > 0)
+        precio_m2 = np.full(len(filas), np.nan)
+        precio_m2[validos] = np.log(precio[validos] / area[validos])
+        positivas = area > 0
+        area[positivas] = np.log(area[positivas])
+        area[~positivas] = np.nan
+        # Coordenadas en km (la longitud con el coseno de la latitud de cada fila)
+        latitud, longitud = columna(9), columna(10)
+        norte = latitud * KM_POR_GRADO
+        este = longitud * KM_POR_GRADO * np.cos(np.radians(latitud))
+        columnas = [
+            _escalar(precio_m2, ESCALAS['precio_m2']),
+            _escalar(area, ESCALAS['area']),
+            _escalar(columna(6), ESCALAS['habitaciones']),
+            _escalar(columna(7), ESCALAS['banos']),
+            _escalar(columna(8), ESCALAS['estrato']),
+            _escalar(norte, ESCALAS['coordenadas']),
+            _escalar(este, ESCALAS['coordenadas']),
+        ]
+        tipos = np.array([-1 if fila[11] is None else fila[11] for fila in filas], dtype=np.int64)
+        vectores = np.hstack([
+            np.column_stack(columnas).astype(np.float32) if filas else np.zeros((0, len(columnas)), np.float32),
+            _una_por_valor(tipos, PESO_TIPO / math.sqrt(2)),
+            cls._etiquetas(ids),
+        ])
+        return cls(ids, refs, fechas, consignaciones, np.ascontiguousarray(vectores, dtype=np.float32))
+
+    @staticmethod
+    def _etiquetas(ids):
+        """Una columna por etiqueta con PESO_ETIQUETA en las filas que la tienen"""
+        posiciones = {pk: posicion for posicion, pk in enumerate(ids.tolist())}
+        pares = [
+            (posiciones[inmueble_id], etiqueta_id)
+            for inmueble_id, etiqueta_id in InmueblesEtiquetas.objects.filter(
+                etiqueta_id__isnull=False,
+            ).values_list('inmueble_id', 'etiqueta_id')
+            if inmueble_id in posiciones
+        ]
+        etiquetas = sorted({etiqueta_id for _, etiqueta_id in pares})
+        columnas = np.zeros((len(ids), len(etiquetas)), dtype=np.float32)
+        orden = {etiqueta_id: columna for columna, etiqueta_id in enumerate(etiquetas)}
+        for posicion, etiqueta_id in pares:
+            columnas[posicion, orden[etiqueta_id]] = PESO_ETIQUETA
+        return columnas
+
+    def puntajes(self, posiciones, codigo):
+        """
+        Distancias al cuadrado de las filas `posiciones` a las de la
+        consignación `codigo`, menos la norma de cada fila (no cambia el
+        orden dentro de la fila). En el lugar, sin copias de la matriz.
+        """
+        puntajes = self.vectores[posiciones] @ self.vectores_grupo[codigo].T
+        puntajes *= -2
+        puntajes += self.normas_grupo[codigo]
+        return puntajes
+
+    def vecinos(self, posiciones, cantidad=VECINOS):
+        """
+        {posición: refs de sus vecinos más cercanos, del más parecido al
+        menos} para las filas `posiciones`, por bloques de LOTE.
+        """
+        resultado = {}
+        posiciones = np.asarray(posiciones, dtype=np.int64)
+        for codigo, grupo in self.grupos.items():
+            propias = posiciones[self.consignaciones[posiciones] == codigo]
+            cuantos = min(cantidad, len(grupo) - 1)
+            for inicio in range(0, len(propias), LOTE):
+                bloque = propias[inicio:inicio + LOTE]
+                puntajes = self.puntajes(bloque, codigo)
+                # Sin el propio inmueble
+                puntajes[np.arange(len(bloque)), np.searchsorted(grupo, bloque)] = np.inf
+                if cuantos <= 0:
+                    resultado.update((int(posicion), []) for posicion in bloque)
+                    continue
+                mejores = np.argpartition(puntajes, cuantos - 1, axis=1)[:, :cuantos]
+                for fila, posicion in enumerate(bloque):
+                    candidatos = grupo[mejores[fila]]
+                    # Empates por ref, para que el resultado no dependa de la partición
+                    orden = np.lexsort((self.refs[candidatos], puntajes[fila, mejores[fila]]))
+                    resultado[int(posicion)] = self.refs[candidatos[orden]].tolist()
+        return resultado
+
+    def alcanzados(self, cambiadas, ultimos):
+        """
+        Posiciones a las que alguna de `cambiadas` les queda más cerca que
+        su último vecino (`ultimos`: posición de ese vecino, o -1 si la
+        lista está incompleta).
+        """
+        cambiadas = np.asarray(cambiadas, dtype=np.int64)
+        alcanzadas = np.zeros(len(self.ids), dtype=bool)
+        limites = np.full(len(self.ids), np.inf)
+        conocidos = ultimos >= 0
+        diferencias = self.vectores[conocidos] - self.vectores[ultimos[conocidos]]
+        limites[conocidos] = np.einsum('ij,ij->i', diferencias, diferencias)
+        for codigo, grupo in self.grupos.items():
+            propias = cambiadas[self.consignaciones[cambiadas] == codigo]
+            for inicio in range(0, len(propias), LOTE):
+                bloque = propias[inicio:inicio + LOTE]
+                distancias = self.puntajes(bloque, codigo)
+                distancias += self.normas[bloque, None]
+                alcanzadas[grupo] |= distancias.min(axis=0) < limites[grupo]
+        return np.flatnonzero(alcanzadas)
+
+
+def _guardar(matriz, vecinos, borrar=True):
+    """Reemplaza las filas de inmuebles_similares de las posiciones de `vecinos`"""
+    ids = [int(matriz.ids[posicion]) for posicion in vecinos]
+    with transaction.atomic():
+        if borrar:
+            for inicio in range(0, len(ids), 1000):
+                SimilaresInmueble.objects.filter(inmueble_id__in=ids[inicio:inicio + 1000]).delete()
+        SimilaresInmueble.objects.bulk_create(
+            (
+                SimilaresInmueble(inmueble_id=pk, refs=refs, fecha_origen=matriz.fechas[posicion])
+                for pk, (posicion, refs) in zip(ids, vecinos.items())
+            ),
+            batch_size=1000,
+        )
+
+
+def reconstruir_similares():
+    """Recalcula los vecinos de todos los inmuebles activos"""
+    resultado = ResultadoSimilares()
+    inicio = time.perf_counter()
+    matriz = MatrizSimilares.leer()
+    vecinos = matriz.vecinos(np.arange(len(matriz)))
+    with transaction.atomic():
+        resultado.retirados = SimilaresInmueble.objects.exclude(inmueble_id__in=Inmuebles.objects.activos()).count()
+        SimilaresInmueble.objects.all().delete()
+        _guardar(matriz, vecinos, borrar=False)
+    resultado.inmuebles = resultado.recalculados = len(matriz)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def refrescar_similares():
+    """
+    Recalcula solo los vecinos que pueden haber cambiado desde la última
+    pasada (ver el docstring del módulo) y borra los de inmuebles retirados.
+    """
+    resultado = ResultadoSimilares()
+    inicio = time.perf_counter()
+    matriz = MatrizSimilares.leer()
+    guardados = {
+        inmueble_id: (refs, fecha)
+        for inmueble_id, refs, fecha in SimilaresInmueble.objects.values_list('inmueble_id', 'refs', 'fecha_origen')
+    }
+    retirados = [pk for pk in guardados if pk not in matriz.posiciones]
+    cambiadas = [
+        posicion for posicion, pk in enumerate(matriz.ids.tolist())
+        if pk not in guardados or guardados[pk][1] != matriz.fechas[posicion]
+    ]
+    if len(cambiadas) + len(retirados) > MAXIMO_INCREMENTAL:
+        return reconstruir_similares()
+
+    posicion_ref = {ref: posicion for posicion, ref in enumerate(matriz.refs.tolist())}
+    tocadas = {int(matriz.refs[posicion]) for posicion in cambiadas}
+    pendientes = set(cambiadas)
+    ultimos = np.full(len(matriz), -1, dtype=np.int64)
+    for pk, (refs, _) in guardados.items():
+        posicion = matriz.posiciones.get(pk)
+        if posicion is None:
+            continue
+        # Con un vecino cambiado o que ya no está activo
+        if tocadas.intersection(refs) or any(ref not in posicion_ref for ref in refs):
+            pendientes.add(posicion)
+        elif len(refs) >= min(VECINOS, len(matriz.grupos[matriz.consignaciones[posicion]]) - 1):
+            ultimos[posicion] = posicion_ref[refs[-1]] if refs else -1
+    if cambiadas:
+        pendientes.update(matriz.alcanzados(cambiadas, ultimos).tolist())
+
+    vecinos = matriz.vecinos(sorted(pendientes))
+    with transaction.atomic():
+        for desde in range(0, len(retirados), 1000):
+            SimilaresInmueble.objects.filter(inmueble_id__in=retirados[desde:desde + 1000]).delete()
+        _guardar(matriz, vecinos)
+    resultado.inmuebles = len(matriz)
+    resultado.recalculados = len(vecinos)
+    resultado.retirados = len(retirados)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
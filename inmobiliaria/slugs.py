@@ -0,0 +1,140 @@
+"""
+Slugs únicos de inmuebles (la URL de /api/inmuebles/<slug>/).
+
+inmuebles.slug tiene índice único. El feed trae el slug, pero puede venir
+vacío o repetido: si otro inmueble ya lo usa, se le agrega la ref
+('casa-en-el-recreo-1234'). El comando rellenar_slugs arregla las filas
+existentes: conserva el slug del inmueble de menor ref y cambia los demás.
+"""
+import time
+from dataclasses import dataclass
+
+from django.db import connection, transaction
+from django.db.models import Count, Min
+from django.utils.text import slugify
+
+from .models import Inmuebles
+
+LARGO_MAXIMO = 255
+INMUEBLES = Inmuebles._meta.db_table
+# Tabla temporal de cada lote de rellenar_slugs: (ref, slug nuevo)
+TEMPORAL = 'slugs_nuevos'
+# Rutas de la API que no pueden ser slugs
+RESERVADOS = {'cerca', 'mapa', 'facetas'}
+
+
+@dataclass
+class ResultadoSlugs:
+    revisados: int = 0
+    cambiados: int = 0
+    segundos: float = 0.0
+
+
+def slug_base(slug, titulo, ref):
+    """El slug normalizado, o uno hecho del título si no hay"""
+    base = slugify(slug or '') or slugify(titulo or '') or f'inmueble-{ref}'
+    return base[:LARGO_MAXIMO].strip('-')
+
+
+def _con_sufijo(base, ref, intento):
+    sufijo = f'-{ref}' if intento == 0 else f'-{ref}-{intento + 1}'
+    return f'{base[:LARGO_MAXIMO - len(sufijo)]}{sufijo}'
+
+
+def _duenos(slugs):
+    """{slug: {refs}} de los inmuebles que ya usan esos slugs"""
+    duenos = {}
+    for slug, ref in Inmuebles.objects.filter(slug__in=slugs).values_list('slug', 'ref'):
+        duenos.setdefault(slug, set()).add(ref)
+    return duenos
+
+
+def unicos(deseados):
+    """
+    {ref: slug} sin repetidos entre sí ni con otros inmuebles de la base.
+    Recibe {ref: slug deseado}; gana el de menor ref y, a los demás, se les
+    agrega la ref. Una consulta por ronda (casi siempre una).
+    """
+    finales, usados = {}, set()
+    pendientes = {ref: (slug, slug) for ref, slug in sorted(deseados.items())}
+    intento = 0
+    while pendientes:
+        duenos = _duenos({slug for slug, _ in pendientes.values()})
+        siguientes = {}
+        for ref, (slug, base) in pendientes.items():
+            if slug in RESERVADOS or slug in usados or duenos.get(slug, set()) - {ref}:
+                siguientes[ref] = (_con_sufijo(base, ref, intento), base)
+            else:
+                finales[ref] = slug
+                usados.add(slug)
+        pendientes = siguientes
+        intento += 1
+    return finales
+
+
+def _sql_actualizar(connection):
+    """UPDATE ... JOIN de inmuebles con la tabla temporal"""
+    if connection.vendor == 'mysql':
+        return f'UPDATE {INMUEBLES} i JOIN {TEMPORAL} n ON i.ref = n.ref SET i.slug = n.slug'
+    # SQLite 3.33+ / PostgreSQL: UPDATE ... FROM
+    return f'UPDATE {INMUEBLES} AS i SET slug = n.slug FROM {TEMPORAL} AS n WHERE i.ref = n.ref'
+
+
+def rellenar_slugs(lote=2000):
+    """
+    Normaliza los slugs de todos los inmuebles por lotes de ref: genera los
+    que faltan y, de cada slug repetido, deja solo el del menor ref.
+
+    Los cambios de cada lote van a una tabla temporal con un INSERT de
+    varias filas (PyMySQL agrupa el executemany) y se aplican con un solo
+    UPDATE ... JOIN, como en estados.py.
+    """
+    resultado = ResultadoSlugs()
+    inicio = time.perf_counter()
+    # Slug repetido -> ref que lo conserva
+    ganadores = dict(
+        Inmuebles.objects.exclude(slug__isnull=True).values('slug')
+        .annotate(cantidad=Count('pk'), primero=Min('ref')).filter(cantidad__gt=1)
+        .values_list('slug', 'primero')
+    )
+    actualizar = _sql_actualizar(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {TEMPORAL} '
+            f'(ref INTEGER NOT NULL PRIMARY KEY, slug VARCHAR({LARGO_MAXIMO}) NOT NULL)'
+        )
+    try:
+        ultimo = None
+        while True:
+            filas = Inmuebles.objects.order_by('ref')
+            if ultimo is not None:
+                filas = filas.filter(ref__gt=ultimo)
+            filas = list(filas.values_list('ref', 'slug', 'titulo')[:lote])
+            if not filas:
+                break
+            ultimo = filas[-1][0]
+            resultado.revisados += len(filas)
+            deseados = {
+                ref: slug_base(slug, titulo, ref)
+                for ref, slug, titulo in filas
+                if not slug or slug in RESERVADOS or slug != slugify(slug)
+                or ganadores.get(slug, ref) != ref
+            }
+            if not deseados:
+                continue
+            actuales = {ref: slug for ref, slug, _ in filas}
+            cambios = [
+                (ref, slug) for ref, slug in unicos(deseados).items() if slug != actuales[ref]
+            ]
+            if not cambios:
+                continue
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {TEMPORAL}')
+                cursor.executemany(f'INSERT INTO {TEMPORAL} (ref, slug) VALUES (%s, %s)', cambios)
+                cursor.execute(actualizar)
+            resultado.cambiados += len(cambios)
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {TEMPORAL}')
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
@@ -0,0 +1,337 @@
+"""
+Ingesta del feed de inmuebles.
+
+El feed trae un registro por inmueble (JSON Lines o CSV) con los nombres de
+campo del modelo Inmuebles y, opcionalmente, la lista `imagenes` (en CSV,
+URLs separadas por '|'). Cada registro se normaliza, se le calcula el hash
+de hashing.py y se compara con Inmuebles.hash_datos: solo se escriben las
+filas nuevas o cambiadas, con bulk_create/bulk_update en lotes, cada lote en
+su transacción. Las imágenes solo se tocan si cambió su grupo del hash.
+Al final se recalculan las celdas del mapa (mapa.py) de los inmuebles
+escritos, en su ubicación anterior y en la nueva.
+"""
+import csv
+import json
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .almacen import recontar_referencias
+from .facets import invalidar_facetas
+from .geo import campos_geo
+from .hashing import CAMPO_A_GRUPO, GRUPO_GENERAL, grupos_cambiados, hash_registros
+from .mapa import actualizar_celdas
+from .slugs import slug_base, unicos
+from .models import (
+    Assesor,
+    Barrios,
+    City,
+    EstadosInmueble,
+    Imagenes,
+    Inmuebles,
+    TipoConsignacion,
+    TiposInmueble,
+    UsosInmueble,
+)
+
+# Campos que administra la sincronización y no vienen del feed
+CAMPOS_INTERNOS = {
+    'id', 'hash_datos', 'fecha_creacion', 'fecha_actualizacion', 'fecha_sincronizacion',
+    'latitud_num', 'longitud_num', 'geohash',
+}
+
+# Relación -> (modelo de catálogo, columna *_nombre desnormalizada)
+RELACIONES = {
+    'ciudad': (City, 'ciudad_nombre'),
+    'barrio': (Barrios, 'barrio_nombre'),
+    'tipo_inmueble': (TiposInmueble, 'tipo_inmueble_nombre'),
+    'uso_inmueble': (UsosInmueble, 'uso_inmueble_nombre'),
+    'estado_inmueble': (EstadosInmueble, 'estado_inmueble_nombre'),
+    'tipo_consignacion': (TipoConsignacion, 'tipo_consignacion_nombre'),
+    'asesor': (Assesor, 'asesor_nombre'),
+}
+
+
+def campos_feed():
+    """Campos de Inmuebles que se leen del feed, por attname"""
+    return {
+        campo.attname: campo
+        for campo in Inmuebles._meta.concrete_fields
+        if campo.attname not in CAMPOS_INTERNOS
+    }
+
+
+def leer_feed(ruta, formato=None):
+    """Itera los registros del archivo sin cargarlo completo en memoria"""
+    formato = formato or ('csv' if str(ruta).endswith('.csv') else 'jsonl')
+    with open(ruta, encoding='utf-8', newline='') as archivo:
+        if formato == 'csv':
+            for fila in csv.DictReader(archivo):
+                yield {clave: (valor if valor != '' else None) for clave, valor in fila.items()}
+        else:
+            for linea in archivo:
+                if linea.strip():
+                    yield json.loads(linea)
+
+
+def extraer_imagenes(crudo):
+    """URLs de imágenes del registro en orden; None si el feed no las trae"""
+    imagenes = crudo.get('imagenes')
+    if imagenes is None:
+        return None
+    if isinstance(imagenes, str):
+        imagenes = imagenes.split('|')
+    urls = (imagen.get('url') if isinstance(imagen, dict) else imagen for imagen in imagenes)
+    return [url.strip() for url in urls if url and url.strip()]
+
+
+class ResolutorCatalogos:
+    """Traduce los *_nombre del feed a las llaves foráneas, con catálogos en memoria"""
+
+    def __init__(self):
+        self.ids = {}
+        for relacion, (modelo, _) in RELACIONES.items():
+            if modelo is Barrios:
+                valores = modelo.objects.values_list('ciudad_id', 'nombre', 'pk')
+                self.ids[relacion] = {(c, n.strip().lower()): pk for c, n, pk in valores}
+            else:
+                valores = modelo.objects.values_list('nombre', 'pk')
+                self.ids[relacion] = {n.strip().lower(): pk for n, pk in valores}
+
+    def resolver(self, registro):
+        for relacion, (modelo, columna_nombre) in RELACIONES.items():
+            attname = f'{relacion}_id'
+            nombre = registro.get(columna_nombre)
+            if registro.get(attname) is not None or not nombre:
+                continue
+            clave = nombre.strip().lower()
+            if modelo is Barrios:
+                clave = (registro.get('ciudad_id'), clave)
+            registro[attname] = self.ids[relacion].get(clave)
+
+
+def normalizar_registro(crudo, campos, resolutor=None):
+    """Convierte los valores del feed a los tipos del modelo"""
+    registro = {}
+    for clave, valor in crudo.items():
+        campo = campos.get(clave)
+        if campo is None:
+            continue
+        if isinstance(valor, str):
+            valor = valor.strip() or None
+        valor = campo.to_python(valor)
+        if valor is not None and campo.get_internal_type() == 'DateTimeField' and timezone.is_naive(valor):
+            valor = timezone.make_aware(valor)
+        registro[campo.attname] = valor
+    if registro.get('ref') is None:
+        raise ValidationError('El registro no tiene ref')
+    if resolutor is not None:
+        resolutor.resolver(registro)
+    if 'latitud' in registro and 'longitud' in registro:
+        registro.update(campos_geo(registro['latitud'], registro['longitud']))
+    return registro
+
+
+@dataclass
+class ResultadoSync:
+    leidos: int = 0
+    nuevos: int = 0
+    actualizados: int = 0
+    sin_cambios: int = 0
+    imagenes_nuevas: int = 0
+    imagenes_borradas: int = 0
+    errores: list = field(default_factory=list)
+    segundos: float = 0.0
+
+    @property
+    def filas_por_segundo(self):
+        return self.leidos / self.segundos if self.segundos else 0.0
+
+
+def lotes(iterable, tamano):
+    iterador = iter(iterable)
+    while lote := list(islice(iterador, tamano)):
+        yield lote
+
+
+def sincronizar(registros, tamano_lote=1000, resultado=None):
+    """
+    Sincroniza un iterable de registros crudos del feed con la tabla inmuebles.
+
+    Por lote hace una consulta para leer (ref, pk, hash_datos) y como mucho un
+    bulk_create y un bulk_update.
+    """
+    resultado = resultado or ResultadoSync()
+    inicio = time.perf_counter()
+    campos = campos_feed()
+    resolutor = ResolutorCatalogos()
+    geohashes = set()
+
+    for lote in lotes(registros, tamano_lote):
+        normalizados, imagenes = {}, {}
+        for crudo in lote:
+            resultado.leidos += 1
+            try:
+                registro = normalizar_registro(crudo, campos, resolutor)
+            except (ValidationError, TypeError, ValueError) as error:
+                resultado.errores.append((crudo.get('ref'), str(error)))
+                continue
+            # Si el feed repite una ref, gana el último registro
+            normalizados[registro['ref']] = registro
+            imagenes[registro['ref']] = extraer_imagenes(crudo)
+        geohashes |= _escribir_lote(normalizados, imagenes, resultado)
+
+    if resultado.nuevos or resultado.actualizados:
+        invalidar_facetas()
+        actualizar_celdas(geohashes)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def _escribir_lote(normalizados, imagenes, resultado):
+    """Escribe el lote y devuelve los geohashes, anteriores y nuevos, de lo escrito"""
+    existentes = {
+        ref: (pk, hash_datos, geohash)
+        for ref, pk, hash_datos, geohash in Inmuebles.objects.filter(
+            ref__in=normalizados.keys()
+        ).values_list('ref', 'pk', 'hash_datos', 'geohash')
+    }
+    hashes = hash_registros(
+        {**registro, 'imagenes': imagenes[ref]} for ref, registro in normalizados.items()
+    )
+    _asignar_slugs(normalizados, existentes, hashes)
+    ahora = timezone.now()
+    nuevos, cambiados, imagenes_pendientes, geohashes = [], {}, {}, set()
+    for (ref, registro), hash_nuevo in zip(normalizados.items(), hashes):
+        hash_datos = hash_nuevo.serializar()
+        if ref not in existentes:
+            nuevos.append(Inmuebles(
+                hash_datos=hash_datos, fecha_creacion=ahora, fecha_actualizacion=ahora,
+                fecha_sincronizacion=ahora, **registro,
+            ))
+            grupos = {'imagenes'}
+        elif existentes[ref][1] != hash_datos:
+            grupos = grupos_cambiados(existentes[ref][1], hash_nuevo)
+            cambiados[existentes[ref][0]] = (registro, hash_datos, grupos)
+        else:
+            resultado.sin_cambios += 1
+            continue
+        geohashes.add(registro.get('geohash'))
+        if ref in existentes:
+            geohashes.add(existentes[ref][2])
+        if 'imagenes' in grupos and imagenes[ref] is not None:
+            imagenes_pendientes[ref] = imagenes[ref]
+
+    with transaction.atomic():
+        if nuevos:
+            Inmuebles.objects.bulk_create(nuevos)
+        for campos, inmuebles in _agrupar_cambios(cambiados, ahora).items():
+            Inmuebles.objects.bulk_update(
+                inmuebles,
+                sorted(campos | {'hash_datos', 'fecha_actualizacion', 'fecha_sincronizacion'}),
+            )
+        if imagenes_pendientes:
+            _sincronizar_imagenes(imagenes_pendientes, resultado)
+    resultado.nuevos += len(nuevos)
+    resultado.actualizados += len(cambiados)
+    return geohashes
+
+
+def _asignar_slugs(normalizados, existentes, hashes):
+    """
+    Slugs únicos (slugs.py) para los registros que se van a escribir. Va
+    después del hash: el hash guarda el slug del feed y el que se escribe
+    puede llevar la ref, así el mismo feed no cuenta como cambio.
+    """
+    slugs = {
+        ref: slug_base(registro.get('slug'), registro.get('titulo'), ref)
+        for (ref, registro), hash_nuevo in zip(normalizados.items(), hashes)
+        if ref not in existentes
+        or ('slug' in registro and existentes[ref][1] != hash_nuevo.serializar())
+    }
+    for ref, slug in unicos(slugs).items():
+        normalizados[ref]['slug'] = slug
+
+
+def _agrupar_cambios(cambiados, ahora):
+    """
+    Agrupa los inmuebles cambiados por el conjunto de columnas que difieren.
+
+    Solo se leen (en una consulta) las columnas de los grupos del hash que
+    cambiaron, y solo se actualizan las que difieren: bulk_update arma un CASE
+    por columna y fila, así que escribir las 40 columnas cuando cambió el
+    precio es mucho más lento.
+    """
+    if not cambiados:
+        return {}
+    columnas_por_pk = {
+        pk: [
+            columna for columna in registro
+            if columna != 'ref' and CAMPO_A_GRUPO.get(columna, GRUPO_GENERAL) in grupos
+        ]
+        for pk, (registro, _, grupos) in cambiados.items()
+    }
+    columnas = set().union(*columnas_por_pk.values())
+    actuales = Inmuebles.objects.filter(pk__in=cambiados.keys()).values('pk', *columnas)
+    grupos_update = defaultdict(list)
+    for actual in actuales:
+        registro, hash_datos, _ = cambiados[actual['pk']]
+        diferentes = frozenset(
+            columna for columna in columnas_por_pk[actual['pk']]
+            if actual[columna] != registro[columna]
+        )
+        grupos_update[diferentes].append(Inmuebles(
+            pk=actual['pk'], hash_datos=hash_datos, fecha_actualizacion=ahora,
+            fecha_sincronizacion=ahora, **registro,
+        ))
+    return grupos_update
+
+
+def _sincronizar_imagenes(pendientes, resultado):
+    """
+    Deja las imágenes de cada inmueble como dice el feed, conservando las
+    filas cuya URL no cambió (y con ellas url_local y descargada).
+    Recuenta las referencias de los archivos que dejaron de usarse.
+    """
+    ids = dict(Inmuebles.objects.filter(ref__in=pendientes.keys()).values_list('ref', 'pk'))
+    actuales = defaultdict(dict)
+    for inmueble_id, pk, url, orden, url_local in Imagenes.objects.filter(
+        inmueble_id__in=ids.values()
+    ).values_list('inmueble_id', 'pk', 'url', 'orden', 'url_local'):
+        actuales[inmueble_id][url] = (pk, orden, url_local)
+
+    crear, reordenar, borrar, liberadas = [], [], [], set()
+    for ref, urls in pendientes.items():
+        inmueble_id = ids[ref]
+        existentes = actuales[inmueble_id]
+        for orden, url in enumerate(urls):
+            if url in existentes:
+                pk, orden_actual, _ = existentes.pop(url)
+                if orden_actual != orden:
+                    reordenar.append(Imagenes(pk=pk, orden=orden))
+            else:
+                crear.append(Imagenes(inmueble_id=inmueble_id, url=url, orden=orden, descargada=0))
+        for pk, _, url_local in existentes.values():
+            borrar.append(pk)
+            if url_local:
+                liberadas.add(url_local)
+
+    if borrar:
+        # Un DELETE sin señales: las de Imagenes tocarían el inmueble y la
+        # versión de las facetas fila por fila. El lote ya deja los inmuebles
+        # con fecha_actualizacion nueva y sincronizar() invalida las facetas
+        # una vez al final.
+        borradas = Imagenes.objects.filter(pk__in=borrar)
+        borradas._raw_delete(borradas.db)
+        recontar_referencias(liberadas)
+    if crear:
+        Imagenes.objects.bulk_create(crear)
+    if reordenar:
+        Imagenes.objects.bulk_update(reordenar, ['orden'])
+    resultado.imagenes_nuevas += len(crear)
+    resultado.imagenes_borradas += len(borrar)
@@ -0,0 +1,18 @@
+from django import template
+from django.contrib.admin.views.main import PAGE_VAR
+
+register = template.Library()
+
+
+@register.simple_tag
+def pagina_siguiente_url(cl):
+    """
+    URL de la página siguiente cuando el total es aproximado o truncado y la
+    página actual está llena: page_range termina en el conteo, no en las filas.
+    """
+    paginator = cl.paginator
+    if not (getattr(paginator, 'truncado', False) or getattr(paginator, 'aproximado', False)):
+        return ''
+    if len(cl.result_list) < cl.list_per_page:
+        return ''
+    return cl.get_query_string({PAGE_VAR: cl.page_num + 1})
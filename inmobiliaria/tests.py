@@ -1,3 +1,1538 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+import io
+import json
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from core.consultas import medir_consultas
+from core.mysql_pool.pool import PoolAgotado, PoolConexiones
+from core.pruebas import PresupuestoConsultasMixin
+from core.replicas import (
+    COOKIE,
+    ReplicasMiddleware,
+    RouterReplicas,
+    invalidar_revision,
+    replicas_disponibles,
+    retraso_desde,
+    retraso_replica,
+)
+
+from .admin import InmueblesAdmin
+from .almacen import limpiar as limpiar_almacen, reporte as reporte_almacen
+from .caracteristicas import filtrar_eav, nombre_indice, reconstruir_pivote
+from .columnas import indice_columnar, reconstruir_columnas, refrescar_columnas
+from .etiquetas import Bitmap, filtrar_joins, filtro_etiquetas, indice_etiquetas
+from .descargas import descargar_imagenes
+from .estados import aplicar_estados, capturar_estados
+from .facets import conteos_por_valor, olvidar_version_facetas, version_facetas
+from .geo import contar_celdas, coordenadas, cubrir_caja, geohash, siguiente_prefijo
+from .mapa import CAMPOS_PRECIO, MAXIMO_CLUSTERS, nivel_para, reconstruir_celdas
+from .miniaturas import generar_miniaturas
+from .hashing import HashRegistro, grupos_cambiados, hash_registro, hash_registros
+from .models import (
+    ArchivosImagen,
+    Assesor,
+    Barrios,
+    Caracteristica,
+    CeldasMapa,
+    City,
+    Etiquetas,
+    Imagenes,
+    InmuebleCaracteristicas,
+    Inmuebles,
+    InmueblesEstados,
+    InmueblesEtiquetas,
+    PivoteCaracteristicas,
+    SimilaresInmueble,
+    TipoConsignacion,
+    TiposInmueble,
+    VersionesCache,
+)
+from .paginators import ConteoAproximadoPaginator
+from .search import MotorFullText, MotorRespaldo, obtener_motor
+from .slugs import rellenar_slugs
+from .templatetags.conteo_admin import pagina_siguiente_url
+from .similares import reconstruir_similares, refrescar_similares
+from .sync import leer_feed, sincronizar
+
+
+def crear_inmuebles(cantidad, inicio=1, **extra):
+    """Crea inmuebles de prueba con dos imágenes cada uno"""
+    ciudad, _ = City.objects.get_or_create(nombre='Montería')
+    tipo, _ = TiposInmueble.objects.get_or_create(nombre='Apartamento')
+    inmuebles = []
+    for ref in range(inicio, inicio + cantidad):
+        inmueble = Inmuebles.objects.create(
+            ref=ref,
+            titulo=f'Inmueble {ref}',
+            ciudad=ciudad,
+            tipo_inmueble=tipo,
+            activo=1,
+            **extra,
+        )
+        Imagenes.objects.create(inmueble=inmueble, url=f'https://img/{ref}/1.jpg', orden=1)
+        Imagenes.objects.create(inmueble=inmueble, url=f'https://img/{ref}/0.jpg', orden=0)
+        inmuebles.append(inmueble)
+    return inmuebles
+
+
+def leer_version_facetas():
+    """Deja leída la versión de las facetas: las cuentas de consultas no dependen del reloj"""
+    olvidar_version_facetas()
+    version_facetas()
+
+
+@override_settings(FACETAS_VERSION_SEGUNDOS=3600)
+class AdminTestCase(PresupuestoConsultasMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        leer_version_facetas()
+
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(consultas)
+
+
+class InmueblesAdminConsultasTests(AdminTestCase):
+
+    def test_consultas_constantes_por_pagina(self):
+        url = reverse('admin:inmobiliaria_inmuebles_changelist')
+        crear_inmuebles(3)
+        pocas = self.contar_consultas(url)
+        crear_inmuebles(22, inicio=100)
+        muchas = self.contar_consultas(url)
+        self.assertEqual(pocas, muchas)
+
+    def test_imagen_principal_prefetch(self):
+        inmueble = crear_inmuebles(1)[0]
+        cargado = Inmuebles.objects.con_imagen_principal().get(pk=inmueble.pk)
+        with self.assertNumQueries(0):
+            imagen = cargado.get_imagen_principal()
+        self.assertEqual(imagen.url, 'https://img/1/0.jpg')
+        self.assertEqual(inmueble.get_imagen_principal().pk, imagen.pk)
+
+
+
+class ImagenesAdminConsultasTests(AdminTestCase):
+
+    def test_consultas_constantes_por_pagina(self):
+        url = reverse('admin:inmobiliaria_imagenes_changelist')
+        # Al confirmar se invalidan los conteos de los filtros: las dos
+        # páginas los recalculan
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_inmuebles(2)
+        pocas = self.contar_consultas(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_inmuebles(20, inicio=100)
+        muchas = self.contar_consultas(url)
+        self.assertEqual(pocas, muchas)
+
+    def test_str_con_relaciones(self):
+        crear_inmuebles(3)
+        with self.assertNumQueries(1):
+            textos = [str(imagen) for imagen in Imagenes.objects.con_relaciones()]
+        self.assertIn('Inmueble #1 - Orden 0', textos)
+
+
+class InmuebleCaracteristicasInlineConsultasTests(AdminTestCase):
+
+    def agregar_caracteristicas(self, inmueble, cantidad, inicio=0):
+        ahora = timezone.now()
+        for i in range(inicio, inicio + cantidad):
+            caracteristica = Caracteristica.objects.create(
+                nombre=f'Característica {i}', created_at=ahora, updated_at=ahora
+            )
+            InmuebleCaracteristicas.objects.create(
+                inmueble=inmueble, caracteristica=caracteristica, valor_numerico=i + 1
+            )
+
+    def test_formulario_consultas_constantes(self):
+        inmueble = crear_inmuebles(1)[0]
+        url = reverse('admin:inmobiliaria_inmuebles_change', args=[inmueble.pk])
+        self.agregar_caracteristicas(inmueble, 2)
+        self.contar_consultas(url)
+        pocas = self.contar_consultas(url)
+        self.agregar_caracteristicas(inmueble, 15, inicio=2)
+        muchas = self.contar_consultas(url)
+        self.assertEqual(pocas, muchas)
+
+    def test_formulario_muestra_caracteristica_seleccionada(self):
+        inmueble = crear_inmuebles(1)[0]
+        self.agregar_caracteristicas(inmueble, 1)
+        url = reverse('admin:inmobiliaria_inmuebles_change', args=[inmueble.pk])
+        response = self.client.get(url)
+        self.assertContains(response, 'selected>Característica 0</option>')
+
+    def test_str_con_relaciones(self):
+        inmueble = crear_inmuebles(1)[0]
+        self.agregar_caracteristicas(inmueble, 3)
+        with self.assertNumQueries(1):
+            textos = [str(c) for c in InmuebleCaracteristicas.objects.con_relaciones()]
+        self.assertIn('Característica 2: 3.00', textos)
+
+
+@override_settings(ADMIN_CONTEO_APROXIMADO=True, ADMIN_CONTEO_LIMITE=30)
+class ConteoAproximadoPaginatorTests(AdminTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        crear_inmuebles(40)
+
+    def test_con_filtros_cuenta_hasta_el_limite(self):
+        url = reverse('admin:inmobiliaria_inmuebles_changelist')
+        response = self.client.get(url, {'activo__exact': 1})
+        self.assertContains(response, '30+ Inmuebles')
+        self.assertTrue(response.context['cl'].paginator.truncado)
+
+    def test_navega_paginas_despues_del_limite(self):
+        paginator = ConteoAproximadoPaginator(
+            Inmuebles.objects.filter(activo=1).order_by('ref'), 25
+        )
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual([i.ref for i in paginator.page(2)], list(range(26, 41)))
+        self.assertEqual(list(paginator.page(3)), [])
+
+    def test_changelist_enlaza_paginas_despues_del_limite(self):
+        url = reverse('admin:inmobiliaria_inmuebles_changelist')
+        refs, siguiente = set(), '?activo__exact=1'
+        # 30 contadas, de a 10: la cuarta página solo se alcanza con "Siguiente",
+        # y la quinta (vacía) ya no lo muestra
+        with mock.patch.object(InmueblesAdmin, 'list_per_page', 10):
+            for _ in range(5):
+                response = self.client.get(url + siguiente)
+                self.assertEqual(response.status_code, 200)
+                cl = response.context['cl']
+                refs.update(i.ref for i in cl.result_list)
+                siguiente = pagina_siguiente_url(cl)
+                if not siguiente:
+                    break
+                self.assertContains(response, 'class="next"')
+        self.assertEqual(cl.page_num, 5)
+        self.assertEqual(refs, set(range(1, 41)))
+
+    def test_sin_filtros_usa_estimado(self):
+        paginator = ConteoAproximadoPaginator(Inmuebles.objects.order_by('ref'), 25)
+        with mock.patch.object(paginator, '_conteo_estimado', return_value=5_000_000):
+            self.assertEqual(paginator.count, 5_000_000)
+        self.assertEqual(paginator.conteo_texto, '≈ 5.000.000')
+        self.assertEqual(len(paginator.page(100).object_list), 0)
+
+    def test_sin_estimado_cuenta_con_limite(self):
+        paginator = ConteoAproximadoPaginator(Inmuebles.objects.order_by('ref'), 25)
+        self.assertEqual(paginator.count, 30)
+        with self.settings(ADMIN_CONTEO_APROXIMADO=False):
+            paginator = ConteoAproximadoPaginator(Inmuebles.objects.order_by('ref'), 25)
+            self.assertEqual(paginator.count, 40)
+            self.assertEqual(paginator.conteo_texto, '')
+
+
+class BusquedaTests(AdminTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.casa, cls.apto = crear_inmuebles(2)
+        Inmuebles.objects.filter(pk=cls.casa.pk).update(
+            titulo='Casa campestre en Cereté',
+            descripcion_corta='Amplia, con piscina y jardín',
+            codigo_sincronizacion='SYN-77',
+        )
+        Inmuebles.objects.filter(pk=cls.apto.pk).update(
+            titulo='Apartamento', direccion='Calle 41 # 5-20 Montería'
+        )
+
+    def refs(self, termino):
+        return sorted(Inmuebles.objects.buscar(termino).values_list('ref', flat=True))
+
+    def test_motor_por_defecto_en_sqlite(self):
+        self.assertIsInstance(obtener_motor(), MotorRespaldo)
+
+    def test_ignora_acentos_y_mayusculas(self):
+        self.assertEqual(self.refs('cerete'), [1])
+        self.assertEqual(self.refs('JARDIN piscína'), [1])
+        self.assertEqual(self.refs('monteria'), [2])
+
+    def test_exige_todas_las_palabras(self):
+        self.assertEqual(self.refs('casa monteria'), [])
+
+    def test_identificadores(self):
+        self.assertEqual(self.refs('SYN-77'), [1])
+        self.assertEqual(self.refs('2'), [2])
+
+    def test_consulta_booleana_fulltext(self):
+        motor = MotorFullText()
+        self.assertEqual(motor.consulta_booleana('casa +de (piscina)*'), '+casa* +piscina*')
+        self.assertEqual(motor.consulta_booleana('de la'), '')
+
+    def test_admin_usa_motor(self):
+        url = reverse('admin:inmobiliaria_inmuebles_changelist')
+        response = self.client.get(url, {'q': 'cereté'})
+        self.assertEqual([i.ref for i in response.context['cl'].result_list], [1])
+
+    def test_admin_conserva_parciales_de_codigo_y_slug(self):
+        Inmuebles.objects.filter(pk=self.apto.pk).update(slug='apartamento-centro-41')
+        url = reverse('admin:inmobiliaria_inmuebles_changelist')
+        for termino, refs in (
+            ('syn', [1]), ('SYN-7', [1]), ('apartamento-centro-4', [2]), ('cereté', [1]),
+            ('centro-4', []),
+        ):
+            response = self.client.get(url, {'q': termino})
+            self.assertEqual(sorted(i.ref for i in response.context['cl'].result_list), refs)
+
+
+class FacetasFiltrosTests(AdminTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.monteria = City.objects.create(nombre='Montería')
+        cls.cerete = City.objects.create(nombre='Cereté')
+        City.objects.create(nombre='Lorica')
+        cls.centro = Barrios.objects.create(nombre='Centro', ciudad=cls.monteria)
+        Barrios.objects.create(nombre='La Granja', ciudad=cls.cerete)
+        for ref, ciudad in [(1, cls.monteria), (2, cls.monteria), (3, cls.cerete)]:
+            Inmuebles.objects.create(
+                ref=ref, ciudad=ciudad, barrio=cls.centro if ciudad == cls.monteria else None
+            )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def filtro(self, response, titulo):
+        for filtro in response.context['cl'].filter_specs:
+            if filtro.title == titulo:
+                return filtro
+        return None
+
+    def test_solo_valores_usados_con_conteo(self):
+        url = reverse('admin:inmobiliaria_inmuebles_changelist')
+        response = self.client.get(url)
+        self.assertContains(response, 'Montería (2)')
+        self.assertContains(response, 'Cereté (1)')
+        self.assertNotContains(response, 'Lorica')
+
+    def test_barrios_solo_de_la_ciudad_seleccionada(self):
+        url = reverse('admin:inmobiliaria_inmuebles_changelist')
+        response = self.client.get(url)
+        self.assertIsNone(self.filtro(response, 'barrio'))
+        response = self.client.get(url, {'ciudad__id__exact': self.monteria.pk})
+        self.assertEqual(self.filtro(response, 'barrio').lookup_choices, [(self.centro.pk, 'Centro')])
+        self.assertContains(response, 'Centro (2)')
+        self.assertNotContains(response, 'La Granja')
+
+    def test_conteos_cacheados_e_invalidados(self):
+        conteos = conteos_por_valor(Inmuebles, 'ciudad')
+        self.assertEqual(conteos, [(self.cerete.pk, 'Cereté', 1), (self.monteria.pk, 'Montería', 2)])
+        with self.assertNumQueries(0):
+            conteos_por_valor(Inmuebles, 'ciudad')
+        # La versión sube al confirmar
+        with self.captureOnCommitCallbacks(execute=True):
+            Inmuebles.objects.create(ref=4, ciudad=self.cerete)
+        self.assertIn((self.cerete.pk, 'Cereté', 2), conteos_por_valor(Inmuebles, 'ciudad'))
+
+    def test_imagenes_por_ciudad_del_inmueble(self):
+        Imagenes.objects.create(inmueble=Inmuebles.objects.get(ref=3), url='https://img/3.jpg')
+        url = reverse('admin:inmobiliaria_imagenes_changelist')
+        response = self.client.get(url)
+        self.assertContains(response, 'Cereté (1)')
+        self.assertNotContains(response, 'Montería (')
+
+
+class SyncInmueblesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.monteria = City.objects.create(nombre='Montería')
+
+    def registro(self, ref, **extra):
+        return {
+            'ref': ref, 'codigo_sincronizacion': f'SYN-{ref}', 'titulo': f'Casa {ref}',
+            'ciudad_nombre': 'Montería', 'precio_venta': '250000000', 'habitaciones': 3,
+            **extra,
+        }
+
+    def test_crea_actualiza_y_omite_sin_cambios(self):
+        resultado = sincronizar([self.registro(1), self.registro(2)])
+        self.assertEqual((resultado.nuevos, resultado.actualizados, resultado.sin_cambios), (2, 0, 0))
+        inmueble = Inmuebles.objects.get(ref=1)
+        self.assertEqual(inmueble.ciudad, self.monteria)
+        self.assertEqual(inmueble.precio_venta, Decimal('250000000'))
+        self.assertIsNotNone(inmueble.hash_datos)
+
+        resultado = sincronizar([self.registro(1), self.registro(2, habitaciones=4)])
+        self.assertEqual((resultado.nuevos, resultado.actualizados, resultado.sin_cambios), (0, 1, 1))
+        self.assertEqual(Inmuebles.objects.get(ref=2).habitaciones, 4)
+
+    def test_registro_parcial_no_borra_otros_campos(self):
+        sincronizar([self.registro(1)])
+        sincronizar([{'ref': 1, 'habitaciones': 5}])
+        inmueble = Inmuebles.objects.get(ref=1)
+        self.assertEqual(inmueble.habitaciones, 5)
+        self.assertEqual(inmueble.titulo, 'Casa 1')
+
+    def test_errores_no_detienen_el_lote(self):
+        resultado = sincronizar([self.registro(1), {'titulo': 'sin ref'}, self.registro(2, estrato='x')])
+        self.assertEqual(resultado.nuevos, 1)
+        self.assertEqual(len(resultado.errores), 2)
+
+    def test_comando_con_csv(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = Path(directorio) / 'feed.csv'
+            ruta.write_text(
+                'ref,titulo,ciudad_nombre,estrato\n10,Lote,Montería,\n11,Casa,Otra,3\n',
+                encoding='utf-8',
+            )
+            call_command('sync_inmuebles', str(ruta), stdout=mock.MagicMock())
+        self.assertEqual(Inmuebles.objects.get(ref=10).ciudad, self.monteria)
+        self.assertIsNone(Inmuebles.objects.get(ref=10).estrato)
+        self.assertIsNone(Inmuebles.objects.get(ref=11).ciudad)
+
+    def test_lee_json_lines(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = Path(directorio) / 'feed.jsonl'
+            ruta.write_text('\n'.join(json.dumps(self.registro(r)) for r in (1, 2)) + '\n')
+            self.assertEqual([r['ref'] for r in leer_feed(ruta)], [1, 2])
+
+
+class HashingTests(TestCase):
+
+    def test_normalizacion_equivalente(self):
+        a = hash_registro({
+            'ref': 1, 'precio_venta': Decimal('250000000.00'),
+            'descripcion': '<p>Casa&nbsp;amplia</p>', 'titulo': '  Casa   en venta ',
+        })
+        b = hash_registro({
+            'ref': 1, 'precio_venta': Decimal('250000000'),
+            'descripcion': 'Casa amplia', 'titulo': 'Casa en venta', 'estrato': None,
+        })
+        self.assertEqual(a, b)
+
+    def test_grupos_cambiados(self):
+        base = {'ref': 1, 'precio_venta': Decimal('1'), 'area': Decimal('80'), 'imagenes': ['a.jpg']}
+        anterior, nuevo = hash_registros([base, {**base, 'imagenes': ['b.jpg'], 'area': 81}])
+        self.assertEqual(grupos_cambiados(anterior.serializar(), nuevo), {'areas', 'imagenes'})
+        self.assertEqual(HashRegistro.desde_texto(anterior.serializar()), anterior)
+        self.assertEqual(len(grupos_cambiados('hash-viejo', nuevo)), 5)
+
+    def test_sync_solo_toca_imagenes_si_cambian(self):
+        registro = {'ref': 1, 'titulo': 'Casa', 'imagenes': ['https://x/1.jpg', 'https://x/2.jpg']}
+        resultado = sincronizar([registro])
+        self.assertEqual(resultado.imagenes_nuevas, 2)
+        imagen = Imagenes.objects.get(url='https://x/1.jpg')
+        Imagenes.objects.filter(pk=imagen.pk).update(descargada=1)
+
+        with CaptureQueriesContext(connection) as consultas:
+            sincronizar([{**registro, 'titulo': 'Casa grande'}])
+        self.assertFalse(any('"imagenes"' in q['sql'] for q in consultas.captured_queries))
+
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = sincronizar([{**registro, 'imagenes': ['https://x/3.jpg', 'https://x/1.jpg']}])
+        self.assertEqual((resultado.imagenes_nuevas, resultado.imagenes_borradas), (1, 1))
+        # Un solo DELETE y un solo UPDATE de inmuebles, sin señales por imagen
+        sentencias = [q['sql'].split(' WHERE')[0] for q in consultas.captured_queries]
+        self.assertEqual(sum(sql.startswith('DELETE FROM "imagenes"') for sql in sentencias), 1)
+        self.assertEqual(sum(sql.startswith('UPDATE "inmuebles"') for sql in sentencias), 1)
+        imagen.refresh_from_db()
+        self.assertEqual((imagen.orden, imagen.descargada), (1, 1))
+
+
+class ReconciliacionEstadosTests(AdminTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for ref in (1, 2, 3):
+            Inmuebles.objects.create(
+                ref=ref, codigo_sincronizacion=f'SYN-{ref}', activo=1, destacado=0, en_caliente=0
+            )
+        InmueblesEstados.objects.create(inmueble_ref=1, codigo_sincronizacion='SYN-1', activo=0)
+        InmueblesEstados.objects.create(inmueble_ref=2, codigo_sincronizacion='SYN-2', destacado=1)
+        # Código distinto: el inmueble fue reemplazado en el feed y no aplica
+        InmueblesEstados.objects.create(inmueble_ref=3, codigo_sincronizacion='OTRO', activo=0)
+
+    def estados(self):
+        return dict(
+            (ref, (activo, destacado))
+            for ref, activo, destacado in Inmuebles.objects.values_list('ref', 'activo', 'destacado')
+        )
+
+    def test_dry_run_reporta_sin_escribir(self):
+        resultado = aplicar_estados(dry_run=True)
+        self.assertEqual(resultado.filas, 2)
+        self.assertEqual(resultado.diferencias, {'activo': 1, 'destacado': 1, 'en_caliente': 0})
+        self.assertEqual([fila[0] for fila in resultado.muestra], [1, 2])
+        self.assertEqual(self.estados(), {1: (1, 0), 2: (1, 0), 3: (1, 0)})
+
+    def test_aplica_en_lotes(self):
+        resultado = aplicar_estados(lote=1)
+        self.assertEqual(resultado.filas, 2)
+        self.assertEqual(self.estados(), {1: (0, 0), 2: (1, 1), 3: (1, 0)})
+        self.assertEqual(aplicar_estados().filas, 0)
+
+    def test_captura_actualiza_e_inserta(self):
+        Inmuebles.objects.filter(ref__in=[1, 3]).update(en_caliente=1)
+        resultado = capturar_estados([1, 3])
+        self.assertEqual(resultado.filas, 2)
+        self.assertEqual(
+            InmueblesEstados.objects.get(inmueble_ref=1, codigo_sincronizacion='SYN-1').en_caliente, 1
+        )
+        nuevo = InmueblesEstados.objects.get(inmueble_ref=3, codigo_sincronizacion='SYN-3')
+        self.assertEqual((nuevo.activo, nuevo.en_caliente), (1, 1))
+        self.assertEqual(capturar_estados([1, 3]).filas, 0)
+
+    def test_accion_del_admin_captura_estados(self):
+        url = reverse('admin:inmobiliaria_inmuebles_changelist')
+        pks = list(Inmuebles.objects.filter(ref__in=[2, 3]).values_list('pk', flat=True))
+        self.client.post(url, {'action': 'marcar_destacado', '_selected_action': pks})
+        self.assertEqual(
+            set(InmueblesEstados.objects.filter(destacado=1).values_list('codigo_sincronizacion', flat=True)),
+            {'SYN-2', 'SYN-3'},
+        )
+
+
+class ServidorImagenes(BaseHTTPRequestHandler):
+    """Servidor HTTP local para las pruebas de descarga"""
+    contenido = b'\xff\xd8\xffimagen' * 1000
+    # Rutas que sirven la misma foto que /a.jpg
+    copias = {'/copia-de-a.jpg', '/otra-copia.jpg'}
+    intentos = {}
+
+    def cuerpo(self):
+        if self.path == '/a.jpg' or self.path in self.copias:
+            return self.contenido
+        return self.contenido + self.path.encode()
+
+    def responder(self, con_cuerpo):
+        self.intentos[self.command, self.path] = self.intentos.get((self.command, self.path), 0) + 1
+        if self.path == '/no-existe.jpg':
+            self.send_error(404)
+        elif self.path == '/redirige.jpg':
+            self.send_response(302)
+            self.send_header('Location', '/redirige.jpg')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/falla-una-vez.jpg' and self.intentos[self.command, self.path] == 1:
+            self.send_error(503)
+        else:
+            cuerpo = self.cuerpo()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.send_header('ETag', f'"{hash(cuerpo)}"')
+            self.end_headers()
+            if con_cuerpo:
+                self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        self.responder(True)
+
+    def do_HEAD(self):
+        self.responder(False)
+
+    def log_message(self, *args):
+        pass
+
+
+class DescargaImagenesTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servidor = ThreadingHTTPServer(('127.0.0.1', 0), ServidorImagenes)
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.servidor.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        ServidorImagenes.intentos.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.inmueble = crear_inmuebles(1)[0]
+        self.inmueble.imagenes_set.all().delete()
+
+    def crear_imagenes(self, *nombres):
+        for orden, nombre in enumerate(nombres):
+            Imagenes.objects.create(
+                inmueble=self.inmueble, url=f'{self.base}/{nombre}', orden=orden, descargada=0
+            )
+
+    def descargar(self, **opciones):
+        with self.settings(MEDIA_ROOT=self.media.name):
+            return descargar_imagenes(lote=10, espera=0.01, por_host=2, **opciones)
+
+    def test_descarga_reintenta_y_marca_en_lote(self):
+        self.crear_imagenes('a.jpg', 'b.png', 'falla-una-vez.jpg', 'no-existe.jpg')
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = self.descargar(verificar_etag=False)
+
+        self.assertEqual((resultado.descargadas, resultado.fallidas), (3, 1))
+        self.assertEqual(resultado.errores[0][1], 'HTTP 404')
+        self.assertEqual(ServidorImagenes.intentos['GET', '/falla-una-vez.jpg'], 2)
+        self.assertEqual(ServidorImagenes.intentos['GET', '/no-existe.jpg'], 1)
+        actualizaciones = [q for q in consultas.captured_queries if q['sql'].startswith('UPDATE "imagenes"')]
+        self.assertEqual(len(actualizaciones), 1)
+
+        imagen = Imagenes.objects.get(url=f'{self.base}/b.png')
+        self.assertEqual(imagen.descargada, 1)
+        # El inmueble estrena versión en un solo UPDATE del lote
+        self.assertIsNotNone(Inmuebles.objects.get(pk=self.inmueble.pk).fecha_actualizacion)
+        self.assertEqual(len([q for q in consultas.captured_queries if q['sql'].startswith('UPDATE "inmuebles"')]), 1)
+        self.assertRegex(imagen.url_local, r'^imagenes/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        archivo = Path(self.media.name) / imagen.url_local
+        self.assertEqual(archivo.read_bytes(), ServidorImagenes.contenido + b'/b.png')
+        self.assertFalse(list(Path(self.media.name).rglob('*.part')))
+
+    def test_url_invalida_no_detiene_el_lote(self):
+        self.crear_imagenes('a.jpg', 'redirige.jpg')
+        Imagenes.objects.create(inmueble=self.inmueble, url='ftp://127.0.0.1/c.jpg', orden=5, descargada=0)
+        Imagenes.objects.create(inmueble=self.inmueble, url='http://a\x00b/d.jpg', orden=6, descargada=0)
+        resultado = self.descargar()
+        self.assertEqual((resultado.descargadas, resultado.fallidas), (1, 3))
+        errores = sorted(error.split(':')[0] for _, error in resultado.errores)
+        self.assertEqual(errores, ['InvalidURL', 'TooManyRedirects', 'UnsupportedProtocol'])
+        # Sin reintentos: no son errores pasajeros
+        self.assertEqual(ServidorImagenes.intentos['HEAD', '/redirige.jpg'], 21)
+
+    def test_deduplica_por_contenido_url_y_etag(self):
+        self.crear_imagenes('a.jpg', 'copia-de-a.jpg', 'b.png')
+        resultado = self.descargar()
+        self.assertEqual(resultado.descargadas, 3)
+        self.assertEqual(ArchivosImagen.objects.count(), 2)
+
+        # Misma URL: sin HTTP. Otra URL con el mismo ETag: solo HEAD.
+        ServidorImagenes.intentos.clear()
+        self.crear_imagenes('a.jpg', 'otra-copia.jpg')
+        resultado = self.descargar()
+        self.assertEqual((resultado.reutilizadas, resultado.descargadas), (2, 0))
+        self.assertEqual(ServidorImagenes.intentos, {('HEAD', '/otra-copia.jpg'): 1})
+
+        # El mismo ETag en otro servidor no alcanza: se descarga
+        ServidorImagenes.intentos.clear()
+        otro = self.base.replace('127.0.0.1', 'localhost')
+        Imagenes.objects.create(inmueble=self.inmueble, url=f'{otro}/copia-de-a.jpg', orden=9, descargada=0)
+        resultado = self.descargar()
+        self.assertEqual((resultado.reutilizadas, resultado.descargadas, resultado.deduplicadas), (0, 1, 1))
+        self.assertEqual(ServidorImagenes.intentos[('GET', '/copia-de-a.jpg')], 1)
+
+        archivo = ArchivosImagen.objects.get(digest__in=[
+            Path(ruta).stem for ruta in Imagenes.objects.filter(url=f'{self.base}/a.jpg').values_list('url_local', flat=True)
+        ])
+        self.assertEqual(archivo.referencias, 5)
+        datos = reporte_almacen()
+        self.assertEqual(datos.bytes_ahorrados, archivo.tamano * 4)
+
+        # Al quitar las imágenes del inmueble el archivo queda huérfano y se limpia
+        Imagenes.objects.filter(url_local=archivo.ruta).delete()
+        # Los archivos se borran al confirmar
+        with self.settings(MEDIA_ROOT=self.media.name), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(limpiar_almacen(), 1)
+        self.assertFalse((Path(self.media.name) / archivo.ruta).exists())
+
+
+class MiniaturasTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.inmueble = crear_inmuebles(1)[0]
+        self.imagen = self.inmueble.imagenes_set.get(orden=0)
+        self.imagen.url_local = f'inmuebles/{self.inmueble.pk}/{self.imagen.pk}.jpg'
+        self.imagen.descargada = 1
+        self.imagen.save()
+        origen = Path(self.media.name) / self.imagen.url_local
+        origen.parent.mkdir(parents=True)
+        Image.new('RGB', (1600, 900), 'steelblue').save(origen, 'JPEG')
+
+    def test_genera_tamanos_y_es_incremental(self):
+        with self.settings(MEDIA_ROOT=self.media.name):
+            self.assertEqual(self.imagen.get_miniatura_url(), self.imagen.url)
+            Inmuebles.objects.filter(pk=self.inmueble.pk).update(fecha_actualizacion=None)
+            resultado = generar_miniaturas(Imagenes.objects.all(), procesos=1)
+            self.assertEqual((resultado.generadas, resultado.fallidas), (1, 0))
+            # El detalle cambia de URL: el inmueble estrena versión
+            self.assertIsNotNone(Inmuebles.objects.get(pk=self.inmueble.pk).fecha_actualizacion)
+            with Image.open(Path(self.media.name) / f'inmuebles/{self.inmueble.pk}/{self.imagen.pk}.chica.webp') as miniatura:
+                self.assertEqual(miniatura.size, (160, 120))
+            self.assertEqual(len(list(Path(self.media.name).rglob(f'{self.imagen.pk}.*.*'))), 6)
+
+            resultado = generar_miniaturas(Imagenes.objects.all(), procesos=2)
+            self.assertEqual((resultado.generadas, resultado.omitidas), (0, 1))
+            self.assertEqual(
+                self.imagen.get_miniatura_url('mediana'),
+                f'/media/inmuebles/{self.inmueble.pk}/{self.imagen.pk}.mediana.webp',
+            )
+
+    def test_archivo_compartido_se_procesa_una_vez_y_toca_todos(self):
+        otro = crear_inmuebles(1, inicio=2)[0]
+        Imagenes.objects.filter(inmueble=otro, orden=0).update(
+            url_local=self.imagen.url_local, descargada=1,
+        )
+        Inmuebles.objects.update(fecha_actualizacion=None)
+        with self.settings(MEDIA_ROOT=self.media.name):
+            resultado = generar_miniaturas(Imagenes.objects.all(), procesos=1)
+        self.assertEqual((resultado.generadas, resultado.omitidas, resultado.fallidas), (1, 0, 0))
+        self.assertFalse(Inmuebles.objects.filter(fecha_actualizacion__isnull=True).exists())
+
+
+class FotosAsesorTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = Path(media.name)
+        configuracion = self.settings(MEDIA_ROOT=media.name)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+    def foto(self):
+        contenido = io.BytesIO()
+        Image.new('RGB', (2000, 1500), 'orange').save(contenido, 'JPEG')
+        return SimpleUploadedFile('perfil.jpg', contenido.getvalue(), content_type='image/jpeg')
+
+    def test_guardar_genera_versiones_y_admin_las_usa(self):
+        asesor = Assesor.objects.create(nombre='Ana', foto=self.foto())
+        with Image.open(self.media / 'asesores/perfil.lista.webp') as lista:
+            self.assertEqual(lista.size, (100, 100))
+        self.assertEqual(asesor.get_foto_url('lista'), '/media/asesores/perfil.lista.webp')
+        self.assertEqual(asesor.get_foto_url('detalle'), '/media/asesores/perfil.detalle.webp')
+        self.assertEqual(asesor.get_foto_url(), '/media/asesores/perfil.jpg')
+        self.assertIsNone(Assesor(nombre='Sin foto').get_foto_url('lista'))
+
+        respuesta = self.client.get(reverse('admin:inmobiliaria_assesor_changelist'))
+        self.assertContains(respuesta, '/media/asesores/perfil.lista.webp')
+        self.assertNotContains(respuesta, 'src="/media/asesores/perfil.jpg"')
+
+    def test_comando_regenera_las_faltantes(self):
+        asesor = Assesor.objects.create(nombre='Ana', foto=self.foto())
+        (self.media / 'asesores/perfil.lista.webp').unlink()
+        self.assertEqual(asesor.get_foto_url('lista'), asesor.foto.url)
+        call_command('miniaturas_asesores', procesos=1, stdout=mock.MagicMock())
+        self.assertEqual(asesor.get_foto_url('lista'), '/media/asesores/perfil.lista.webp')
+
+
+class ApiListadoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_inmuebles(5, ciudad_nombre='Montería', precio_venta=Decimal('200000000'), habitaciones=3)
+        crear_inmuebles(2, inicio=6, ciudad_nombre='Cereté', precio_canon=Decimal('900000'))
+        crear_inmuebles(1, inicio=8, ciudad_nombre='Montería')
+        Inmuebles.objects.filter(ref=8).update(activo=0)
+
+    def obtener(self, **params):
+        respuesta = self.client.get(reverse('inmobiliaria:inmuebles_lista'), params)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_pagina_por_cursor_en_consultas_constantes(self):
+        with self.assertNumQueries(2):
+            pagina = self.obtener(limite=3)
+        self.assertEqual([r['ref'] for r in pagina['resultados']], [1, 2, 3])
+        self.assertEqual(pagina['resultados'][0]['imagen'], 'https://img/1/0.jpg')
+        self.assertEqual(pagina['resultados'][0]['ciudad'], 'Montería')
+
+        refs = []
+        while pagina['cursor'] is not None:
+            refs += [r['ref'] for r in pagina['resultados']]
+            pagina = self.obtener(limite=3, cursor=pagina['cursor'])
+        refs += [r['ref'] for r in pagina['resultados']]
+        self.assertEqual(refs, [1, 2, 3, 4, 5, 6, 7])
+        self.assertIsNone(pagina['siguiente'])
+
+    def test_filtros(self):
+        self.assertEqual(len(self.obtener(ciudad='Cereté')['resultados']), 2)
+        self.assertEqual(len(self.obtener(precio_max='1000000')['resultados']), 2)
+        self.assertEqual(len(self.obtener(precio_min='100000000', habitaciones=3)['resultados']), 5)
+        respuesta = self.client.get(reverse('inmobiliaria:inmuebles_lista'), {'estrato': 'alto'})
+        self.assertEqual(respuesta.status_code, 400)
+
+
+@override_settings(FACETAS_VERSION_SEGUNDOS=3600)
+class ApiFacetasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_inmuebles(3, ciudad_nombre='Montería', estrato=4, precio_venta=Decimal('150000000'))
+        crear_inmuebles(2, inicio=4, ciudad_nombre='Cereté', estrato=3, precio_canon=Decimal('1500000'))
+
+    def setUp(self):
+        cache.clear()
+        leer_version_facetas()
+
+    def obtener(self, **params):
+        return self.client.get(reverse('inmobiliaria:inmuebles_facetas'), params)
+
+    def test_facetas_en_una_consulta_y_cacheadas(self):
+        with self.assertNumQueries(1):
+            respuesta = self.obtener(ciudad='Montería')
+        self.assertEqual(respuesta['X-Cache'], 'MISS')
+        facetas = respuesta.json()['facetas']
+        self.assertEqual(facetas['total'], 3)
+        # La faceta ciudad ignora su propio filtro
+        self.assertEqual(facetas['ciudad'], [{'valor': 'Montería', 'total': 3}, {'valor': 'Cereté', 'total': 2}])
+        self.assertEqual(facetas['estrato'], [{'valor': '4', 'total': 3}])
+        self.assertEqual(facetas['precio_venta'], [{'valor': '100000000-200000000', 'total': 3}])
+
+        # Misma firma con otro formato: acierto sin consultas
+        with self.assertNumQueries(0):
+            respuesta = self.obtener(ciudad=' Montería ', estrato='')
+        self.assertEqual(respuesta['X-Cache'], 'HIT')
+        url = reverse('inmobiliaria:facetas_estadisticas')
+        # Solo staff: al resto lo manda al login del admin
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', password='clave', is_staff=True))
+        estadisticas = self.client.get(url).json()
+        self.assertEqual((estadisticas['aciertos'], estadisticas['fallos']), (1, 1))
+
+    def test_cambios_en_inmuebles_invalidan(self):
+        self.obtener()
+        with self.captureOnCommitCallbacks(execute=True):
+            Inmuebles.objects.get(ref=1).save()
+        self.assertEqual(self.obtener()['X-Cache'], 'MISS')
+
+    @override_settings(FACETAS_VERSION_SEGUNDOS=0)
+    def test_version_compartida_entre_procesos(self):
+        self.obtener()
+        # Otro proceso confirma una escritura: solo cambia la fila de versiones_cache
+        VersionesCache.objects.update_or_create(clave='facetas', defaults={'valor': time.time_ns()})
+        self.assertEqual(self.obtener()['X-Cache'], 'MISS')
+        self.assertEqual(self.obtener()['X-Cache'], 'HIT')
+
+
+class GeoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Distancias aproximadas a (8.75, -75.85): 0, ~1.1 km, ~2.2 km y ~11 km
+        puntos = [('8.75', '-75.85'), ('8,76', '-75.85°'), ('8.77', '-75.85'), ('8.85', '-75.85')]
+        for ref, (latitud, longitud) in enumerate(puntos, start=1):
+            crear_inmuebles(1, inicio=ref, latitud=latitud, longitud=longitud)
+        crear_inmuebles(1, inicio=5, latitud='sin dato', longitud='')
+
+    def test_lectura_tolerante(self):
+        self.assertEqual(coordenadas(' 8,75 ', '-75.85W'), (8.75, -75.85))
+        self.assertIsNone(coordenadas('0', '0'))
+        self.assertIsNone(coordenadas('95', '-75'))
+        self.assertIsNone(coordenadas('N/A', '-75'))
+        self.assertEqual(geohash(57.64911, 10.40744), 'u4pruydqq')
+        self.assertEqual((siguiente_prefijo('d6n'), siguiente_prefijo('dz'), siguiente_prefijo('zz')), ('d6p', 'e', ''))
+
+    def test_cobertura_contiene_los_puntos_de_la_caja(self):
+        caja = (8.74, -75.86, 8.76, -75.84)
+        prefijos = cubrir_caja(*caja)
+        for lat in (8.74, 8.75, 8.76):
+            for lng in (-75.86, -75.85, -75.84):
+                self.assertTrue(any(geohash(lat, lng).startswith(p) for p in prefijos), (lat, lng))
+
+    def test_cerca_ordena_por_distancia(self):
+        respuesta = self.client.get(
+            reverse('inmobiliaria:inmuebles_cerca'), {'lat': '8.75', 'lng': '-75.85', 'radio_km': '3'}
+        )
+        resultados = respuesta.json()['resultados']
+        self.assertEqual([r['ref'] for r in resultados], [1, 2, 3])
+        self.assertEqual(resultados[0]['distancia_km'], 0)
+        self.assertAlmostEqual(resultados[1]['distancia_km'], 1.11, places=2)
+        respuesta = self.client.get(reverse('inmobiliaria:inmuebles_cerca'), {'lat': '8.75', 'lng': 'x'})
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_filtro_caja_en_listado(self):
+        respuesta = self.client.get(reverse('inmobiliaria:inmuebles_lista'), {'caja': '8.755,-75.9,8.8,-75.8'})
+        self.assertEqual([r['ref'] for r in respuesta.json()['resultados']], [2, 3])
+        respuesta = self.client.get(reverse('inmobiliaria:inmuebles_lista'), {'caja': '8.8,-75.9,8.7'})
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_comando_rellena_coordenadas(self):
+        Inmuebles.objects.update(latitud_num=None, longitud_num=None, geohash=None)
+        salida = io.StringIO()
+        call_command('rellenar_coordenadas', '--lote', '2', stdout=salida)
+        self.assertIn('1 sin coordenadas válidas', salida.getvalue())
+        inmueble = Inmuebles.objects.get(ref=2)
+        self.assertEqual((inmueble.latitud_num, inmueble.longitud_num), (8.76, -75.85))
+        self.assertEqual(inmueble.geohash, geohash(8.76, -75.85))
+        self.assertIsNone(Inmuebles.objects.get(ref=5).geohash)
+
+    def test_sincronizacion_calcula_coordenadas(self):
+        sincronizar([{'ref': 10, 'titulo': 'Casa', 'latitud': '8.75', 'longitud': '-75.85'}])
+        self.assertEqual(Inmuebles.objects.get(ref=10).geohash, geohash(8.75, -75.85))
+
+
+class MapaTests(AdminTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Dos en el centro de Montería (a ~100 m) y uno en Cereté
+        with cls.captureOnCommitCallbacks(execute=True):
+            crear_inmuebles(1, inicio=1, latitud='8.7500', longitud='-75.8800', precio_venta=Decimal('200000000'))
+            crear_inmuebles(1, inicio=2, latitud='8.7505', longitud='-75.8805', precio_canon=Decimal('1500000'))
+            crear_inmuebles(1, inicio=3, latitud='8.8850', longitud='-75.7900', precio_venta=Decimal('90000000'))
+
+    def obtener(self, zoom, caja='8.6,-76.0,9.0,-75.7'):
+        respuesta = self.client.get(reverse('inmobiliaria:inmuebles_mapa'), {'caja': caja, 'zoom': zoom})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def celdas(self):
+        return set(CeldasMapa.objects.values_list(
+            'nivel', 'celda', 'total', 'suma_latitud', 'suma_longitud', *CAMPOS_PRECIO
+        ))
+
+    def test_grupos_por_zoom(self):
+        with self.assertNumQueries(1):
+            lejos = self.obtener(zoom=5)
+        self.assertEqual(len(lejos['grupos']), 1)
+        grupo = lejos['grupos'][0]
+        self.assertEqual(grupo['total'], 3)
+        self.assertAlmostEqual(grupo['lat'], (8.75 + 8.7505 + 8.885) / 3, places=5)
+        # La venta y el canon no se mezclan en un solo rango
+        self.assertEqual(
+            [Decimal(grupo[campo]) for campo in CAMPOS_PRECIO],
+            [Decimal('90000000'), Decimal('200000000'), Decimal('1500000'), Decimal('1500000')],
+        )
+
+        cerca = self.obtener(zoom=12)
+        self.assertEqual(sorted(g['total'] for g in cerca['grupos']), [1, 2])
+        respuesta = self.client.get(reverse('inmobiliaria:inmuebles_mapa'), {'caja': '8.6,-76.0,9.0,-75.7'})
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_respuesta_acotada(self):
+        caja = (-4.0, -79.0, 12.0, -67.0)
+        nivel = nivel_para(18, *caja)
+        self.assertLessEqual(contar_celdas(*caja, nivel), MAXIMO_CLUSTERS)
+
+    def test_mantenimiento_incremental(self):
+        raiz = CeldasMapa.objects.get(nivel=1)
+        inmueble = Inmuebles.objects.get(ref=3)
+        inmueble.latitud, inmueble.longitud = '8.7502', '-75.8802'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            inmueble.save()
+            Inmuebles.objects.get(ref=2).save()
+        # Un solo recálculo por transacción (y una sola subida de la versión de las facetas)
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual([g['total'] for g in self.obtener(zoom=12)['grupos']], [3])
+        # Las celdas que siguen con inmuebles se actualizan en su sitio
+        self.assertEqual(CeldasMapa.objects.get(nivel=1).pk, raiz.pk)
+
+        Imagenes.objects.filter(inmueble__ref=1).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            Inmuebles.objects.get(ref=1).delete()
+        sincronizar([{'ref': 4, 'titulo': 'Casa', 'latitud': '8.8850', 'longitud': '-75.7900', 'activo': 1}])
+        # La acción del admin usa update(), sin señales
+        self.client.post(reverse('admin:inmobiliaria_inmuebles_changelist'), {
+            'action': 'desactivar', '_selected_action': [Inmuebles.objects.get(ref=2).pk],
+        })
+        incrementales = self.celdas()
+        reconstruir_celdas()
+        self.assertEqual(incrementales, self.celdas())
+        self.assertEqual(sorted(g['total'] for g in self.obtener(zoom=12)['grupos']), [1, 1])
+
+    def test_estados_actualizan_solo_sus_celdas(self):
+        Inmuebles.objects.filter(ref=3).update(codigo_sincronizacion='SYN-3')
+        InmueblesEstados.objects.create(inmueble_ref=3, codigo_sincronizacion='SYN-3', activo=0)
+        with mock.patch('inmobiliaria.mapa.reconstruir_celdas') as reconstruir:
+            self.assertEqual(aplicar_estados().filas, 1)
+        reconstruir.assert_not_called()
+        incrementales = self.celdas()
+        reconstruir_celdas()
+        self.assertEqual(incrementales, self.celdas())
+        self.assertEqual([g['total'] for g in self.obtener(zoom=12)['grupos']], [2])
+
+
+
+class DetalleInmuebleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.inmueble = crear_inmuebles(1, slug='casa-centro', hash_datos='v1 abc', fecha_actualizacion=timezone.now())[0]
+        ahora = timezone.now()
+        piscina = Caracteristica.objects.create(nombre='Piscina', created_at=ahora, updated_at=ahora)
+        InmuebleCaracteristicas.objects.create(inmueble=cls.inmueble, caracteristica=piscina, valor_booleano=1)
+        etiqueta = Etiquetas.objects.create(nombre='Nuevo', color='#ff0000')
+        InmueblesEtiquetas.objects.create(inmueble=cls.inmueble, etiqueta=etiqueta)
+
+    def setUp(self):
+        caches['inmuebles'].clear()
+
+    def url(self, slug='casa-centro'):
+        return reverse('inmobiliaria:inmueble_detalle', args=[slug])
+
+    def test_detalle_en_consultas_constantes_y_304(self):
+        with self.assertNumQueries(4):
+            respuesta = self.client.get(self.url())
+        datos = respuesta.json()
+        self.assertEqual([i['url'] for i in datos['imagenes']], ['https://img/1/0.jpg', 'https://img/1/1.jpg'])
+        self.assertEqual(datos['caracteristicas'], [{'nombre': 'Piscina', 'valor': True, 'unidad': None}])
+        self.assertEqual(datos['etiquetas'], [{'nombre': 'Nuevo', 'color': '#ff0000'}])
+
+        with self.assertNumQueries(1):
+            repetida = self.client.get(self.url(), HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+        repetida = self.client.get(self.url(), HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified'])
+        self.assertEqual(repetida.status_code, 304)
+
+        Inmuebles.objects.filter(pk=self.inmueble.pk).update(hash_datos='v1 otro')
+        self.assertEqual(self.client.get(self.url(), HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(self.url('no-existe')).status_code, 404)
+
+    def test_cache_del_detalle_sigue_las_escrituras(self):
+        primera = self.client.get(self.url())
+        self.assertEqual(primera['X-Cache'], 'MISS')
+        with self.assertNumQueries(1):
+            segunda = self.client.get(self.url())
+        self.assertEqual(segunda['X-Cache'], 'HIT')
+        self.assertEqual(segunda.content, primera.content)
+
+        Imagenes.objects.create(inmueble=self.inmueble, url='https://img/1/2.jpg', orden=2)
+        respuesta = self.client.get(self.url())
+        self.assertEqual(respuesta['X-Cache'], 'MISS')
+        self.assertEqual(len(respuesta.json()['imagenes']), 3)
+
+        sincronizar([{'ref': 1, 'titulo': 'Casa Centro renovada', 'slug': 'casa-centro', 'activo': 1}])
+        respuesta = self.client.get(self.url())
+        self.assertEqual(respuesta['X-Cache'], 'MISS')
+        self.assertEqual(respuesta.json()['titulo'], 'Casa Centro renovada')
+
+        url = reverse('inmobiliaria:detalle_estadisticas')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', password='clave', is_staff=True))
+        estadisticas = self.client.get(url).json()
+        self.assertEqual((estadisticas['aciertos'], estadisticas['fallos']), (1, 3))
+
+    def test_cambios_de_catalogo_renuevan_el_detalle(self):
+        primera = self.client.get(self.url())
+        caracteristica = Caracteristica.objects.get(nombre='Piscina')
+        caracteristica.nombre = 'Piscina climatizada'
+        caracteristica.save()
+        segunda = self.client.get(self.url(), HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(segunda.status_code, 200)
+        self.assertEqual(segunda.json()['caracteristicas'][0]['nombre'], 'Piscina climatizada')
+
+        etiqueta = Etiquetas.objects.get(nombre='Nuevo')
+        etiqueta.color = '#00ff00'
+        etiqueta.save()
+        tercera = self.client.get(self.url(), HTTP_IF_NONE_MATCH=segunda['ETag'])
+        self.assertEqual(tercera.json()['etiquetas'], [{'nombre': 'Nuevo', 'color': '#00ff00'}])
+
+    def test_sync_y_relleno_resuelven_colisiones(self):
+        sincronizar([
+            {'ref': 10, 'titulo': 'Casa Centro', 'slug': 'casa-centro'},
+            {'ref': 11, 'titulo': 'Lote Mapa', 'slug': 'mapa'},
+            {'ref': 12, 'titulo': 'Apartamento Norte'},
+        ])
+        slugs = dict(Inmuebles.objects.filter(ref__gte=10).values_list('ref', 'slug'))
+        self.assertEqual(slugs, {10: 'casa-centro-10', 11: 'mapa-11', 12: 'apartamento-norte'})
+
+        Inmuebles.objects.filter(ref=12).update(slug='Apartamento Norte')
+        Inmuebles.objects.filter(ref=11).update(slug=None)
+        resultado = rellenar_slugs(lote=2)
+        self.assertEqual((resultado.revisados, resultado.cambiados), (4, 2))
+        slugs = dict(Inmuebles.objects.values_list('ref', 'slug'))
+        self.assertEqual(slugs, {1: 'casa-centro', 10: 'casa-centro-10', 11: 'lote-mapa', 12: 'apartamento-norte'})
+
+
+class PivoteCaracteristicasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        ahora = timezone.now()
+        cls.piscina, cls.balcon, cls.vista = (
+            Caracteristica.objects.create(nombre=nombre, created_at=ahora, updated_at=ahora)
+            for nombre in ('Piscina', 'Área balcón', 'Vista')
+        )
+        uno, dos, tres = crear_inmuebles(3)
+        with cls.captureOnCommitCallbacks(execute=True):
+            for inmueble, piscina, balcon, vista in (
+                (uno, 1, '12.5', 'Mar'), (dos, 1, '8', None), (tres, 0, '20', 'Mar'),
+            ):
+                InmuebleCaracteristicas.objects.create(inmueble=inmueble, caracteristica=cls.piscina, valor_booleano=piscina)
+                InmuebleCaracteristicas.objects.create(inmueble=inmueble, caracteristica=cls.balcon, valor_numerico=Decimal(balcon))
+                if vista:
+                    InmuebleCaracteristicas.objects.create(inmueble=inmueble, caracteristica=cls.vista, valor_texto=vista)
+
+    def buscar(self, *condiciones):
+        respuesta = self.client.get(reverse('inmobiliaria:inmuebles_lista'), {'caracteristica': condiciones})
+        self.assertEqual(respuesta.status_code, 200)
+        return [fila['ref'] for fila in respuesta.json()['resultados']]
+
+    def test_filtros_por_caracteristicas(self):
+        self.assertEqual(self.buscar('piscina'), [1, 2])
+        self.assertEqual(self.buscar('piscina', 'area-balcon:gte:10'), [1])
+        self.assertEqual(self.buscar('area-balcon:lte:12.5', 'vista:eq:Mar'), [1])
+        self.assertEqual(self.buscar('area-balcon:eq:20'), [3])
+        for invalida in ('sauna', 'piscina:gte:mucho', 'piscina:mayor:1'):
+            respuesta = self.client.get(reverse('inmobiliaria:inmuebles_lista'), {'caracteristica': invalida})
+            self.assertEqual(respuesta.status_code, 400)
+
+        condiciones = [(self.piscina.pk, 'tiene', ''), (self.balcon.pk, 'gte', Decimal(10))]
+        self.assertEqual(
+            list(filtrar_eav(Inmuebles.objects.all(), condiciones).values_list('ref', flat=True)), [1],
+        )
+
+    def test_mantenimiento_incremental(self):
+        fila = InmuebleCaracteristicas.objects.get(inmueble__ref=3, caracteristica=self.piscina)
+        fila.valor_booleano = 1
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            fila.save()
+            InmuebleCaracteristicas.objects.get(inmueble__ref=2, caracteristica=self.piscina).delete()
+        # Un solo recálculo del pivote (que después sube la versión de las facetas)
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(self.buscar('piscina'), [1, 3])
+
+        incrementales = dict(PivoteCaracteristicas.objects.values_list('inmueble__ref', 'valores'))
+        resultado = reconstruir_pivote()
+        self.assertEqual((resultado.inmuebles, resultado.indices), (3, 2))
+        self.assertEqual(incrementales, dict(PivoteCaracteristicas.objects.values_list('inmueble__ref', 'valores')))
+        with connection.cursor() as cursor:
+            indices = connection.introspection.get_constraints(cursor, 'caracteristicas_pivote')
+        self.assertIn(nombre_indice(self.balcon.pk), indices)
+
+
+class EtiquetasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascotas, cls.vista, cls.remate = (
+            Etiquetas.objects.create(nombre=nombre) for nombre in ('Mascotas', 'Vista', 'Remate')
+        )
+        inmuebles = crear_inmuebles(5)
+        with cls.captureOnCommitCallbacks(execute=True):
+            for indice, etiquetas in enumerate([
+                (cls.mascotas, cls.vista), (cls.mascotas, cls.vista, cls.remate), (cls.mascotas,),
+                (cls.vista,), (cls.mascotas, cls.vista),
+            ]):
+                for etiqueta in etiquetas:
+                    InmueblesEtiquetas.objects.create(inmueble=inmuebles[indice], etiqueta=etiqueta)
+
+    def setUp(self):
+        # Versión nueva del índice: el de otro test ve otra base de datos
+        cache.clear()
+
+    def refs(self, **params):
+        respuesta = self.client.get(reverse('inmobiliaria:inmuebles_lista'), params)
+        self.assertEqual(respuesta.status_code, 200)
+        return [fila['ref'] for fila in respuesta.json()['resultados']], respuesta.json()['siguiente']
+
+    def test_bitmap(self):
+        a, b = Bitmap([5, 70_000, 200_000, 3]), Bitmap([5, 200_000, 9])
+        self.assertEqual(list(a & b), [5, 200_000])
+        self.assertEqual(list(a | b), [3, 5, 9, 70_000, 200_000])
+        self.assertEqual(list(a - b), [3, 70_000])
+        self.assertEqual(list(a.desde(6)), [70_000, 200_000])
+        self.assertEqual(len(a), 4)
+        a.quitar(70_000)
+        self.assertNotIn(70_000, a)
+        self.assertEqual(a.bloques.keys(), {0, 3})
+
+    def test_filtros_y_paginacion(self):
+        self.assertEqual(self.refs(etiqueta=['mascotas', 'vista'], sin_etiqueta='remate')[0], [1, 5])
+        self.assertEqual(self.refs(etiqueta_alguna=['remate', 'vista'], sin_etiqueta='mascotas')[0], [4])
+        self.assertEqual(self.refs(sin_etiqueta='vista')[0], [3])
+        pagina, siguiente = self.refs(etiqueta='mascotas', limite=2)
+        self.assertEqual(pagina, [1, 2])
+        self.assertEqual(self.refs(etiqueta='mascotas', limite=2, cursor=2), ([3, 5], None))
+        self.assertEqual(self.client.get(reverse('inmobiliaria:inmuebles_lista'), {'etiqueta': 'playa'}).status_code, 400)
+
+        facetas = self.client.get(reverse('inmobiliaria:inmuebles_facetas'), {'etiqueta': 'vista'}).json()
+        self.assertEqual(facetas['facetas']['total'], 4)
+
+        # Con demasiados candidatos, las subconsultas dan lo mismo que los JOINs
+        with mock.patch('inmobiliaria.etiquetas.MAXIMO_CANDIDATOS', 1):
+            grupos = ((self.mascotas.pk,), (), (self.remate.pk,))
+            self.assertEqual(
+                sorted(Inmuebles.objects.filter(filtro_etiquetas(*grupos)).values_list('ref', flat=True)),
+                sorted(filtrar_joins(Inmuebles.objects.all(), *grupos).values_list('ref', flat=True)),
+            )
+
+    def test_actualizacion_incremental(self):
+        construido = indice_etiquetas().construido
+        vista = indice_etiquetas().bitmap(self.vista.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            InmueblesEtiquetas.objects.create(inmueble=Inmuebles.objects.get(ref=3), etiqueta=self.vista)
+            InmueblesEtiquetas.objects.filter(inmueble__ref=2, etiqueta=self.remate).get().delete()
+        self.assertEqual(self.refs(etiqueta=['mascotas', 'vista'], sin_etiqueta='remate')[0], [1, 2, 3, 5])
+        # Actualizado sin reconstruirlo, y sin tocar los Bitmaps publicados
+        self.assertEqual(indice_etiquetas().construido, construido)
+        self.assertEqual(list(vista), [1, 2, 4, 5])
+        self.assertEqual(list(indice_etiquetas().bitmap(self.vista.pk)), [1, 2, 3, 4, 5])
+
+
+
+@override_settings(LISTADO_COLUMNAR=True, COLUMNAS_REFRESCO_SEGUNDOS=3600)
+class ColumnasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_inmuebles(4, ciudad_nombre='Montería', precio_venta=Decimal('300000000'), area=120, banos=2)
+        crear_inmuebles(3, inicio=5, ciudad_nombre='Cereté', precio_canon=Decimal('900000'), area=60, banos=1)
+        crear_inmuebles(1, inicio=8, ciudad_nombre='Montería', precio_venta=Decimal('100000000'))
+        Inmuebles.objects.filter(ref=2).update(precio_venta=Decimal('500000000'))
+
+    def setUp(self):
+        # La copia es del proceso: la de otro test ve otra base de datos
+        reconstruir_columnas()
+
+    def refs(self, **params):
+        respuesta = self.client.get(reverse('inmobiliaria:inmuebles_lista'), params)
+        self.assertEqual(respuesta.status_code, 200)
+        return [fila['ref'] for fila in respuesta.json()['resultados']], respuesta.json()['cursor']
+
+    def test_mismos_resultados_que_sql(self):
+        for params in [
+            {'ciudad': 'Montería'},
+            {'precio_min': '200000000', 'banos': 2},
+            {'precio_max': '1000000'},
+            {'area_min': '100', 'area_max': '150'},
+            {'ciudad': 'Sahagún'},
+        ]:
+            columnar = self.refs(**params)[0]
+            with self.settings(LISTADO_COLUMNAR=False):
+                self.assertEqual(columnar, self.refs(**params)[0], params)
+        # La página completa en dos consultas: las filas y sus imágenes
+        with self.assertNumQueries(2):
+            self.assertEqual(self.refs(ciudad='Montería', limite=2), ([1, 2], 2))
+        self.assertEqual(self.refs(ciudad='Montería', limite=2, cursor=2), ([3, 4], 4))
+        self.assertEqual(self.refs(ciudad='Montería', limite=2, cursor=4), ([8], None))
+
+    def test_orden_y_conteo(self):
+        indice = indice_columnar()
+        self.assertEqual(indice.consultar({'ciudad_nombre': 'Montería'}, orden='-precio', limite=3), [2, 1, 3])
+        self.assertEqual(indice.consultar(rangos={'area': (None, 100)}, orden='precio'), [5, 6, 7])
+        self.assertEqual(indice.contar({'banos': 2}, {'precio': (200_000_000, None)}), 4)
+
+    def test_puesta_al_dia(self):
+        copia = indice_columnar().copia
+        despues = timezone.now() + timezone.timedelta(seconds=1)
+        Inmuebles.objects.filter(ref=5).update(ciudad_nombre='Montería', fecha_actualizacion=despues)
+        Inmuebles.objects.filter(ref=1).update(activo=0, fecha_actualizacion=despues)
+        # Relee también las que tienen justo la marca anterior
+        self.assertGreaterEqual(refrescar_columnas().cambios, 2)
+        self.assertEqual(self.refs(ciudad='Montería')[0], [2, 3, 4, 5, 8])
+        # La copia que ya tenía una consulta sigue entera
+        self.assertEqual(copia.consultar({'ciudad_nombre': 'Montería'}), [1, 2, 3, 4, 8])
+
+    def test_escritura_confirmada_con_fecha_anterior_a_la_marca(self):
+        ahora = timezone.now()
+        Inmuebles.objects.filter(ref=1).update(fecha_actualizacion=ahora)
+        refrescar_columnas()
+        # Un lote fechado antes del guardado anterior, pero confirmado después
+        Inmuebles.objects.filter(ref=5).update(
+            ciudad_nombre='Montería', fecha_actualizacion=ahora - timezone.timedelta(seconds=10),
+        )
+        refrescar_columnas()
+        self.assertEqual(self.refs(ciudad='Montería')[0], [1, 2, 3, 4, 5, 8])
+
+    def test_cursor_con_filas_retiradas_despues_de_la_copia(self):
+        # La copia aún no sabe que 2 y 3 se retiraron
+        Inmuebles.objects.filter(ref__in=[2, 3]).update(activo=0)
+        self.assertEqual(self.refs(ciudad='Montería', limite=2), ([1], 2))
+        self.assertEqual(self.refs(ciudad='Montería', limite=2, cursor=2), ([4], 4))
+        self.assertEqual(self.refs(ciudad='Montería', limite=2, cursor=4), ([8], None))
+
+
+class SimilaresTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        venta = TipoConsignacion.objects.create(nombre='Venta')
+        arriendo = TipoConsignacion.objects.create(nombre='Arriendo')
+        rnd = random.Random(3)
+        with cls.captureOnCommitCallbacks(execute=True):
+            for inmueble in crear_inmuebles(30):
+                Inmuebles.objects.filter(pk=inmueble.pk).update(
+                    slug=f'inmueble-{inmueble.ref}',
+                    tipo_consignacion=venta if inmueble.ref <= 20 else arriendo,
+                    precio_venta=Decimal(rnd.randint(100, 900) * 1_000_000),
+                    area=Decimal(rnd.randint(40, 300)),
+                    habitaciones=rnd.randint(1, 5),
+                    estrato=rnd.randint(1, 6),
+                    latitud_num=8.7 + rnd.random() / 10,
+                    longitud_num=-75.9 + rnd.random() / 10,
+                    fecha_actualizacion=timezone.now(),
+                )
+            # Un gemelo del 1: su vecino más cercano
+            Inmuebles.objects.filter(ref=2).update(**Inmuebles.objects.filter(ref=1).values(
+                'precio_venta', 'area', 'habitaciones', 'estrato', 'latitud_num', 'longitud_num',
+            ).get())
+
+    def obtener(self, slug, **params):
+        return self.client.get(reverse('inmobiliaria:inmueble_similares', args=[slug]), params)
+
+    def guardados(self):
+        return dict(SimilaresInmueble.objects.values_list('inmueble__ref', 'refs'))
+
+    def test_precalculados(self):
+        resultado = reconstruir_similares()
+        self.assertEqual(resultado.recalculados, 30)
+        with self.assertNumQueries(3):
+            respuesta = self.obtener('inmueble-1', limite=5)
+        refs = [fila['ref'] for fila in respuesta.json()['resultados']]
+        self.assertEqual(len(refs), 5)
+        self.assertEqual(refs[0], 2)
+        # Sin el propio inmueble ni los de otra consignación
+        self.assertTrue(all(2 <= ref <= 20 for ref in refs))
+        self.assertEqual(len(self.guardados()[25]), 9)
+        self.assertEqual(self.obtener('no-existe').status_code, 404)
+
+    def test_puesta_al_dia_igual_a_reconstruir(self):
+        reconstruir_similares()
+        self.assertEqual(refrescar_similares().recalculados, 0)
+        despues = timezone.now() + timezone.timedelta(seconds=1)
+        Inmuebles.objects.filter(ref=7).update(area=Decimal('45'), habitaciones=1, fecha_actualizacion=despues)
+        Inmuebles.objects.filter(ref=12).update(tipo_consignacion=TipoConsignacion.objects.get(nombre='Arriendo'),
+                                                fecha_actualizacion=despues)
+        Inmuebles.objects.filter(ref=2).update(activo=0)
+        resultado = refrescar_similares()
+        self.assertEqual(resultado.retirados, 1)
+        incremental = self.guardados()
+        self.assertNotIn(2, incremental)
+        reconstruir_similares()
+        self.assertEqual(incremental, self.guardados())
+
+
+class ConexionFalsa:
+    """Conexión de prueba para PoolConexiones"""
+
+    def __init__(self, numero):
+        self.numero = numero
+        self.viva = True
+        self.cerrada = False
+
+    def ping(self):
+        if not self.viva:
+            raise OSError('conexión perdida')
+
+    def close(self):
+        self.cerrada = True
+
+
+class PoolConexionesTests(TestCase):
+
+    def crear_pool(self, **opciones):
+        creadas = []
+
+        def conectar():
+            creadas.append(ConexionFalsa(len(creadas)))
+            return creadas[-1]
+
+        return PoolConexiones(conectar, ConexionFalsa.ping, **opciones), creadas
+
+    def test_reutiliza_y_descarta(self):
+        pool, creadas = self.crear_pool(maximo=2)
+        primera = pool.obtener()
+        pool.devolver(primera)
+        self.assertIs(pool.obtener(), primera)
+        # Si falla el ping se cierra y se abre otra
+        primera.viva = False
+        pool.devolver(primera)
+        segunda = pool.obtener()
+        self.assertIsNot(segunda, primera)
+        self.assertTrue(primera.cerrada)
+        # Tras un error no vuelve al pool
+        pool.devolver(segunda, descartar=True)
+        self.assertTrue(segunda.cerrada)
+        estadisticas = pool.estadisticas()
+        self.assertEqual(
+            (estadisticas['creadas'], estadisticas['reutilizadas'], estadisticas['fallos_ping'],
+             estadisticas['descartadas'], estadisticas['abiertas']),
+            (2, 1, 1, 1, 0),
+        )
+
+    def test_inactividad_y_ping_diferido(self):
+        pool, creadas = self.crear_pool(inactividad=60, ping=5)
+        conexion = pool.obtener()
+        with mock.patch('core.mysql_pool.pool.time.monotonic', return_value=1000):
+            pool.devolver(conexion)
+        # Libre hace poco: sale sin ping aunque esté caída
+        conexion.viva = False
+        with mock.patch('core.mysql_pool.pool.time.monotonic', return_value=1002):
+            self.assertIs(pool.obtener(), conexion)
+            pool.devolver(conexion)
+        with mock.patch('core.mysql_pool.pool.time.monotonic', return_value=1100):
+            nueva = pool.obtener()
+        self.assertTrue(conexion.cerrada)
+        self.assertIsNot(nueva, conexion)
+        self.assertEqual(pool.estadisticas()['expiradas'], 1)
+
+    def test_maximo_y_espera(self):
+        pool, creadas = self.crear_pool(maximo=1, espera=0.05)
+        conexion = pool.obtener()
+        with self.assertRaises(PoolAgotado):
+            pool.obtener()
+        # Otro hilo la devuelve mientras se espera
+        threading.Timer(0.01, pool.devolver, [conexion]).start()
+        pool.espera = 5
+        self.assertIs(pool.obtener(), conexion)
+        estadisticas = pool.estadisticas()
+        self.assertEqual((estadisticas['esperas'], estadisticas['agotado'], len(creadas)), (2, 1, 1))
+
+    def test_estadisticas_solo_staff(self):
+        url = reverse('pool_estadisticas')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', password='clave', is_staff=True))
+        self.assertIn('pools', self.client.get(url).json())
+
+
+@override_settings(
+    DB_REPLICA_ALIAS=['replica_1', 'replica_2'], DB_REPLICA_RUTAS=['/api/'],
+    DB_REPLICA_RETRASO_MAXIMO=5, DB_REPLICA_REVISION_SEGUNDOS=60, DB_REPLICA_PEGAJOSO_SEGUNDOS=30,
+)
+class RouterReplicasTests(SimpleTestCase):
+
+    def setUp(self):
+        invalidar_revision()
+        self.addCleanup(invalidar_revision)
+
+    def peticion(self, metodo='get', ruta='/api/inmuebles/', escribir=False, **extra):
+        """(bases elegidas por el router dentro de la vista, respuesta)"""
+        router, elegidas = RouterReplicas(), {}
+
+        def vista(request):
+            elegidas['lectura'] = router.db_for_read(Inmuebles)
+            if escribir:
+                elegidas['escritura'] = router.db_for_write(Inmuebles)
+                elegidas['despues'] = router.db_for_read(Inmuebles)
+            return HttpResponse()
+
+        peticion = getattr(RequestFactory(), metodo)(ruta, **extra)
+        return elegidas, ReplicasMiddleware(vista)(peticion)
+
+    def test_lecturas_en_replicas_al_dia(self):
+        # replica_2 lleva 60 s de retraso: queda fuera
+        with mock.patch('core.replicas.retraso_replica', side_effect=[1.0, 60.0]) as retraso, \
+                self.assertLogs('core.replicas', 'WARNING'):
+            elegidas, respuesta = self.peticion(escribir=True)
+            self.assertEqual(self.peticion()[0]['lectura'], 'replica_1')
+        self.assertEqual(retraso.call_count, 2)
+        # Después de escribir, la misma petición y las del mismo navegador leen de la primaria
+        self.assertEqual(elegidas, {'lectura': 'replica_1', 'escritura': 'default', 'despues': None})
+        cookie = respuesta.cookies[COOKIE]
+        self.assertEqual(cookie['max-age'], 30)
+        self.assertIsNone(self.peticion(HTTP_COOKIE=f'{COOKIE}={cookie.value}')[0]['lectura'])
+        self.assertEqual(self.peticion(HTTP_COOKIE=f'{COOKIE}=1')[0]['lectura'], 'replica_1')
+        # El admin, los POST y lo que corre fuera de una petición, de la primaria
+        self.assertIsNone(self.peticion(ruta='/admin/')[0]['lectura'])
+        self.assertIsNone(self.peticion(metodo='post')[0]['lectura'])
+        self.assertIsNone(RouterReplicas().db_for_read(Inmuebles))
+
+    def test_sin_replicas_disponibles(self):
+        with mock.patch('core.replicas.retraso_replica', side_effect=OperationalError('sin conexión')), \
+                self.assertLogs('core.replicas', 'WARNING'):
+            self.assertIsNone(self.peticion()[0]['lectura'])
+
+    def test_un_solo_hilo_mide(self):
+        with mock.patch('core.replicas.retraso_replica', return_value=1.0):
+            self.assertEqual(replicas_disponibles(), ['replica_1', 'replica_2'])
+        invalidar_revision()
+        midiendo, seguir = threading.Event(), threading.Event()
+
+        def lenta(alias):
+            midiendo.set()
+            seguir.wait(5)
+            return 60.0
+
+        resultado = []
+        with mock.patch('core.replicas.retraso_replica', side_effect=lenta) as retraso, \
+                self.assertLogs('core.replicas', 'WARNING'):
+            hilo = threading.Thread(target=lambda: resultado.append(replicas_disponibles()))
+            hilo.start()
+            self.assertTrue(midiendo.wait(5))
+            # Mientras otro hilo mide, se usa la revisión anterior sin esperarlo
+            self.assertEqual(replicas_disponibles(), ['replica_1', 'replica_2'])
+            seguir.set()
+            hilo.join(5)
+        self.assertEqual(retraso.call_count, 2)
+        self.assertEqual(resultado, [[]])
+        self.assertEqual(replicas_disponibles(), [])
+
+
+class RetrasoReplicasTests(TestCase):
+
+    def test_retraso(self):
+        ahora = timezone.now()
+        crear_inmuebles(2)
+        Inmuebles.objects.filter(ref=1).update(fecha_actualizacion=ahora - timezone.timedelta(seconds=100))
+        Inmuebles.objects.filter(ref=2).update(fecha_actualizacion=ahora - timezone.timedelta(seconds=40))
+        # La réplica tiene hasta hace 200 s: le falta la escritura de hace 100
+        self.assertAlmostEqual(retraso_desde(ahora - timezone.timedelta(seconds=200)), 100, delta=5)
+        self.assertAlmostEqual(retraso_desde(ahora - timezone.timedelta(seconds=100)), 40, delta=5)
+        self.assertEqual(retraso_replica('default'), 0)
+
+
+class PresupuestoConsultasTests(AdminTestCase):
+
+    def test_admin_dentro_del_presupuesto(self):
+        inmueble = crear_inmuebles(25)[0]
+        for modelo in ('inmuebles', 'imagenes', 'assesor', 'city', 'barrios', 'caracteristica', 'etiquetas'):
+            self.assertPresupuestoConsultas(reverse(f'admin:inmobiliaria_{modelo}_changelist'))
+        self.assertPresupuestoConsultas(reverse('admin:inmobiliaria_inmuebles_change', args=[inmueble.pk]))
+        imagen = Imagenes.objects.filter(inmueble=inmueble).first()
+        self.assertPresupuestoConsultas(reverse('admin:inmobiliaria_imagenes_change', args=[imagen.pk]))
+
+    def test_presupuesto_superado_falla_con_las_lentas(self):
+        with self.assertRaisesMessage(AssertionError, 'supera su presupuesto') as contexto:
+            self.assertPresupuestoConsultas(reverse('admin:inmobiliaria_inmuebles_changelist'), consultas=1)
+        self.assertIn('[default] SELECT', str(contexto.exception))
+
+    def test_medir_consultas(self):
+        crear_inmuebles(2)
+        with medir_consultas(lentas=2) as medicion:
+            list(Inmuebles.objects.all())
+            list(Imagenes.objects.all())
+            Inmuebles.objects.count()
+        self.assertEqual(medicion.consultas, 3)
+        self.assertGreater(medicion.segundos, 0)
+        self.assertEqual(len(medicion.lentas), 2)
+        self.assertGreaterEqual(medicion.lentas[0][0], medicion.lentas[1][0])
+
+    def test_server_timing_solo_staff(self):
+        crear_inmuebles(2)
+        url = reverse('admin:inmobiliaria_inmuebles_changelist')
+        cabecera = self.client.get(url)['Server-Timing']
+        self.assertRegex(cabecera, r'^db;dur=[\d.]+;desc="\d+ consultas", total;dur=[\d.]+, sql1;dur=')
+        # La API no carga el usuario: sin cabecera y sin consultas de más
+        with self.assertNumQueries(2):
+            self.assertNotIn('Server-Timing', self.client.get('/api/inmuebles/'))
+        self.client.logout()
+        User.objects.create_user('cliente', password='clave')
+        self.client.login(username='cliente', password='clave')
+        self.assertNotIn('Server-Timing', self.client.get(url, follow=True))
+
+    @override_settings(CONSULTAS_PRESUPUESTOS=[(r'^/api/', {'consultas': 1})])
+    def test_registra_peticiones_fuera_del_presupuesto(self):
+        crear_inmuebles(2)
+        with self.assertLogs('core.consultas', 'WARNING') as registro:
+            self.client.get('/api/inmuebles/')
+        self.assertIn('GET /api/inmuebles/ supera su presupuesto', registro.output[0])
+        with self.assertNoLogs('core.consultas', 'WARNING'):
+            self.client.get('/admin/')
@@ -0,0 +1,47 @@
+"""
+Trabajo que las señales juntan durante una transacción y hacen una sola vez
+al confirmarla (las celdas del mapa, el pivote de características).
+"""
+import weakref
+
+from django.db import transaction
+
+
+class _Pendientes:
+    """Callback de on_commit con los valores acumulados en la transacción"""
+
+    def __init__(self, funcion, registrados, clave):
+        self.funcion = funcion
+        self.valores = set()
+        self.ejecutado = False
+        self.registrados = registrados
+        self.clave = clave
+
+    def __call__(self):
+        self.ejecutado = True
+        if self.registrados.get(self.clave) is self:
+            del self.registrados[self.clave]
+        self.funcion(self.valores)
+
+
+def al_confirmar(funcion, valores):
+    """
+    Llama funcion(valores) al confirmar la transacción en curso (o ya, si no
+    hay una), juntando los valores de todas las llamadas de la transacción.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        funcion(set(valores))
+        return
+    # Un callback por función y savepoint: uno de un bloque exterior que no se
+    # confirma (el de setUpTestData en las pruebas) se llevaría los valores.
+    # None es un atomic(savepoint=False), que no descarta callbacks aparte.
+    clave = (funcion, tuple(sid for sid in connection.savepoint_ids if sid is not None))
+    # Referencias débiles: si la transacción o el savepoint se deshacen, Django
+    # suelta el callback y la entrada desaparece con él
+    registrados = connection.__dict__.setdefault('pendientes_al_confirmar', weakref.WeakValueDictionary())
+    pendientes = registrados.get(clave)
+    if pendientes is None or pendientes.ejecutado:
+        pendientes = registrados[clave] = _Pendientes(funcion, registrados, clave)
+        transaction.on_commit(pendientes)
+    pendientes.valores.update(valores)
@@ -0,0 +1,17 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'inmobiliaria'
+
+urlpatterns = [
+    path('inmuebles/', views.inmuebles_lista, name='inmuebles_lista'),
+    path('inmuebles/cerca/', views.inmuebles_cerca, name='inmuebles_cerca'),
+    path('inmuebles/mapa/', views.inmuebles_mapa, name='inmuebles_mapa'),
+    path('inmuebles/facetas/', views.inmuebles_facetas, name='inmuebles_facetas'),
+    path('inmuebles/facetas/estadisticas/', views.facetas_estadisticas, name='facetas_estadisticas'),
+    path('inmuebles/detalle/estadisticas/', views.detalle_estadisticas, name='detalle_estadisticas'),
+    # Al final: cualquier otro segmento es un slug (slugs.RESERVADOS)
+    path('inmuebles/<slug:slug>/', views.inmueble_detalle, name='inmueble_detalle'),
+    path('inmuebles/<slug:slug>/similares/', views.inmueble_similares, name='inmueble_similares'),
+]
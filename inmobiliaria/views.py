@@ -1,3 +1,139 @@
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from .api import (
+    ParametroInvalido,
+    cercanos,
+    facetas_busqueda,
+    fila_detalle,
+    grupos_mapa,
+    pagina_listado,
+    serializar_detalle,
+    similares,
+    version_detalle,
+)
+from .cache_detalle import estadisticas_detalle, json_detalle
+from .facets import estadisticas_facetas
+
+
+@require_GET
+def inmuebles_lista(request):
+    """
+    Inmuebles activos, paginados por cursor (ref).
+
+    Filtros: ciudad, barrio, tipo_inmueble, tipo_consignacion (por nombre),
+    precio_min, precio_max, habitaciones, estrato y caja
+    (min_lat,min_lng,max_lat,max_lng). Paginación: limite y cursor (el
+    `siguiente` de la página anterior).
+    """
+    try:
+        resultados, siguiente = pagina_listado(request.GET)
+    except ParametroInvalido as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    url_siguiente = None
+    if siguiente is not None:
+        params = request.GET.copy()
+        params['cursor'] = siguiente
+        url_siguiente = f'{request.path}?{params.urlencode()}'
+    return JsonResponse({
+        'resultados': resultados,
+        'siguiente': url_siguiente,
+        'cursor': siguiente,
+    })
+
+
+@require_GET
+def inmuebles_cerca(request):
+    """
+    Inmuebles a menos de radio_km (2 por defecto) de lat, lng, del más
+    cercano al más lejano, con `distancia_km`. Acepta los filtros del listado.
+    """
+    try:
+        resultados = cercanos(request.GET)
+    except ParametroInvalido as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return JsonResponse({'resultados': resultados})
+
+
+@require_GET
+def inmuebles_mapa(request):
+    """
+    Marcadores agrupados para el mapa: caja (min_lat,min_lng,max_lat,max_lng)
+    y zoom. Cada grupo trae total, centroide y precio mínimo y máximo de
+    venta y de canon.
+    """
+    try:
+        datos = grupos_mapa(request.GET)
+    except ParametroInvalido as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return JsonResponse(datos)
+
+
+@require_GET
+def inmuebles_facetas(request):
+    """
+    Conteos por ciudad, barrio, tipo, consignación, estrato, habitaciones y
+    rango de precio para los mismos filtros del listado.
+    """
+    try:
+        facetas, acierto, segundos = facetas_busqueda(request.GET)
+    except ParametroInvalido as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    respuesta = JsonResponse({
+        'facetas': facetas,
+        'cache': {'acierto': acierto, 'calculo_ms': round(segundos * 1000, 2)},
+    })
+    respuesta['X-Cache'] = 'HIT' if acierto else 'MISS'
+    return respuesta
+
+
+@require_GET
+@staff_member_required
+def facetas_estadisticas(request):
+    """Proporción de aciertos de la caché de facetas y tiempo medio de cálculo (solo staff)"""
+    return JsonResponse(estadisticas_facetas())
+
+
+@require_GET
+def inmueble_detalle(request, slug):
+    """
+    Un inmueble activo con sus imágenes en orden, características y
+    etiquetas. Con If-None-Match o If-Modified-Since vigentes responde 304
+    sin armar el JSON (una sola consulta); si no, el JSON sale de la caché
+    del detalle (cache_detalle.py) o se arma y se guarda.
+    """
+    fila = fila_detalle(slug)
+    if fila is None:
+        return JsonResponse({'error': 'Inmueble no encontrado'}, status=404)
+    etag, modificado = version_detalle(fila)
+    respuesta = get_conditional_response(request, etag=etag, last_modified=modificado)
+    if respuesta is None:
+        contenido, acierto = json_detalle(fila, etag, serializar_detalle)
+        respuesta = HttpResponse(contenido, content_type='application/json')
+        respuesta['X-Cache'] = 'HIT' if acierto else 'MISS'
+    respuesta['ETag'] = etag
+    if modificado is not None:
+        respuesta['Last-Modified'] = http_date(modificado)
+    # El navegador guarda la respuesta pero la revalida siempre con el ETag
+    patch_cache_control(respuesta, no_cache=True)
+    return respuesta
+
+
+@require_GET
+def inmueble_similares(request, slug):
+    """Hasta `limite` inmuebles parecidos al del slug, del más parecido al menos"""
+    resultados = similares(slug, request.GET)
+    if resultados is None:
+        return JsonResponse({'error': 'Inmueble no encontrado'}, status=404)
+    return JsonResponse({'resultados': resultados})
+
+
+@require_GET
+@staff_member_required
+def detalle_estadisticas(request):
+    """Aciertos y fallos de la caché del detalle de inmuebles (solo staff)"""
+    return JsonResponse(estadisticas_detalle())